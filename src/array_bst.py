@@ -0,0 +1,422 @@
+# -*- coding: utf-8 -*-
+"""File implements an array backed binary search tree for numeric keys.
+
+Instead of one Python object per node, every node is an index into a set
+of parallel arrays (key, left, right, parent, depth), so a 50M key tree is
+a handful of flat buffers rather than 50M objects for the garbage
+collector to track.  Freed slots are chained into a free list through the
+left array and reused by later inserts.  Balancing is the same AVL scheme
+as bst.BinarySearchTree."""
+from __future__ import unicode_literals
+from array import array
+from collections import deque
+import struct
+import sys
+
+from bst import INT64_TYPECODE, _array_bytes, _array_extend
+
+NIL = -1
+MAGIC = b'ABST'
+HEADER = struct.Struct(str('<4s2sqqqq'))
+
+
+class ArrayBinarySearchTree(object):
+    """ArrayBinarySearchTree implements a self-balancing Binary Search Tree
+    over int or float keys, stored in parallel arrays."""
+
+    def __init__(self, root=None, typecode='d'):
+        """Create an instance of our array backed Binary Search Tree w/
+        supplied input, or an empty tree.  typecode is the array typecode
+        used for the keys, 'd' for floats or 'q' for 64 bit ints (kept in
+        an 'l' array on py27, which has no 'q')."""
+        self.typecode = typecode
+        if typecode == 'q':
+            if INT64_TYPECODE is None:
+                raise ValueError('This Python has no 64 bit int arrays.')
+            typecode = INT64_TYPECODE
+        self._keys = array(str(typecode))
+        self._left = array(str('i'))
+        self._right = array(str('i'))
+        self._parent = array(str('i'))
+        self._depth = array(str('b'))
+        self._free = NIL
+        self.root = NIL
+        self.length = 0
+        if root is not None:
+            self.insert(root)
+
+    def _new_node(self, val, parent):
+        """Stores val in a free slot, or a new one at the end of the arrays,
+        and returns its index."""
+        index = self._free
+        if index == NIL:
+            self._keys.append(val)
+            self._left.append(NIL)
+            self._right.append(NIL)
+            self._parent.append(parent)
+            self._depth.append(1)
+            return len(self._keys) - 1
+        self._free = self._left[index]
+        self._keys[index] = val
+        self._left[index] = NIL
+        self._right[index] = NIL
+        self._parent[index] = parent
+        self._depth[index] = 1
+        return index
+
+    def insert(self, val):
+        """Inserts a value into the BST.  If the value is already in the BST
+        it will be ignored."""
+        try:
+            if self.root == NIL:
+                self.root = self._new_node(val, NIL)
+                self.length = 1
+                return
+            keys = self._keys
+            left = self._left
+            right = self._right
+            current = self.root
+            while True:
+                key = keys[current]
+                if val == key:
+                    return
+                if val < key:
+                    if left[current] == NIL:
+                        left[current] = self._new_node(val, current)
+                        break
+                    current = left[current]
+                else:
+                    if right[current] == NIL:
+                        right[current] = self._new_node(val, current)
+                        break
+                    current = right[current]
+        except TypeError:
+            raise(TypeError('Insert values must be numbers'))
+        self.length += 1
+        self._retrace(current)
+
+    def contains(self, val):
+        """Will return True if val is in the BST, or False if it's not."""
+        return self.find_node(val) is not None
+
+    def find_node(self, val):
+        """Will return the index of the node holding val, or None if it
+        isn't in the BST."""
+        keys = self._keys
+        left = self._left
+        right = self._right
+        current = self.root
+        try:
+            while current != NIL:
+                key = keys[current]
+                if val == key:
+                    return current
+                current = left[current] if val < key else right[current]
+        except TypeError:
+            raise(TypeError('Node values must be numbers'))
+        return None
+
+    def size(self):
+        """Will return the integer size of the BST, zero if BST is empty."""
+        return self.length
+
+    def __len__(self):
+        """Returns size of tree using builtin length method."""
+        return self.length
+
+    def depth(self, starting_point=None):
+        """Will return the depth of the tree by counting "levels".  An empty
+        BST will return 0."""
+        if starting_point is None:
+            starting_point = self.root
+        return self._node_depth(starting_point)
+
+    def balance(self, starting_point=None):
+        """Will return an integer that's positive or negative that represents
+        the difference between depth on both sides from the starting point."""
+        if starting_point is None:
+            starting_point = self.root
+        if starting_point == NIL:
+            return 0
+        return (self._node_depth(self._left[starting_point]) -
+                self._node_depth(self._right[starting_point]))
+
+    def in_order(self, starting_point=None, reverse=False):
+        """
+        This function will return a generator that will return the values
+        of the tree using in-order traversal, one value at a time.  With
+        reverse=True the values come out largest first.
+        """
+        if self.length == 0:
+            raise IndexError("You can't in-order traverse an empty Tree.")
+        if starting_point is None:
+            starting_point = self.root
+        return self._in_order(starting_point, reverse)
+
+    def _in_order(self, starting_point, reverse):
+        """Helper generator to in_order, walks the arrays with its own
+        stack."""
+        keys = self._keys
+        first, second = self._left, self._right
+        if reverse:
+            first, second = second, first
+        stack = []
+        current = starting_point
+        while stack or current != NIL:
+            if current != NIL:
+                stack.append(current)
+                current = first[current]
+            else:
+                current = stack.pop()
+                yield keys[current]
+                current = second[current]
+
+    def pre_order(self, starting_point=None):
+        """
+        This function will return a generator that will return the values
+        of the tree using pre_order traversal, one value at a time.
+        """
+        if self.length == 0:
+            raise IndexError("You can't pre-order traverse an empty Tree.")
+        if starting_point is None:
+            starting_point = self.root
+        return self._pre_order(starting_point)
+
+    def _pre_order(self, starting_point):
+        """Helper generator to pre_order."""
+        keys = self._keys
+        left = self._left
+        right = self._right
+        stack = [starting_point]
+        while stack:
+            current = stack.pop()
+            yield keys[current]
+            if right[current] != NIL:
+                stack.append(right[current])
+            if left[current] != NIL:
+                stack.append(left[current])
+
+    def post_order(self, starting_point=None):
+        """
+        This function will return a generator that will return the values
+        of the tree using post_order traversal, one value at a time.
+        """
+        if self.length == 0:
+            raise IndexError("You can't post-order traverse an empty Tree.")
+        if starting_point is None:
+            starting_point = self.root
+        return self._post_order(starting_point)
+
+    def _post_order(self, starting_point):
+        """Helper generator to post_order."""
+        keys = self._keys
+        left = self._left
+        right = self._right
+        stack = []
+        current = starting_point
+        last = NIL
+        while stack or current != NIL:
+            if current != NIL:
+                stack.append(current)
+                current = left[current]
+            else:
+                peek = stack[-1]
+                if right[peek] != NIL and right[peek] != last:
+                    current = right[peek]
+                else:
+                    last = stack.pop()
+                    yield keys[last]
+
+    def breadth_first(self, starting_point=None):
+        """
+        This method is a generator that will output breadth first
+        traversal of the tree, one value at a time.
+        """
+        if self.length == 0:
+            raise IndexError("You can't breadth-first traverse an empty Tree.")
+        if starting_point is None:
+            starting_point = self.root
+        keys = self._keys
+        left = self._left
+        right = self._right
+        unvisited = deque([starting_point])
+        while unvisited:
+            current = unvisited.popleft()
+            if left[current] != NIL:
+                unvisited.append(left[current])
+            if right[current] != NIL:
+                unvisited.append(right[current])
+            yield keys[current]
+
+    def delete(self, val):
+        """Removes the node with val from the Tree, returns None.  Its slot
+        goes onto the free list for the next insert to reuse."""
+        delete_me = self.find_node(val)
+        if delete_me is None:
+            return
+        left = self._left
+        right = self._right
+        if left[delete_me] != NIL and right[delete_me] != NIL:
+            successor = right[delete_me]
+            while left[successor] != NIL:
+                successor = left[successor]
+            self._keys[delete_me] = self._keys[successor]
+            delete_me = successor
+        if left[delete_me] != NIL:
+            child = left[delete_me]
+        else:
+            child = right[delete_me]
+        parent = self._parent[delete_me]
+        self._replace_child(parent, delete_me, child)
+        left[delete_me] = self._free
+        right[delete_me] = NIL
+        self._parent[delete_me] = NIL
+        self._free = delete_me
+        self.length -= 1
+        self._retrace(parent)
+
+    def _node_depth(self, index):
+        """Returns the depth stored for index, 0 for NIL."""
+        return self._depth[index] if index != NIL else 0
+
+    def _update_node(self, index):
+        """Recomputes the depth of a single node from its children."""
+        self._depth[index] = max(self._node_depth(self._left[index]),
+                                 self._node_depth(self._right[index])) + 1
+
+    def _replace_child(self, parent, old, new):
+        """Points parent's link to old (or the root) at new instead."""
+        if new != NIL:
+            self._parent[new] = parent
+        if parent == NIL:
+            self.root = new
+        elif self._left[parent] == old:
+            self._left[parent] = new
+        else:
+            self._right[parent] = new
+
+    def _left_rotation(self, a):
+        """Performs a left rotation around a, returns the new subtree
+        root."""
+        b = self._right[a]
+        w = self._left[b]
+        self._right[a] = w
+        if w != NIL:
+            self._parent[w] = a
+        self._replace_child(self._parent[a], a, b)
+        self._left[b] = a
+        self._parent[a] = b
+        self._update_node(a)
+        self._update_node(b)
+        return b
+
+    def _right_rotation(self, a):
+        """Performs a right rotation around a, returns the new subtree
+        root."""
+        b = self._left[a]
+        w = self._right[b]
+        self._left[a] = w
+        if w != NIL:
+            self._parent[w] = a
+        self._replace_child(self._parent[a], a, b)
+        self._right[b] = a
+        self._parent[a] = b
+        self._update_node(a)
+        self._update_node(b)
+        return b
+
+    def _retrace(self, current):
+        """Walks from current up to the root after an insert or delete,
+        refreshing depths and rotating any node out of balance.  Stops as
+        soon as a subtree comes out the same depth as before."""
+        while current != NIL:
+            old_depth = self._depth[current]
+            self._update_node(current)
+            bal = self.balance(current)
+            if bal > 1:
+                if self.balance(self._left[current]) < 0:
+                    self._left_rotation(self._left[current])
+                current = self._right_rotation(current)
+            elif bal < -1:
+                if self.balance(self._right[current]) > 0:
+                    self._right_rotation(self._right[current])
+                current = self._left_rotation(current)
+            if self._depth[current] == old_depth:
+                return
+            current = self._parent[current]
+
+    def dump(self, fileobj):
+        """Writes the tree to a binary file object as a small header
+        followed by the raw array buffers."""
+        byteorder = b'<' if sys.byteorder == 'little' else b'>'
+        fileobj.write(HEADER.pack(
+            MAGIC, self.typecode.encode('ascii') + byteorder,
+            self.root, self._free, self.length, len(self._keys)))
+        for buf in (self._keys, self._left, self._right, self._parent,
+                    self._depth):
+            fileobj.write(_array_bytes(buf))
+
+    @classmethod
+    def load(cls, fileobj):
+        """Reads a tree written by dump back from a binary file object,
+        without re-inserting anything."""
+        header = fileobj.read(HEADER.size)
+        if len(header) != HEADER.size:
+            raise ValueError('Not an ArrayBinarySearchTree dump.')
+        magic, codes, root, free, length, slots = HEADER.unpack(header)
+        if magic != MAGIC:
+            raise ValueError('Not an ArrayBinarySearchTree dump.')
+        tree = cls(typecode=codes[:1].decode('ascii'))
+        swap = codes[1:] != (b'<' if sys.byteorder == 'little' else b'>')
+        for buf in (tree._keys, tree._left, tree._right, tree._parent,
+                    tree._depth):
+            data = fileobj.read(slots * buf.itemsize)
+            if len(data) != slots * buf.itemsize:
+                raise ValueError('ArrayBinarySearchTree dump is truncated.')
+            _array_extend(buf, data)
+            if swap:
+                buf.byteswap()
+        tree.root = root
+        tree._free = free
+        tree.length = length
+        return tree
+
+
+if __name__ == '__main__':
+    import gc
+    import timeit
+    from bst import BinarySearchTree
+
+    print("")
+    print("Array Backed Binary Search Tree")
+    print("")
+    print("Memory and garbage collector load compared to bst.BinarySearchTree")
+    print("for the same keys.")
+    print("")
+    n = 10 ** 5
+    keys = [float(i) for i in range(n)]
+    for name, cls in (('BinarySearchTree', BinarySearchTree),
+                      ('ArrayBinarySearchTree', ArrayBinarySearchTree)):
+        gc.collect()
+        before = len(gc.get_objects())
+        tree = cls()
+        result = timeit.timeit(
+            'for key in keys: tree.insert(key)',
+            setup='from __main__ import keys, tree',
+            number=1)
+        gc.collect()
+        tracked = len(gc.get_objects()) - before
+        print(name)
+        print("Input: {} sequential floats".format(n))
+        print("Total insert time: ", result)
+        print("GC tracked objects added: ", tracked)
+        if cls is ArrayBinarySearchTree:
+            buffers = (tree._keys, tree._left, tree._right, tree._parent,
+                       tree._depth)
+            size = sum(buf.itemsize * len(buf) for buf in buffers)
+        else:
+            size = sum(sys.getsizeof(node)
+                       for node in tree.root._in_order())
+        print("Bytes per key, excluding the key objects: ", size / float(n))
+        print("")
+        del tree
@@ -0,0 +1,366 @@
+# -*- coding: utf-8 -*-
+"""File implements other balancing schemes behind the BinarySearchTree API.
+
+bst.BinarySearchTree balances itself as an AVL tree.  The trees here keep
+exactly the same methods and only change what happens after a node is
+linked in or unlinked:
+
+- RedBlackTree makes at most two rotations per insert and three per
+  delete, which suits write heavy loads.
+- Treap gives every node a random priority and keeps them heap ordered,
+  which is simple and cheap to maintain.
+- ScapegoatTree keeps no balancing data of its own at all.  It rebuilds a
+  subtree outright when an insert lands too deep, and the whole tree when
+  enough deletes have happened.
+
+All three keep node depths and sizes, so depth, balance, rank and select
+work as usual.  split, join and the set operations rely on AVL joins, so
+here they fall back to rebuilding each joined subtree, which is linear
+rather than logarithmic."""
+from __future__ import unicode_literals
+import math
+import random
+
+from bst import BinarySearchTree
+
+RED = True
+BLACK = False
+
+
+def _is_red(node):
+    """Returns True if node is a red node, None counts as black."""
+    return node is not None and node._tag is RED
+
+
+class _RebuildingTree(BinarySearchTree):
+    """Shared pieces of the non-AVL trees."""
+
+    def insert_many(self, iterable):
+        """Inserts every value of iterable, ignoring any already in the
+        tree.  Joins are linear here, so rather than merging, the batch is
+        sorted and inserted one value at a time."""
+        self._check_writable()
+        for _, val in self._sorted_pairs(iterable):
+            self.insert(val)
+
+    def _join(self, left, middle, right):
+        """Joins detached subtrees left and right around detached node
+        middle by relinking all of their nodes into a balanced subtree,
+        O(n).  Nodes shared with another tree are copied first."""
+        nodes = [self._own(node) for node in left._in_order()] \
+            if left is not None else []
+        nodes.append(middle)
+        if right is not None:
+            nodes.extend(self._own(node) for node in right._in_order())
+        root = self._link_balanced(nodes, 0, len(nodes))
+        self._rebalance_built(root)
+        return root
+
+
+class RedBlackTree(_RebuildingTree):
+    """RedBlackTree implements a Binary Search Tree balanced with the
+    red-black colouring rules, stored in each node's _tag."""
+
+    def _after_insert(self, node):
+        """Colours the new leaf red and repairs any red node with a red
+        parent by recolouring up the tree, then at most two rotations."""
+        node._tag = RED
+        current = node
+        while current is not self.root and _is_red(current._parent):
+            parent = current._parent
+            grandparent = parent._parent
+            if parent is grandparent._left:
+                uncle = grandparent._right
+                if _is_red(uncle):
+                    uncle = self._thaw(uncle, grandparent)
+                    parent._tag = uncle._tag = BLACK
+                    grandparent._tag = RED
+                    current = grandparent
+                    continue
+                if current is parent._right:
+                    self._left_rotation(parent)
+                    current, parent = parent, current
+                parent._tag = BLACK
+                grandparent._tag = RED
+                self._right_rotation(grandparent)
+            else:
+                uncle = grandparent._left
+                if _is_red(uncle):
+                    uncle = self._thaw(uncle, grandparent)
+                    parent._tag = uncle._tag = BLACK
+                    grandparent._tag = RED
+                    current = grandparent
+                    continue
+                if current is parent._left:
+                    self._right_rotation(parent)
+                    current, parent = parent, current
+                parent._tag = BLACK
+                grandparent._tag = RED
+                self._left_rotation(grandparent)
+        self.root._tag = BLACK
+        self._refresh_path(node)
+
+    def _after_remove(self, parent, child, removed):
+        """Removing a black node leaves one path a black short, so push
+        the shortfall up the tree until a red node or a rotation can
+        absorb it."""
+        start = parent
+        if child is not None:
+            child = self._thaw(child, parent)
+        if removed._tag is not RED:
+            self._fix_double_black(child, parent)
+        self._refresh_path(start)
+
+    def _fix_double_black(self, current, parent):
+        """Helper method to _after_remove, the classic delete fix-up.  Any
+        sibling or nephew it recolours or rotates is thawed first."""
+        while current is not self.root and not _is_red(current):
+            if current is parent._left:
+                sibling = self._thaw(parent._right, parent)
+                if _is_red(sibling):
+                    sibling._tag = BLACK
+                    parent._tag = RED
+                    self._left_rotation(parent)
+                    sibling = self._thaw(parent._right, parent)
+                if not _is_red(sibling._left) and \
+                        not _is_red(sibling._right):
+                    sibling._tag = RED
+                    current = parent
+                    parent = current._parent
+                    continue
+                if not _is_red(sibling._right):
+                    nephew = self._thaw(sibling._left, sibling)
+                    nephew._tag = BLACK
+                    sibling._tag = RED
+                    self._right_rotation(sibling)
+                    sibling = nephew
+                nephew = self._thaw(sibling._right, sibling)
+                sibling._tag = parent._tag
+                parent._tag = BLACK
+                nephew._tag = BLACK
+                self._left_rotation(parent)
+            else:
+                sibling = self._thaw(parent._left, parent)
+                if _is_red(sibling):
+                    sibling._tag = BLACK
+                    parent._tag = RED
+                    self._right_rotation(parent)
+                    sibling = self._thaw(parent._left, parent)
+                if not _is_red(sibling._left) and \
+                        not _is_red(sibling._right):
+                    sibling._tag = RED
+                    current = parent
+                    parent = current._parent
+                    continue
+                if not _is_red(sibling._left):
+                    nephew = self._thaw(sibling._right, sibling)
+                    nephew._tag = BLACK
+                    sibling._tag = RED
+                    self._left_rotation(sibling)
+                    sibling = nephew
+                nephew = self._thaw(sibling._left, sibling)
+                sibling._tag = parent._tag
+                parent._tag = BLACK
+                nephew._tag = BLACK
+                self._right_rotation(parent)
+            current = self.root
+        if current is not None:
+            current._tag = BLACK
+
+    def _rebalance_built(self, root):
+        """Colours a subtree built by _link_balanced: its leaves are all on
+        the bottom two levels, so the bottom level goes red when it isn't
+        the only one and everything else black."""
+        if root is None:
+            return
+        level = [root]
+        while level:
+            next_level = []
+            for node in level:
+                node._tag = BLACK
+                if node._left is not None:
+                    next_level.append(node._left)
+                if node._right is not None:
+                    next_level.append(node._right)
+            if not next_level and level[0] is not root:
+                for node in level:
+                    node._tag = RED
+            level = next_level
+
+    def _wrap_root(self, root):
+        """Returns a new tree around a detached subtree root, see
+        BinarySearchTree._wrap_root.  A subtree of a red-black tree keeps
+        equal black heights, so blackening its root makes it a valid tree
+        on its own."""
+        tree = super(RedBlackTree, self)._wrap_root(root)
+        if root is not None and root._tag is not BLACK:
+            tree._thaw(root, None)._tag = BLACK
+        return tree
+
+
+class Treap(_RebuildingTree):
+    """Treap implements a Binary Search Tree whose nodes also carry random
+    priorities, kept in max-heap order, stored in each node's _tag."""
+
+    def _after_insert(self, node):
+        """Gives the new leaf a random priority and rotates it up past any
+        parent with a lower one."""
+        node._tag = random.random()
+        parent = node._parent
+        while parent is not None and parent._tag < node._tag:
+            if node is parent._left:
+                self._right_rotation(parent)
+            else:
+                self._left_rotation(parent)
+            parent = node._parent
+        self._refresh_path(node)
+
+    def _after_remove(self, parent, child, removed):
+        """The unlinked node had at most one child, whose priorities are
+        all lower than parent's, so splicing kept the heap order."""
+        self._refresh_path(parent)
+
+    def _rebalance_built(self, root):
+        """Hands a subtree built by _link_balanced fresh random priorities,
+        largest first in breadth-first order so every parent outranks its
+        children."""
+        if root is None:
+            return
+        priorities = sorted((random.random() for _ in range(root.size)),
+                            reverse=True)
+        level = [root]
+        index = 0
+        while level:
+            next_level = []
+            for node in level:
+                node._tag = priorities[index]
+                index += 1
+                if node._left is not None:
+                    next_level.append(node._left)
+                if node._right is not None:
+                    next_level.append(node._right)
+            level = next_level
+
+
+class ScapegoatTree(_RebuildingTree):
+    """ScapegoatTree implements a Binary Search Tree kept within
+    log base 1/alpha of the number of values deep by rebuilding
+    subtrees.  alpha must be between 0.5 and 1."""
+
+    def __init__(self, root=None, alpha=2.0 / 3, key=None, reverse=False,
+                 monoid=None):
+        """Create an instance of our Scapegoat Tree w/ supplied input, or
+        an empty tree."""
+        if not 0.5 <= alpha < 1:
+            raise ValueError('alpha must be between 0.5 and 1.')
+        self.alpha = alpha
+        self._max_length = 0
+        super(ScapegoatTree, self).__init__(root, key, reverse, monoid)
+        self._max_length = self.length
+
+    def _after_insert(self, node):
+        """If node landed deeper than the tree's size allows, rebuilds the
+        lowest ancestor whose subtree is too lopsided."""
+        self._refresh_path(node)
+        self._max_length = max(self._max_length, self.length)
+        node_depth = 0
+        current = node
+        while current._parent is not None:
+            current = current._parent
+            node_depth += 1
+        limit = math.log(self._max_length, 1 / self.alpha)
+        if node_depth <= limit:
+            return
+        child = node
+        scapegoat = node._parent
+        while scapegoat is not None:
+            if child.size > self.alpha * scapegoat.size:
+                break
+            child = scapegoat
+            scapegoat = scapegoat._parent
+        if scapegoat is None:
+            scapegoat = child
+        self._rebuild(scapegoat)
+
+    def _after_remove(self, parent, child, removed):
+        """Rebuilds the whole tree once enough values have gone."""
+        self._refresh_path(parent)
+        if self.length < self.alpha * self._max_length:
+            if self.root is not None:
+                self._rebuild(self._thaw(self.root, None))
+            self._max_length = self.length
+
+    def _rebuild(self, node):
+        """Relinks the subtree under node (which must be thawed) into a
+        perfectly balanced one.  Nodes shared with a snapshot are copied
+        rather than relinked."""
+        parent = node._parent
+        nodes = [self._own(item) for item in node._in_order()]
+        root = self._link_balanced(nodes, 0, len(nodes))
+        self._replace_child(parent, node, root)
+        self._refresh_path(parent)
+
+    def _rebalance_built(self, root):
+        """A freshly built tree is perfectly balanced already, only the
+        size it's measured against needs catching up."""
+        self._max_length = max(self._max_length, self.length)
+
+    def _wrap_root(self, root):
+        """Returns a new tree around a detached subtree root, see
+        BinarySearchTree._wrap_root."""
+        tree = super(ScapegoatTree, self)._wrap_root(root)
+        tree._max_length = tree.length
+        return tree
+
+
+ENGINES = {
+    'avl': BinarySearchTree,
+    'red-black': RedBlackTree,
+    'treap': Treap,
+    'scapegoat': ScapegoatTree,
+}
+
+
+if __name__ == '__main__':
+    import timeit
+
+    print("")
+    print("Balancing Engines")
+    print("")
+    print("Insert, lookup and delete throughput for every balancing scheme")
+    print("over the same random ints, plus memory per key and final depth.")
+    print("")
+    n = 10 ** 5
+    keys = random.sample(range(n * 10), n)
+    for name in sorted(ENGINES):
+        cls = ENGINES[name]
+        tree = cls()
+        insert = timeit.timeit('for key in keys: tree.insert(key)',
+                               setup='from __main__ import keys, tree',
+                               number=1)
+        lookup = timeit.timeit('for key in keys: tree.contains(key)',
+                               setup='from __main__ import keys, tree',
+                               number=1)
+        depth = tree.depth()
+        try:
+            import tracemalloc
+        except ImportError:
+            memory = None
+        else:
+            tracemalloc.start()
+            copy = cls.from_sorted(sorted(keys))
+            memory = tracemalloc.get_traced_memory()[0] / float(n)
+            tracemalloc.stop()
+            del copy
+        delete = timeit.timeit('for key in keys[::2]: tree.delete(key)',
+                               setup='from __main__ import keys, tree',
+                               number=1)
+        print(name)
+        print("Input: {} random ints".format(n))
+        print("Inserts per second: ", n / insert)
+        print("Lookups per second: ", n / lookup)
+        print("Deletes per second: ", (n // 2) / delete)
+        print("Depth after inserts: ", depth)
+        if memory is not None:
+            print("Bytes per key: ", memory)
+        print("")
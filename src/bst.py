@@ -1,24 +1,243 @@
 # -*- coding: utf-8 -*-
 """File implements a binary search tree data structure."""
 from __future__ import unicode_literals
+from array import array
+import itertools
+import math
+import numbers
+import operator
+import pickle
+import struct
+import sys
+try:
+    from collections.abc import ItemsView, KeysView, ValuesView
+except ImportError:
+    from collections import ItemsView, KeysView, ValuesView
+
+_clock = itertools.count(1)
+
+DUMP_MAGIC = b'BSTD'
+DUMP_HEADER = struct.Struct(str('<4s2sBxq'))
+HAS_LEFT, HAS_RIGHT = 1, 2
+SHAPE, DATA, TAGS = 1, 2, 4
+
+
+def _int64_typecode():
+    """Returns the array typecode of 64 bit signed ints: 'q', or on py27,
+    which lacks it, 'l' if that is 8 bytes wide, else None."""
+    for typecode in ('q', 'l'):
+        try:
+            if array(str(typecode)).itemsize == 8:
+                return typecode
+        except ValueError:
+            pass
+    return None
+
+
+INT64_TYPECODE = _int64_typecode()
+
+
+def _array_bytes(buf):
+    """Returns the raw bytes of array buf (tobytes is tostring on py27)."""
+    if hasattr(buf, 'tobytes'):
+        return buf.tobytes()
+    return buf.tostring()
+
+
+def _array_extend(buf, data):
+    """Appends the items packed in bytes data to array buf (frombytes is
+    fromstring on py27)."""
+    if hasattr(buf, 'frombytes'):
+        buf.frombytes(data)
+    else:
+        buf.fromstring(data)
+
+
+class _Reversed(object):
+    """Wraps a sort key so it orders backwards, for reverse trees whose
+    keys aren't numbers.  It only compares with other _Reversed keys."""
+
+    __slots__ = ('key',)
+
+    def __init__(self, key):
+        """Wraps key."""
+        self.key = key
+
+    def __eq__(self, other):
+        if type(other) is not _Reversed:
+            return NotImplemented
+        return self.key == other.key
+
+    def __ne__(self, other):
+        if type(other) is not _Reversed:
+            return NotImplemented
+        return self.key != other.key
+
+    def __lt__(self, other):
+        if type(other) is not _Reversed:
+            return NotImplemented
+        return other.key < self.key
+
+    def __gt__(self, other):
+        if type(other) is not _Reversed:
+            return NotImplemented
+        return self.key < other.key
+
+    def __le__(self, other):
+        if type(other) is not _Reversed:
+            return NotImplemented
+        return other.key <= self.key
+
+    def __ge__(self, other):
+        if type(other) is not _Reversed:
+            return NotImplemented
+        return self.key <= other.key
+
+    def __hash__(self):
+        return hash(self.key)
+
+    def __repr__(self):
+        return '_Reversed({!r})'.format(self.key)
+
+
+def _reversed_key(key):
+    """Returns a key that sorts backwards: negated for real numbers
+    (bools included, which negate as ints), so the descent still compares
+    plain numbers, wrapped for anything else."""
+    if isinstance(key, numbers.Real):
+        return -key
+    return _Reversed(key)
+
+
+def _sort_key(key, reverse):
+    """Returns the function that turns a value into the key a tree sorts
+    it by, or None when that's the value itself."""
+    if not reverse:
+        return key
+    if key is None:
+        return _reversed_key
+    return lambda val: _reversed_key(key(val))
+
+
+class _Deleted(object):
+    """Type of _DELETED, which lazy_delete stores as a node's data to mark
+    the node as a tombstone.  It pickles by name, so a pickled tree's
+    tombstones come back as the same object."""
+
+    __slots__ = ()
+
+    def __reduce__(self):
+        return str('_DELETED')
+
+    def __repr__(self):
+        return '_DELETED'
+
+
+_DELETED = _Deleted()
+_NO_KEY = object()
+
+
+def _lift_val(val, data):
+    """Lifts a node to its value, the default for Monoid."""
+    return val
+
+
+def _lift_one(val, data):
+    """Lifts every node to 1, for COUNT."""
+    return 1
+
+
+def _min(first, second):
+    """Combines for MIN, where None is the identity."""
+    if first is None or (second is not None and second < first):
+        return second
+    return first
+
+
+def _max(first, second):
+    """Combines for MAX, where None is the identity."""
+    if first is None or (second is not None and first < second):
+        return second
+    return first
+
+
+class Monoid(object):
+    """Monoid describes a summary a tree keeps for every subtree, see
+    BinarySearchTree.aggregate.  lift(val, data) gives one node's element,
+    combine(first, second) merges the elements of two neighbouring runs of
+    values, smaller first, and must be associative, and identity is the
+    element of no values at all.  lift defaults to the value itself."""
+
+    __slots__ = ('identity', 'combine', 'lift')
+
+    def __init__(self, identity, combine, lift=_lift_val):
+        """Sets up the monoid."""
+        self.identity = identity
+        self.combine = combine
+        self.lift = lift
+
+
+SUM = Monoid(0, operator.add)
+MIN = Monoid(None, _min)
+MAX = Monoid(None, _max)
+COUNT = Monoid(0, operator.add, _lift_one)
 
 
 class Node(object):
     """Example node class with example @property decorators
 
     pieces of this code are significantly wrong (parent deletion for
-    instance) and you should test your implementation throughly"""
+    instance) and you should test your implementation throughly
+
+    Nodes use __slots__ so they carry no per-instance __dict__, and the
+    tree's own code reads and writes _left, _right and _parent directly
+    rather than going through the properties.
+
+    _epoch records when the node was made, so a tree can tell whether the
+    node might be shared with a snapshot (see BinarySearchTree.snapshot).
+    A shared node's parent link is never changed, so it stays right in
+    the tree the node was shared from (the snapshotted tree, or the
+    input of split, join or a set operation); in a tree that has since
+    copied its old parent, parent still names the old one.  _tag is spare
+    room for balancing
+    schemes other than AVL (a colour, a priority).
+
+    key is what the node is ordered by: val itself unless the tree has a
+    key function or is reversed, in which case it's worked out once when
+    the node is made and every comparison uses it.
+
+    A node whose data is _DELETED is a tombstone left by lazy_delete: it
+    stays linked, so the tree keeps its shape, but lookups and traversals
+    skip it.  depth and size count tombstones too, live is the size
+    without them."""
+
+    __slots__ = ('val', 'key', 'data', '_left', '_right', '_parent',
+                 'depth', 'size', 'live', '_epoch', '_tag')
 
     def __init__(self, val, data=None, left=None, right=None,
-                 parent=None):
+                 parent=None, key=_NO_KEY):
         """sets self.whatever values for instantiating instances of
         the class"""
         self.val = val
+        self.key = val if key is _NO_KEY else key
         self._left = left
         self._right = right
         self._parent = parent
         self.data = data
         self.depth = 1
+        self.size = 1
+        self.live = 1
+        self._epoch = 0
+        self._tag = None
+
+    def __getstate__(self):
+        """Returns the node's slots as pickle's (state, slotstate) pair.
+        Protocol 2 and up find slots unaided, but py27's default protocol
+        refuses a class with __slots__ and no __getstate__."""
+        names = [name for cls in type(self).__mro__
+                 for name in getattr(cls, '__slots__', ())]
+        return None, dict((name, getattr(self, name)) for name in names
+                          if hasattr(self, name))
 
     @property
     def left(self):
@@ -77,7 +296,7 @@ class Node(object):
         as appropriate"""
         self._parent = node
         try:
-            if node.val > self.val:
+            if node.key > self.key:
                 node._left = self
             else:
                 node._right = self
@@ -92,141 +311,605 @@ class Node(object):
         """Returns true if there is a right child."""
         return self.right
 
-    def _insert(self, val, data=None):
-        """Helper method to BST.insert method."""
-        try:
-            if val < self.val:
-                if self.has_left_child():
-                    self.left._insert(val)
-                else:
-                    self.left = Node(val, data)
-            else:
-                if self.has_right_child():
-                    self.right._insert(val, data)
-                else:
-                    self.right = Node(val)
-        except TypeError:
-            raise(TypeError('Insert values must be the same type'))
-
-    def _in_order(self):
+    def _in_order(self, reverse=False):
         """
-        This internal method is a generator that will output in order traversal
-        of a binary tree(left child, parent, right child), one value at a time.
+        This internal method is a generator that will output the nodes of
+        this subtree in order (left child, parent, right child), or in
+        reverse order if asked.  It keeps its own stack of pending parents
+        rather than recursing, so each node costs O(1) amortized and deep
+        trees can't hit the recursion limit.
         """
-        try:
-            for node in self.left._in_order():
-                if node is None:
-                    pass
-                else:
-                    yield node
-        except AttributeError:
-            pass
-        yield self.val
-        try:
-            for node in self.right._in_order():
-                if node is None:
-                    pass
-                else:
-                    yield node
-        except AttributeError:
-            pass
+        stack = []
+        current = self
+        while stack or current is not None:
+            if current is not None:
+                stack.append(current)
+                current = current._right if reverse else current._left
+            else:
+                current = stack.pop()
+                yield current
+                current = current._left if reverse else current._right
 
     def _pre_order(self):
         """
-        Returns a generator that will output preorder traversalof a binary
-        tree(parent, left child, right child), one value at a time.
+        Returns a generator that will output the nodes of this subtree in
+        preorder (parent, left child, right child), using its own stack.
         """
-        yield self.val
-        try:
-            for node in self.left._pre_order():
-                if node is None:
-                    pass
-                else:
-                    yield node
-        except AttributeError:
-            pass
-        try:
-            for node in self.right._pre_order():
-                if node is None:
-                    pass
-                else:
-                    yield node
-        except AttributeError:
-            pass
+        stack = [self]
+        while stack:
+            current = stack.pop()
+            yield current
+            if current._right is not None:
+                stack.append(current._right)
+            if current._left is not None:
+                stack.append(current._left)
 
     def _post_order(self):
         """
-        Returns a generator that will output postorder traversalof a binary
-        tree(left child, right child, parent), one value at a time.
+        Returns a generator that will output the nodes of this subtree in
+        postorder (left child, right child, parent), using its own stack.
+        A node is only emitted once its right subtree has been.
         """
-        try:
-            for node in self.left._post_order():
-                if node is None:
-                    pass
-                else:
-                    yield node
-        except AttributeError:
-            pass
-        try:
-            for node in self.right._post_order():
-                if node is None:
-                    pass
+        stack = []
+        current = self
+        last = None
+        while stack or current is not None:
+            if current is not None:
+                stack.append(current)
+                current = current._left
+            else:
+                peek = stack[-1]
+                if peek._right is not None and peek._right is not last:
+                    current = peek._right
                 else:
-                    yield node
-        except AttributeError:
-            pass
-        yield self.val
+                    last = stack.pop()
+                    yield last
+
+
+class AggregateNode(Node):
+    """Node for trees with a monoid.  agg is the monoid's summary of every
+    live value in the node's subtree, kept up to date wherever depth and
+    size are."""
+
+    __slots__ = ('agg',)
+
+    def __init__(self, val, data=None, left=None, right=None,
+                 parent=None, key=_NO_KEY):
+        """Sets up the node, with no summary yet."""
+        super(AggregateNode, self).__init__(val, data, left, right, parent,
+                                            key)
+        self.agg = None
+
+
+class BSTKeysView(KeysView):
+    """Live view of the values of a BinarySearchTree, in order."""
+
+    def __reversed__(self):
+        """Iterates over the values largest first."""
+        return reversed(self._mapping)
+
+
+class BSTValuesView(ValuesView):
+    """Live view of the data stored in a BinarySearchTree, in value
+    order."""
+
+    def __iter__(self):
+        """Iterates over the data in value order."""
+        for val, data in self._mapping._items():
+            yield data
+
+    def __reversed__(self):
+        """Iterates over the data largest value first."""
+        for val, data in self._mapping._items(True):
+            yield data
+
+
+class BSTItemsView(ItemsView):
+    """Live view of the (value, data) pairs of a BinarySearchTree, in value
+    order."""
+
+    def __iter__(self):
+        """Iterates over the pairs in value order."""
+        return self._mapping._items()
+
+    def __reversed__(self):
+        """Iterates over the pairs largest value first."""
+        return self._mapping._items(True)
 
 
 class BinarySearchTree(object):
     """BinarySearchTree implements a Binary Search Tree data structure
     and associated methods."""
 
-    def __init__(self, root=None):
+    stats = None
+    compact_ratio = 0.5
+    read_only = False
+
+    def __init__(self, root=None, key=None, reverse=False, monoid=None):
         """Create an instance of our Binary Search Tree w/ supplied
-        input, or an emptry tree."""
+        input, or an emptry tree.  Values are ordered by key(val) if key
+        is given, and largest first if reverse is True.  With a monoid
+        (such as SUM) every node keeps a summary of its subtree, see
+        aggregate."""
+        self.key = key
+        self.reverse = reverse
+        self._sort_key = _sort_key(key, reverse)
+        self.monoid = monoid
+        self._node_type = Node if monoid is None else AggregateNode
         self.length = 0
+        self.tombstones = 0
+        self._floor = 0
+        self._epoch = next(_clock)
+        self.root = None
         if root:
-            self.root = Node(root)
-            self.length = 1
+            self.insert(root)
+
+    @classmethod
+    def from_iterable(cls, iterable, presorted=False, key=None,
+                      reverse=False, monoid=None):
+        """Builds a perfectly balanced tree from iterable in O(n) once the
+        values are sorted.  Values are sorted first unless presorted is
+        True (in the tree's order), and duplicates are dropped.  key,
+        reverse and monoid are as for the constructor."""
+        tree = cls(key=key, reverse=reverse, monoid=monoid)
+        nodes = [tree._new_node(val, None, None, val_key)
+                 for val_key, val in tree._sorted_pairs(iterable, presorted)]
+        tree.root = tree._link_balanced(nodes, 0, len(nodes))
+        tree.length = len(nodes)
+        tree._rebalance_built(tree.root)
+        return tree
+
+    def _sorted_pairs(self, iterable, presorted=False):
+        """Returns a list of (key, value) pairs for the values of iterable,
+        in this tree's order with duplicates dropped.  The sort is skipped
+        if presorted is True."""
+        sort_key = self._sort_key
+        if sort_key is None:
+            pairs = [(val, val) for val in iterable]
+        else:
+            pairs = [(sort_key(val), val) for val in iterable]
+        try:
+            if not presorted:
+                pairs.sort(key=lambda pair: pair[0])
+            unique = []
+            for pair in pairs:
+                if not unique or pair[0] != unique[-1][0]:
+                    unique.append(pair)
+        except TypeError:
+            raise(TypeError('Node values must be the same type'))
+        return unique
+
+    @classmethod
+    def from_sorted(cls, iterable, key=None, reverse=False, monoid=None):
+        """Builds a perfectly balanced tree from an already sorted
+        iterable, see from_iterable."""
+        return cls.from_iterable(iterable, presorted=True, key=key,
+                                 reverse=reverse, monoid=monoid)
+
+    def _link_balanced(self, nodes, start, stop):
+        """Links the in-order list nodes[start:stop] into a balanced subtree
+        and returns its root, setting each node's depth and size on the
+        way back up."""
+        if start >= stop:
+            return None
+        mid = (start + stop) // 2
+        node = nodes[mid]
+        left = self._link_balanced(nodes, start, mid)
+        right = self._link_balanced(nodes, mid + 1, stop)
+        node._parent = None
+        node._left = left
+        node._right = right
+        if left is not None:
+            left._parent = node
+        if right is not None:
+            right._parent = node
+        self._update_node(node)
+        return node
+
+    def _rebalance_built(self, root):
+        """Hook for balancing schemes that keep more than depths, called
+        on the root of a subtree _link_balanced has just built.  AVL needs
+        nothing more."""
+        pass
+
+    def dump(self, fileobj, shape=True):
+        """Writes the tree to a binary file object.  With shape=True the
+        values go in pre-order, with a byte per node saying which children
+        it has, so load rebuilds exactly this tree.  With shape=False they
+        go in sorted order, and load builds a perfectly balanced tree.
+
+        Int or float values are written as a raw array of 64 bit ints or
+        doubles; anything else, and the data, is pickled as one flat list,
+        so only load dumps you trust.  A shape dump keeps lazily deleted values as tombstones, a
+        sorted one leaves them out."""
+        if shape:
+            nodes = list(self.root._pre_order()) if self.root else []
+        else:
+            nodes = [node for node in self.root._in_order()
+                     if node.data is not _DELETED] if self.root else []
+        vals = [node.val for node in nodes]
+        flags = SHAPE if shape else 0
+        data = [node.data for node in nodes]
+        if any(item is not None for item in data):
+            flags |= DATA
+        tags = [node._tag for node in nodes]
+        if shape and any(tag is not None for tag in tags):
+            flags |= TAGS
+        typecode = self._dump_typecode(vals)
+        byteorder = b'<' if sys.byteorder == 'little' else b'>'
+        fileobj.write(DUMP_HEADER.pack(
+            DUMP_MAGIC, typecode.encode('ascii') + byteorder, flags,
+            len(nodes)))
+        if shape:
+            fileobj.write(bytearray(
+                (HAS_LEFT if node._left is not None else 0) |
+                (HAS_RIGHT if node._right is not None else 0)
+                for node in nodes))
+        if typecode == 'O':
+            self._dump_pickle(fileobj, vals)
+        else:
+            fileobj.write(_array_bytes(array(str(
+                INT64_TYPECODE if typecode == 'q' else typecode), vals)))
+        if flags & DATA:
+            self._dump_pickle(fileobj, data)
+        if flags & TAGS:
+            self._dump_pickle(fileobj, tags)
+
+    @staticmethod
+    def _dump_typecode(vals):
+        """Returns the array typecode that holds every value exactly, or 'O'
+        if they need pickling."""
+        if all(type(val) is float for val in vals):
+            return 'd'
+        if INT64_TYPECODE is not None and \
+                all(type(val) is int and -2 ** 63 <= val < 2 ** 63
+                    for val in vals):
+            return 'q'
+        return 'O'
+
+    @staticmethod
+    def _dump_pickle(fileobj, items):
+        """Writes a length prefixed pickle of the list items."""
+        payload = pickle.dumps(items, pickle.HIGHEST_PROTOCOL)
+        fileobj.write(struct.pack(str('<q'), len(payload)))
+        fileobj.write(payload)
+
+    @classmethod
+    def load(cls, fileobj, key=None, reverse=False, monoid=None):
+        """Reads a tree written by dump back from a binary file object in
+        O(n), without comparing or rotating anything.  Functions can't be
+        written out, so a tree dumped with a key or reverse must be loaded
+        with the same ones.  A monoid's summaries are worked out afresh."""
+        header = cls._load_exactly(fileobj, DUMP_HEADER.size)
+        magic, codes, flags, length = DUMP_HEADER.unpack(header)
+        if magic != DUMP_MAGIC:
+            raise ValueError('Not a BinarySearchTree dump.')
+        typecode = codes[:1].decode('ascii')
+        shape = bytearray(cls._load_exactly(fileobj, length)) \
+            if flags & SHAPE else None
+        if typecode == 'O':
+            vals = cls._load_pickle(fileobj)
+        else:
+            vals = array(str(
+                INT64_TYPECODE if typecode == 'q' else typecode))
+            _array_extend(vals, cls._load_exactly(fileobj,
+                                                  length * vals.itemsize))
+            if codes[1:] != (b'<' if sys.byteorder == 'little' else b'>'):
+                vals.byteswap()
+        data = cls._load_pickle(fileobj) if flags & DATA \
+            else itertools.repeat(None)
+        tree = cls(key=key, reverse=reverse, monoid=monoid)
+        sort_key = tree._sort_key
+        nodes = [tree._new_node(val, item, None,
+                                val if sort_key is None else sort_key(val))
+                 for val, item in zip(vals, data)]
+        if len(nodes) != length:
+            raise ValueError('BinarySearchTree dump is truncated.')
+        if shape is None:
+            root = tree._link_balanced(nodes, 0, length)
+            tree._rebalance_built(root)
         else:
-            self.root = root
+            root = tree._link_pre_order(nodes, shape)
+            if flags & TAGS:
+                for node, tag in zip(nodes, cls._load_pickle(fileobj)):
+                    node._tag = tag
+        return tree._wrap_root(root)
+
+    def _link_pre_order(self, nodes, shape):
+        """Links nodes, listed in pre-order with the child flags in shape,
+        back into their tree and returns its root.  Every node comes
+        before its subtree in pre-order, so refreshing them in reverse
+        sets each node's depth and size after its children's."""
+        root = nodes[0] if nodes else None
+        awaiting_right = []
+        parent = None
+        left_side = True
+        for node, flags in zip(nodes, shape):
+            if parent is not None:
+                if left_side:
+                    parent._left = node
+                else:
+                    parent._right = node
+                node._parent = parent
+            elif node is not root:
+                raise ValueError('BinarySearchTree dump is corrupt.')
+            if flags & HAS_RIGHT:
+                awaiting_right.append(node)
+            if flags & HAS_LEFT:
+                parent, left_side = node, True
+            elif awaiting_right:
+                parent, left_side = awaiting_right.pop(), False
+            else:
+                parent = None
+        if parent is not None or awaiting_right:
+            raise ValueError('BinarySearchTree dump is corrupt.')
+        for node in reversed(nodes):
+            self._update_node(node)
+        return root
+
+    @staticmethod
+    def _load_exactly(fileobj, count):
+        """Reads count bytes, raises ValueError if the stream runs out."""
+        payload = fileobj.read(count)
+        if len(payload) != count:
+            raise ValueError('BinarySearchTree dump is truncated.')
+        return payload
+
+    @classmethod
+    def _load_pickle(cls, fileobj):
+        """Reads a list written by _dump_pickle."""
+        size, = struct.unpack(str('<q'), cls._load_exactly(fileobj, 8))
+        return pickle.loads(cls._load_exactly(fileobj, size))
+
+    def enable_stats(self, timing=False, history=1000):
+        """Starts counting comparisons, rotations, nodes visited per
+        operation and height over time into a bst_stats.TreeStats, which is
+        returned and kept as self.stats.  With timing=True each insert,
+        lookup and delete is also timed into a histogram.
+
+        The counting is done by wrappers set on this tree only, so a tree
+        without stats enabled runs exactly the same code as before.  Trees
+        made from this one (snapshots, split or set operation results)
+        start without stats, but the rotations made while building them
+        (or merging an insert_many batch) are counted here."""
+        from bst_stats import instrument
+        if self.stats is not None:
+            self.disable_stats()
+        return instrument(self, timing, history)
+
+    def disable_stats(self):
+        """Removes the wrappers enable_stats added, returns the final
+        stats or None if they weren't enabled."""
+        from bst_stats import uninstrument
+        return uninstrument(self)
 
     def insert(self, val, data=None):
         """Inserts a value into the BST.  If the value is already in
-        the BST it will be ingored."""
-        if not self.contains(val):
-            if self.root:
-                self.root._insert(val, data)
-            else:
-                self.root = Node(val, data)
-            self.length += 1
-        self._update_balance(self.root)
-        new_node = self.find_node(val)
-        self._check_balance_and_call(new_node)
-        self._update_balance(self.root)
+        the BST it will be ingored.  Only the nodes on the path from the
+        new leaf back up to the root have their depth refreshed, and at
+        most one (single or double) rotation is made."""
+        self._insert(val, data, False)
+
+    def _insert(self, val, data, replace):
+        """Helper method to insert and __setitem__, replace says whether an
+        existing node's data is overwritten."""
+        self._check_writable()
+        key = val if self._sort_key is None else self._sort_key(val)
+        if self.root is None:
+            self.root = self._new_node(val, data, None, key)
+            self.length = 1
+            self._after_insert(self.root)
+            return
+        current = self._thaw(self.root, None)
+        try:
+            while True:
+                if key == current.key:
+                    if current.data is _DELETED:
+                        current.val = val
+                        current.data = data
+                        self.tombstones -= 1
+                        self.length += 1
+                        self._refresh_path(current)
+                    elif replace:
+                        current.data = data
+                        if self.monoid is not None:
+                            self._refresh_path(current)
+                    return
+                if key < current.key:
+                    if current._left is None:
+                        new = current._left = self._new_node(val, data,
+                                                             current, key)
+                        break
+                    current = self._thaw(current._left, current)
+                else:
+                    if current._right is None:
+                        new = current._right = self._new_node(val, data,
+                                                              current, key)
+                        break
+                    current = self._thaw(current._right, current)
+        except TypeError:
+            raise(TypeError('Insert values must be the same type'))
+        self.length += 1
+        self._after_insert(new)
+
+    def insert_many(self, iterable):
+        """Inserts every value of iterable, ignoring any already in the BST.
+        The batch is sorted once (which is linear if it's sorted already)
+        and built into a balanced subtree, which is then merged with the
+        tree the way union does.  That's O(m log(n/m + 1)) for m values
+        into n, rather than a root-to-leaf descent per value.  The merge
+        relinks the tree's nodes in place, copying only those it touches
+        that are shared with a snapshot, and a batch value revives its
+        tombstone."""
+        self._check_writable()
+        nodes = [self._new_node(val, None, None, val_key)
+                 for val_key, val in self._sorted_pairs(iterable)]
+        if not nodes:
+            return
+        batch = self._link_balanced(nodes, 0, len(nodes))
+        self._rebalance_built(batch)
+        self.root = root = self._union(self.root, batch)
+        self._set_parent(root, None)
+        self.length = root.live
+        self.tombstones = root.size - root.live
+
+    def _new_node(self, val, data, parent, key):
+        """Returns a new node owned by this tree, ordered by key."""
+        node = self._node_type(val, data, parent=parent, key=key)
+        node._epoch = self._epoch
+        if self.monoid is not None:
+            node.agg = self.monoid.lift(val, data)
+        return node
+
+    def _key_of(self, val):
+        """Returns the key val is ordered by in this tree."""
+        return val if self._sort_key is None else self._sort_key(val)
 
     def contains(self, val):
         """Will return True if val is in the BST, or False if it's not."""
-        try:
-            return self._contains(val, self.root)
-        except AttributeError:
-            pass
+        if self.root is None:
+            return None
+        return self._contains(val, self.root)
 
     def _contains(self, val, current_node):
-        """Helper method to contains, recursively called and returns True
-        if we find the node we're looking for, False if not."""
+        """Helper method to contains, walks down from current_node and
+        returns True if we find the node we're looking for, False if
+        not."""
+        return bool(self._find_node(val, current_node))
+
+    def contains_many(self, iterable):
+        """Returns a list saying, for each value of iterable in turn,
+        whether it's in the BST.  The values are looked up in sorted order,
+        each search starting from where the last one ended rather than from
+        the root, so a batch of nearby values shares most of its path.  The
+        path is kept with, for each node, the key of the nearest ancestor
+        it's left of: once the next key reaches that bound it's outside the
+        node's subtree, so the search backs up only that far."""
+        vals = list(iterable)
+        sort_key = self._sort_key
+        keys = vals if sort_key is None else [sort_key(val) for val in vals]
         try:
-            if val == current_node.val:
-                return True
-            elif current_node.right and val > current_node.val:
-                return self._contains(val, current_node.right)
-            elif current_node.left and val < current_node.val:
-                return self._contains(val, current_node.left)
-            else:
-                return False
+            order = sorted(range(len(keys)), key=keys.__getitem__)
         except TypeError:
             raise(TypeError('Node values must be the same type'))
+        results = [False] * len(keys)
+        nodes, bounds = [], []
+        for index in order:
+            key = keys[index]
+            while bounds and bounds[-1] is not None and \
+                    not key < bounds[-1]:
+                nodes.pop()
+                bounds.pop()
+            if nodes:
+                current, bound = nodes.pop(), bounds.pop()
+            else:
+                current, bound = self.root, None
+            while current is not None:
+                nodes.append(current)
+                bounds.append(bound)
+                current_key = current.key
+                if key < current_key:
+                    bound = current_key
+                    current = current._left
+                elif key == current_key:
+                    results[index] = current.data is not _DELETED
+                    break
+                else:
+                    current = current._right
+        return results
+
+    def __getitem__(self, val):
+        """Returns the data stored with val, raises KeyError if val isn't
+        in the BST."""
+        node = self.find_node(val)
+        if not node:
+            raise KeyError(val)
+        return node.data
+
+    def __setitem__(self, val, data):
+        """Stores data with val, inserting val if it isn't in the BST."""
+        self._insert(val, data, True)
+
+    def __delitem__(self, val):
+        """Removes val and its data, raises KeyError if val isn't in the
+        BST."""
+        if not self._delete(val):
+            raise KeyError(val)
+
+    def __contains__(self, val):
+        """Lets us say 'val in tree'."""
+        return bool(self.contains(val))
+
+    def __iter__(self):
+        """Iterates over the values of the BST in order."""
+        if self.length == 0:
+            return iter(())
+        return self.in_order()
+
+    def __reversed__(self):
+        """Iterates over the values of the BST largest first."""
+        if self.length == 0:
+            return iter(())
+        return self.in_order(reverse=True)
+
+    def get(self, val, default=None):
+        """Returns the data stored with val, or default if val isn't in the
+        BST."""
+        node = self.find_node(val)
+        if not node:
+            return default
+        return node.data
+
+    def keys(self):
+        """Returns a live view of the values of the BST, in order."""
+        return BSTKeysView(self)
+
+    def values(self):
+        """Returns a live view of the data stored in the BST, in value
+        order."""
+        return BSTValuesView(self)
+
+    def items(self):
+        """Returns a live view of (value, data) pairs, in value order."""
+        return BSTItemsView(self)
+
+    def _items(self, reverse=False):
+        """Generator of (value, data) pairs, used by the views."""
+        if self.root is None:
+            return
+        for node in self.root._in_order(reverse):
+            if node.data is not _DELETED:
+                yield node.val, node.data
+
+    def pop_min(self):
+        """Removes the smallest value and returns it with its data as a
+        (value, data) pair, raises KeyError if the BST is empty."""
+        return self._pop_end(False)
+
+    def pop_max(self):
+        """Removes the largest value and returns it with its data as a
+        (value, data) pair, raises KeyError if the BST is empty."""
+        return self._pop_end(True)
+
+    def _pop_end(self, largest):
+        """Helper method to pop_min and pop_max.  Tombstones found at the
+        end on the way are unlinked for good."""
+        self._check_writable()
+        if self.length == 0:
+            raise KeyError('pop from an empty Tree')
+        while True:
+            current = self._thaw(self.root, None)
+            while True:
+                child = current._right if largest else current._left
+                if child is None:
+                    break
+                current = self._thaw(child, current)
+            if current.data is not _DELETED:
+                break
+            self._remove(current)
+        item = (current.val, current.data)
+        self._remove(current)
+        return item
 
     def size(self):
         """Will return the integer size of the BST, zero if BST is empty."""
@@ -265,20 +948,24 @@ class BinarySearchTree(object):
                 starting_point = self.root
             else:
                 return 0
-        left_depth = starting_point.left.depth if starting_point.left else 0
-        right_depth = starting_point.right.depth if starting_point.right else 0
+        left = starting_point._left
+        right = starting_point._right
+        left_depth = left.depth if left else 0
+        right_depth = right.depth if right else 0
         return left_depth - right_depth
 
-    def in_order(self, starting_point=None):
+    def in_order(self, starting_point=None, reverse=False):
         """
         This function will return a generator that will return the values
-        of the tree using in-order traversal, one value at a time.
+        of the tree using in-order traversal, one value at a time.  With
+        reverse=True the values come out largest first.
         """
         if starting_point is None:
             starting_point = self.root
         if self.length == 0:
             raise IndexError("You can't in-order traverse an empty Tree.")
-        return starting_point._in_order()
+        return (node.val for node in starting_point._in_order(reverse)
+                if node.data is not _DELETED)
 
     def pre_order(self, starting_point=None):
         """
@@ -289,7 +976,8 @@ class BinarySearchTree(object):
             raise IndexError("You can't pre-order traverse an empty Tree.")
         if starting_point is None:
             starting_point = self.root
-        return starting_point._pre_order()
+        return (node.val for node in starting_point._pre_order()
+                if node.data is not _DELETED)
 
     def post_order(self, starting_point=None):
         """
@@ -300,102 +988,145 @@ class BinarySearchTree(object):
             raise IndexError("You can't post-order traverse an empty Tree.")
         if starting_point is None:
             starting_point = self.root
-        return starting_point._post_order()
+        return (node.val for node in starting_point._post_order()
+                if node.data is not _DELETED)
 
-    def breadth_first(self, starting_point=None):
+    def breadth_first(self, starting_point=None, by_level=False,
+                      max_depth=None):
         """
-        This internal method is a generator that will output breadth first
-        traversal of a binary tree(left child, right child, parent),
-        one value at a time.
+        This method is a generator that will output breadth first
+        traversal of a binary tree (each level left to right, top level
+        first), one value at a time.  starting_point may be a Node or a
+        value in the tree.  With by_level=True each level comes out as one
+        list (levels holding only lazily deleted values are skipped), and
+        max_depth stops after that many levels.  Every node is
+        visited once, so a full traversal is O(n).
         """
         if self.length == 0:
             raise IndexError("You can't breadth-first traverse an empty Tree.")
-        from dll import DoublyLinkedList
-        unvisited = DoublyLinkedList()
         if starting_point is None:
             starting_point = self.root
-        elif self.contains(starting_point) is False:
-            raise IndexError('Starting point is not in the Tree.')
-        unvisited.push(starting_point)
-        visited = []
-        while unvisited.size() > 0:
-            current = unvisited.shift()
-            if current not in visited:
-                visited.append(current)
-                if current.left:
-                    unvisited.push(current.left)
-                if current.right:
-                    unvisited.push(current.right)
-                yield current.val
+        elif not isinstance(starting_point, Node):
+            starting_point = self.find_node(starting_point)
+            if not starting_point:
+                raise IndexError('Starting point is not in the Tree.')
+        level = [starting_point]
+        level_number = 1
+        while level and (max_depth is None or level_number <= max_depth):
+            if by_level:
+                vals = [node.val for node in level
+                        if node.data is not _DELETED]
+                if vals:
+                    yield vals
+            else:
+                for node in level:
+                    if node.data is not _DELETED:
+                        yield node.val
+            next_level = []
+            for node in level:
+                if node._left is not None:
+                    next_level.append(node._left)
+                if node._right is not None:
+                    next_level.append(node._right)
+            level = next_level
+            level_number += 1
 
     def delete(self, val):
-        """Removes a node with val from the Tree, returns None."""
-        delete_me = self.find_node(val)
-        if not delete_me:
+        """Removes a node with val from the Tree, returns None.  A node with
+        two children takes its in-order successor's value and the successor
+        node is unlinked instead, then the path back to the root is
+        retraced."""
+        self._delete(val)
+
+    def lazy_delete(self, val):
+        """Marks the node with val as deleted, returns None.  The node is
+        left in place as a tombstone, so nothing is unlinked or rotated and
+        this is a single O(log n) descent.  Once tombstones make up more
+        than compact_ratio of the nodes the tree is compacted, which keeps
+        the cost amortized O(log n) per delete.  Inserting val again
+        revives its tombstone."""
+        self._delete(val, True)
+
+    def _delete(self, val, lazy=False):
+        """Helper method to delete, lazy_delete and __delitem__, returns
+        whether val was in the BST."""
+        self._check_writable()
+        delete_me = self._find_for_write(val)
+        if delete_me is None:
+            return False
+        if not lazy:
+            self._remove(delete_me)
+            return True
+        delete_me.data = _DELETED
+        self.length -= 1
+        self.tombstones += 1
+        self._refresh_path(delete_me)
+        if self.tombstones > self.compact_ratio * self.root.size:
+            self.compact()
+        return True
+
+    def compact(self):
+        """Unlinks every tombstone lazy_delete has left by relinking the
+        live nodes into a balanced tree, O(n).  Nodes shared with a
+        snapshot are copied rather than relinked.  lazy_delete calls this
+        once tombstones pass compact_ratio of the nodes, and nothing else
+        does: rank and select count through the nodes' live counts
+        instead."""
+        self._check_writable()
+        if not self.tombstones:
             return
-        if delete_me.left is not None:
-            try:
-                left_childs = list(self.in_order(delete_me.left))
-            except AttributeError:
-                left_childs = []
-        else:
-            left_childs = []
-        if delete_me.right is not None:
-            try:
-                right_childs = list(self.in_order(delete_me.right))
-            except AttributeError:
-                right_childs = []
-        else:
-            right_childs = []
-        try:
-            left_choice = left_childs[-1]
-        except IndexError:
-            left_choice = None
-        try:
-            right_choice = right_childs[0]
-        except IndexError:
-            right_choice = None
-        try:
-            a = abs(right_choice - val)
-        except TypeError:
-            a = 0
+        nodes = [self._own(node) for node in self.root._in_order()
+                 if node.data is not _DELETED]
+        self.root = self._link_balanced(nodes, 0, len(nodes))
+        self._rebalance_built(self.root)
+        self.tombstones = 0
+
+    def _find_for_write(self, val):
+        """Like find_node, but copies any node on the way down that is
+        shared with a snapshot so the result can be changed safely.
+        Returns None if val isn't in the BST."""
+        if self.length == 0:
+            return None
+        key = self._key_of(val)
+        current = self._thaw(self.root, None)
         try:
-            b = abs(val - left_choice)
+            while True:
+                if key == current.key:
+                    if current.data is _DELETED:
+                        return None
+                    return current
+                child = current._left if key < current.key else \
+                    current._right
+                if child is None:
+                    return None
+                current = self._thaw(child, current)
         except TypeError:
-            b = 0
-        if a > b:
-            if left_choice is not None:
-                left_choice = self.find_node(left_choice)
-                left_choice.parent.right = None
-                if self.root == delete_me:
-                    self.root = left_choice
-                if left_choice.left is not None:
-                    left_choice.left.parent = left_choice.parent
-                left_choice.parent = None
-                delete_me.val = left_choice.val
-            else:
-                if delete_me.parent.right is not None:
-                    delete_me.parent.right = None
-                    delete_me.parent.left = None
-                delete_me.parent = None
+            raise(TypeError('Node values must be the same type'))
+
+    def _remove(self, delete_me):
+        """Helper method to delete, unlinks a node that's in the BST and
+        that _find_for_write (or another copying walk) returned.  A
+        tombstone is unlinked the same way."""
+        if delete_me.data is _DELETED:
+            self.tombstones -= 1
         else:
-            if right_choice is not None:
-                right_choice = self.find_node(right_choice)
-                right_choice.parent.left = None
-                if self.root == delete_me:
-                    self.root = right_choice
-                if right_choice.right is not None:
-                    right_choice.right.parent = right_choice.parent
-                right_choice.parent = None
-                delete_me.val = right_choice.val
-            else:
-                if delete_me.parent is not None:
-                    delete_me.parent.right = None
-                    delete_me.parent.left = None
-                delete_me.parent = None
-        self._check_balance_and_call(delete_me)
-        self._update_balance(self.root)
-        self.length -= 1
+            self.length -= 1
+        if delete_me._left is not None and delete_me._right is not None:
+            successor = self._thaw(delete_me._right, delete_me)
+            while successor._left is not None:
+                successor = self._thaw(successor._left, successor)
+            delete_me.val = successor.val
+            delete_me.key = successor.key
+            delete_me.data = successor.data
+            delete_me = successor
+        if delete_me._left is not None:
+            child = delete_me._left
+        else:
+            child = delete_me._right
+        parent = delete_me._parent
+        self._replace_child(parent, delete_me, child)
+        delete_me._parent = delete_me._left = delete_me._right = None
+        self._after_remove(parent, child, delete_me)
 
     def find_node(self, val):
         """Will return the node with the val we asked for or False if it
@@ -403,76 +1134,615 @@ class BinarySearchTree(object):
         return self._find_node(val, self.root)
 
     def _find_node(self, val, current_node):
-        """Helper method to find_node, recursively called and returns the node
-        or False if it isn't in the BST."""
+        """Helper method to find_node, walks down from current_node and
+        returns the node or False if it isn't in the BST."""
         if self.length > 0:
+            key = self._key_of(val)
             try:
-                if val == current_node.val:
-                    return current_node
-                elif current_node.right and val > current_node.val:
-                    return self._find_node(val, current_node.right)
-                elif current_node.left and val < current_node.val:
-                    return self._find_node(val, current_node.left)
-                else:
-                    return False
+                while current_node is not None:
+                    if key == current_node.key:
+                        if current_node.data is _DELETED:
+                            return False
+                        return current_node
+                    if key < current_node.key:
+                        current_node = current_node._left
+                    else:
+                        current_node = current_node._right
             except TypeError:
                 raise(TypeError('Node values must be the same type'))
+            return False
+
+    def range(self, low, high, inclusive=(True, True)):
+        """Returns a generator of the values between low and high in order.
+        inclusive is a pair saying whether low and high themselves count.
+        Only subtrees that can hold matching values are visited, so this
+        costs O(log n + k) for k results."""
+        return (node.val for node in self._range(low, high, inclusive))
+
+    def _range(self, low, high, inclusive):
+        """Helper generator to range, yields the matching nodes."""
+        low_inclusive, high_inclusive = inclusive
+        low = self._key_of(low)
+        high = self._key_of(high)
+        stack = []
+        current = self.root
+        while stack or current is not None:
+            if current is not None:
+                if current.key < low or (
+                        not low_inclusive and current.key == low):
+                    current = current._right
+                else:
+                    stack.append(current)
+                    current = current._left
+            else:
+                current = stack.pop()
+                if current.key > high or (
+                        not high_inclusive and current.key == high):
+                    return
+                if current.data is not _DELETED:
+                    yield current
+                current = current._right
+
+    def floor(self, val):
+        """Returns the largest value in the BST that is <= val, or None."""
+        return self._neighbour_val(val, True, True)
+
+    def ceiling(self, val):
+        """Returns the smallest value in the BST that is >= val, or None."""
+        return self._neighbour_val(val, False, True)
+
+    def predecessor(self, val):
+        """Returns the largest value in the BST that is < val, or None."""
+        return self._neighbour_val(val, True, False)
+
+    def successor(self, val):
+        """Returns the smallest value in the BST that is > val, or None."""
+        return self._neighbour_val(val, False, False)
+
+    def _neighbour_val(self, val, below, inclusive):
+        """Helper method to floor, ceiling, predecessor and successor."""
+        node = self._neighbour(val, below, inclusive)
+        return node.val if node else None
+
+    def _neighbour(self, val, below, inclusive):
+        """Returns the closest node below (or above) val, or val's own node
+        if inclusive, with a single root-to-leaf descent.  The candidates
+        passed on the way are kept, closest last, so if the closest is a
+        tombstone the search carries on in order from there."""
+        candidates = []
+        key = self._key_of(val)
+        current = self.root
+        try:
+            while current is not None:
+                if inclusive and key == current.key and \
+                        current.data is not _DELETED:
+                    return current
+                if below:
+                    if current.key < key:
+                        candidates.append(current)
+                        current = current._right
+                    else:
+                        current = current._left
+                else:
+                    if key < current.key:
+                        candidates.append(current)
+                        current = current._left
+                    else:
+                        current = current._right
+        except TypeError:
+            raise(TypeError('Node values must be the same type'))
+        while candidates:
+            current = candidates.pop()
+            if current.data is not _DELETED:
+                return current
+            current = current._left if below else current._right
+            while current is not None:
+                candidates.append(current)
+                current = current._right if below else current._left
+        return None
+
+    def rank(self, val):
+        """Returns how many values in the BST are smaller than val, in
+        O(log n) using the subtree live counts."""
+        return self._rank(val, False)
+
+    def _rank(self, val, inclusive):
+        """Helper method to rank, also counts val itself if it's in the BST
+        and inclusive is True."""
+        count = 0
+        key = self._key_of(val)
+        current = self.root
+        try:
+            while current is not None:
+                if key < current.key:
+                    current = current._left
+                    continue
+                left_live = current._left.live if current._left else 0
+                alive = 0 if current.data is _DELETED else 1
+                if key == current.key:
+                    return count + left_live + (alive if inclusive else 0)
+                count += left_live + alive
+                current = current._right
+        except TypeError:
+            raise(TypeError('Node values must be the same type'))
+        return count
+
+    def select(self, index):
+        """Returns the value at position index of the sorted values, zero
+        based, in O(log n).  Negative indexes count back from the end."""
+        if index < 0:
+            index += self.length
+        if index < 0 or index >= self.length:
+            raise IndexError('Select index out of range.')
+        current = self.root
+        while True:
+            left_live = current._left.live if current._left else 0
+            alive = current.data is not _DELETED
+            if index < left_live:
+                current = current._left
+            elif index == left_live and alive:
+                return current.val
+            else:
+                index -= left_live + (1 if alive else 0)
+                current = current._right
+
+    def count_range(self, low, high):
+        """Returns how many values v in the BST satisfy low <= v <= high."""
+        if self._key_of(high) < self._key_of(low):
+            return 0
+        return self._rank(high, True) - self._rank(low, False)
+
+    def aggregate(self, low, high, inclusive=(True, True)):
+        """Returns the monoid's summary of the values between low and high,
+        with inclusive as for range.  Whole subtrees inside the bounds are
+        taken from their stored summaries, so this is O(log n) however
+        many values match.  Raises ValueError if the tree has no
+        monoid."""
+        if self.monoid is None:
+            raise ValueError('aggregate needs a Tree made with a monoid.')
+        try:
+            return self._aggregate(self.root, self._key_of(low),
+                                   self._key_of(high), inclusive)
+        except TypeError:
+            raise(TypeError('Node values must be the same type'))
+
+    def _aggregate(self, node, low, high, inclusive):
+        """Helper method to aggregate, summarizes the values of the subtree
+        at node between keys low and high, where None means the subtree
+        has no bound on that side."""
+        monoid = self.monoid
+        while node is not None:
+            if low is None and high is None:
+                return node.agg
+            if low is not None and (node.key < low or (
+                    not inclusive[0] and node.key == low)):
+                node = node._right
+            elif high is not None and (node.key > high or (
+                    not inclusive[1] and node.key == high)):
+                node = node._left
+            else:
+                agg = monoid.combine(
+                    self._aggregate(node._left, low, None, inclusive),
+                    self._lift(node))
+                return monoid.combine(
+                    agg, self._aggregate(node._right, None, high, inclusive))
+        return monoid.identity
+
+    def percentile(self, percent):
+        """Returns the nearest-rank percentile of the values in the BST,
+        where percent is between 0 and 100."""
+        if percent < 0 or percent > 100:
+            raise ValueError('Percentile must be between 0 and 100.')
+        if self.length == 0:
+            raise IndexError("You can't take a percentile of an empty Tree.")
+        index = int(math.ceil(percent / 100.0 * self.length)) - 1
+        return self.select(max(index, 0))
+
+    def split(self, val):
+        """Splits the BST into two new trees, one holding the values smaller
+        than val and one holding the rest, and returns them as a (left,
+        right) pair in O(log n).  This tree is left as it was: the new
+        trees share its nodes the way a snapshot does, and only the nodes
+        on the split path are copied."""
+        key = self._key_of(val)
+        work = self._derive()
+        left, found, right = work._split(self.root, key)
+        if found is not None:
+            right = work._join(None, found, right)
+        return work._wrap_root(left), work._wrap_root(right)
+
+    @classmethod
+    def join(cls, left, right):
+        """Joins two trees where every value in left is smaller than every
+        value in right into one new tree in O(log n).  Both trees are left
+        as they were, see split.  Lazily deleted values still count for
+        the ordering, so compact first if those overlap."""
+        if left is right:
+            raise ValueError('join needs two different Trees.')
+        left._check_same_order(right)
+        if left.root is not None and right.root is not None:
+            if not left._end_node(True).key < right._end_node(False).key:
+                raise ValueError(
+                    'Every value in left must be smaller than right.')
+        work = left._derive(right)
+        return work._wrap_root(work._join2(left.root, right.root))
+
+    def union(self, other):
+        """Returns a new tree holding the values in either tree.  Where a
+        value is in both, this tree's node (and data) is kept.  Runs in
+        O(m log(n/m + 1)) for trees of sizes m <= n by splitting the larger
+        tree around the smaller one's nodes.  Both trees are left as they
+        were: the result shares their untouched subtrees the way a
+        snapshot does, and only the nodes it relinks are copied."""
+        return self._set_operation(other, '_union')
+
+    def intersection(self, other):
+        """Returns a new tree holding the values in both trees, with this
+        tree's data.  Both trees are left as they were, see union."""
+        return self._set_operation(other, '_intersection')
+
+    def difference(self, other):
+        """Returns a new tree holding the values in this tree but not in
+        other.  Both trees are left as they were, see union."""
+        return self._set_operation(other, '_difference')
+
+    def symmetric_difference(self, other):
+        """Returns a new tree holding the values in exactly one of the
+        trees.  Both trees are left as they were, see union."""
+        return self._set_operation(other, '_symmetric_difference')
+
+    def _set_operation(self, other, name):
+        """Helper method to the set operations, runs the named operation
+        on both roots in a tree derived from the two and wraps the
+        result."""
+        if other is self:
+            raise ValueError('Set operations need two different Trees.')
+        self._check_same_order(other)
+        work = self._derive(other)
+        return work._wrap_root(getattr(work, name)(self.root, other.root))
+
+    def _derive(self, other=None):
+        """Returns an empty tree set up like this one, for building results
+        out of this tree's nodes (and other's) without changing either.
+        Every node they have now is marked as shared, as snapshot does, so
+        the new tree copies any node before relinking it."""
+        self._share()
+        if other is not None:
+            other._share()
+        tree = self._scratch(None)
+        tree._floor = next(_clock)
+        tree._epoch = next(_clock)
+        return tree
+
+    def _check_same_order(self, other):
+        """Raises ValueError unless other orders its values the same way
+        as this tree, and keeps the same summaries."""
+        if self.key is not other.key or self.reverse != other.reverse:
+            raise ValueError('Both Trees must have the same key and '
+                             'reverse.')
+        if self.monoid is not other.monoid:
+            raise ValueError('Both Trees must have the same monoid.')
+
+    def _union(self, mine, theirs):
+        """Unions two detached subtrees, keeping mine's nodes for values in
+        both (unless mine's is a tombstone).  The smaller subtree's root is
+        used to split the larger."""
+        if mine is None:
+            return theirs
+        if theirs is None:
+            return mine
+        if mine.size <= theirs.size:
+            mine, left, right = self._detach(mine)
+            other_left, found, other_right = self._split(theirs, mine.key)
+            middle = found if found is not None and \
+                mine.data is _DELETED else mine
+        else:
+            theirs, other_left, other_right = self._detach(theirs)
+            left, found, right = self._split(mine, theirs.key)
+            middle = found if found is not None and \
+                found.data is not _DELETED else theirs
+        return self._join(self._union(left, other_left), middle,
+                          self._union(right, other_right))
+
+    def _intersection(self, mine, theirs):
+        """Intersects two detached subtrees, keeping mine's nodes."""
+        if mine is None or theirs is None:
+            return None
+        if mine.size <= theirs.size:
+            mine, left, right = self._detach(mine)
+            other_left, found, other_right = self._split(theirs, mine.key)
+            middle = mine if found is not None else None
+            other = found
+        else:
+            other_left, other_right = theirs._left, theirs._right
+            left, middle, right = self._split(mine, theirs.key)
+            other = theirs
+        left = self._intersection(left, other_left)
+        right = self._intersection(right, other_right)
+        if middle is None or middle.data is _DELETED or \
+                other.data is _DELETED:
+            return self._join2(left, right)
+        return self._join(left, middle, right)
+
+    def _difference(self, mine, theirs):
+        """Removes the values of detached subtree theirs from detached
+        subtree mine.  theirs is only read."""
+        if mine is None or theirs is None:
+            return mine
+        left, found, right = self._split(mine, theirs.key)
+        left = self._difference(left, theirs._left)
+        right = self._difference(right, theirs._right)
+        if found is not None and theirs.data is _DELETED:
+            return self._join(left, found, right)
+        return self._join2(left, right)
+
+    def _symmetric_difference(self, mine, theirs):
+        """Returns the values in exactly one of two detached subtrees."""
+        if mine is None:
+            return theirs
+        if theirs is None:
+            return mine
+        if mine.size > theirs.size:
+            mine, theirs = theirs, mine
+        mine, left, right = self._detach(mine)
+        other_left, found, other_right = self._split(theirs, mine.key)
+        left = self._symmetric_difference(left, other_left)
+        right = self._symmetric_difference(right, other_right)
+        if found is None or found.data is _DELETED:
+            return self._join(left, mine, right)
+        if mine.data is _DELETED:
+            return self._join(left, found, right)
+        return self._join2(left, right)
+
+    def _wrap_root(self, root):
+        """Returns a new tree, set up like this one, around a detached
+        subtree root."""
+        tree = self.__class__.__new__(self.__class__)
+        tree.__dict__.update(self.__dict__)
+        tree.__dict__.pop('read_only', None)
+        tree.root = root
+        tree.length = root.live if root is not None else 0
+        tree.tombstones = root.size - root.live if root is not None else 0
+        if tree.stats is not None:
+            tree.disable_stats()
+        return tree
+
+    def _scratch(self, root):
+        """Returns a tree set up like this one around detached subtree
+        root, to relink nodes in.  If this tree has stats, rotations made
+        in the new tree are counted in them too."""
+        tree = self._wrap_root(root)
+        if self.stats is not None:
+            from bst_stats import count_rotations
+            count_rotations(tree, self.stats)
+        return tree
+
+    def _end_node(self, largest):
+        """Returns the node with the smallest (or largest) value."""
+        current = self.root
+        while True:
+            child = current._right if largest else current._left
+            if child is None:
+                return current
+            current = child
+
+    def _detach(self, node):
+        """Unlinks node's children and returns a (node, left, right)
+        triple of node and its children as detached subtrees.  A node
+        shared with another tree is copied first, and the copy returned."""
+        node = self._own(node)
+        left = node._left
+        right = node._right
+        node._left = node._right = None
+        self._set_parent(left, None)
+        self._set_parent(right, None)
+        return node, left, right
+
+    def _split(self, node, key):
+        """Splits the detached subtree at node into a (smaller, found,
+        larger) triple of detached subtree roots, where found is the node
+        whose key is key or None."""
+        if node is None:
+            return None, None, None
+        node, left, right = self._detach(node)
+        try:
+            if key == node.key:
+                self._update_node(node)
+                return left, node, right
+            less = key < node.key
+        except TypeError:
+            raise(TypeError('Node values must be the same type'))
+        if less:
+            smaller, found, larger = self._split(left, key)
+            return smaller, found, self._join(larger, node, right)
+        smaller, found, larger = self._split(right, key)
+        return self._join(left, node, smaller), found, larger
+
+    def _join(self, left, middle, right):
+        """Links detached subtrees left and right, whose values are all
+        smaller and larger than detached node middle's, into one balanced
+        subtree and returns its root.  The shorter subtree is hung off the
+        taller one's spine at matching depth, then that path is retraced,
+        so this is O(difference in depth).  Shared spine nodes are copied
+        on the way down."""
+        left_depth = left.depth if left else 0
+        right_depth = right.depth if right else 0
+        if abs(left_depth - right_depth) <= 1:
+            middle._parent = None
+            middle._left = left
+            middle._right = right
+            self._set_parent(left, middle)
+            self._set_parent(right, middle)
+            self._update_node(middle)
+            return middle
+        scratch = self._scratch(None)
+        taller_left = left_depth > right_depth
+        if taller_left:
+            current = left
+            target = right_depth + 1
+        else:
+            current = right
+            target = left_depth + 1
+        scratch.root = current = self._own(current)
+        current._parent = parent = None
+        while current is not None and current.depth > target:
+            parent = current
+            current = current._right if taller_left else current._left
+            if current is not None:
+                current = scratch._thaw(current, parent)
+                current._parent = parent
+        if taller_left:
+            middle._left = current
+            middle._right = right
+            parent._right = middle
+        else:
+            middle._left = left
+            middle._right = current
+            parent._left = middle
+        middle._parent = parent
+        self._set_parent(middle._left, middle)
+        self._set_parent(middle._right, middle)
+        scratch._retrace(middle)
+        return scratch.root
+
+    def _join2(self, left, right):
+        """Joins detached subtrees left and right, where every value in left
+        is smaller, by using right's smallest node as the middle."""
+        if left is None:
+            return right
+        if right is None:
+            return left
+        scratch = self._scratch(right)
+        middle = scratch._thaw(right, None)
+        while middle._left is not None:
+            middle = scratch._thaw(middle._left, middle)
+        scratch._remove(middle)
+        return self._join(left, middle, scratch.root)
+
+    def snapshot(self):
+        """Returns a read-only copy of the tree as it is now, in O(1).  The
+        snapshot and this tree share every node: from then on each change
+        to this tree copies only the O(log n) nodes on the path it
+        touches, so the snapshot never sees it.  A reader can iterate a
+        snapshot while writers keep changing the original, with no lock.
+        Every method that would change a snapshot raises TypeError; copy
+        makes a writable copy the same way, and split, the set operations
+        and copy itself give writable trees from a snapshot.
+
+        Reads never follow parent links, which is what lets the trees share
+        nodes, and a shared node is never given a new parent, so every
+        node's parent stays right in the snapshot.  split, join and the
+        set operations share nodes with their inputs the same way."""
+        snap = self.copy()
+        snap.read_only = True
+        return snap
+
+    def copy(self):
+        """Returns a copy of the tree in O(1) that can be changed freely.
+        Like a snapshot it shares every node with this tree until one of
+        the two changes it, so neither tree ever sees the other's
+        changes."""
+        self._share()
+        tree = self._wrap_root(self.root)
+        tree._epoch = next(_clock)
+        return tree
+
+    def _check_writable(self):
+        """Raises TypeError if the tree is a read-only snapshot."""
+        if self.read_only:
+            raise TypeError('A snapshot is read-only, use copy() to get a '
+                            'writable Tree.')
+
+    def _share(self):
+        """Marks every node the tree has now as shared, so from here on the
+        tree copies a node before changing it."""
+        self._floor = next(_clock)
+        self._epoch = next(_clock)
+
+    def _thaw(self, node, parent):
+        """Returns node if this tree may change it.  Otherwise node may be
+        shared with a snapshot, so it's replaced by a copy under parent
+        (which must already be thawed, or None for the root), and the copy
+        is returned."""
+        if node._epoch >= self._floor:
+            return node
+        copy = self._own(node)
+        self._replace_child(parent, node, copy)
+        return copy
+
+    def _own(self, node):
+        """Returns node if this tree may change it, otherwise a copy of it
+        with its children's parent links pointed at the copy (those the
+        tree owns, see _set_parent).  Unlike _thaw nothing else is pointed
+        at the copy, for nodes the caller is about to relink."""
+        if node._epoch >= self._floor:
+            return node
+        copy = self._copy_node(node)
+        self._set_parent(copy._left, copy)
+        self._set_parent(copy._right, copy)
+        return copy
+
+    def _set_parent(self, node, parent):
+        """Points node's parent link at parent, unless node is None or is
+        shared with another tree, which keeps its parent link for the
+        tree it was shared from.  This tree never follows a shared node's
+        parent link: it thaws a node, which sets its parent, before
+        walking up from it."""
+        if node is not None and node._epoch >= self._floor:
+            node._parent = parent
+
+    def _copy_node(self, node):
+        """Returns a copy of node owned by this tree, with the same links
+        and bookkeeping.  The children's parent links aren't touched."""
+        copy = self._node_type(node.val, node.data, node._left,
+                               node._right, node._parent, node.key)
+        copy.depth = node.depth
+        copy.size = node.size
+        copy.live = node.live
+        copy._tag = node._tag
+        if self.monoid is not None:
+            copy.agg = node.agg
+        copy._epoch = self._epoch
+        return copy
 
     def _left_rotation(self, pivot_parent):
         """Performs a left rotation on a given section of our BST."""
         a = pivot_parent
-        b = pivot_parent.right
-        if pivot_parent.parent is None:
-            z = None
-            self.root = b
-        else:
-            z = pivot_parent.parent
-        try:
-            w = pivot_parent.right.left
-        except AttributeError:
-            w = None
-        b.left = a
-        a.right = w
-        b.parent = z
+        b = a._right
+        z = a._parent
+        w = b._left
+        a._right = w
+        self._set_parent(w, a)
+        b._left = a
+        a._parent = b
+        self._replace_child(z, a, b)
+        self._update_node(a)
+        self._update_node(b)
 
     def _right_rotation(self, pivot_parent):
         """Performs a right rotation on a given section of our BST."""
         a = pivot_parent
-        b = pivot_parent.left
-        if pivot_parent.parent is None:
-            z = None
-            self.root = b
+        b = a._left
+        z = a._parent
+        w = b._right
+        a._left = w
+        self._set_parent(w, a)
+        b._right = a
+        a._parent = b
+        self._replace_child(z, a, b)
+        self._update_node(a)
+        self._update_node(b)
+
+    def _replace_child(self, parent, old, new):
+        """Points parent's link to old (or the root, if parent is None) at
+        new instead."""
+        self._set_parent(new, parent)
+        if parent is None:
+            self.root = new
+        elif parent._left is old:
+            parent._left = new
         else:
-            z = pivot_parent.parent
-        try:
-            w = pivot_parent.left.right
-        except AttributeError:
-            w = None
-        a.left = w
-        b.right = a
-        b.parent = z
-
-    def _check_balance_and_call(self, starting_point, previous=None):
-        """Checks the balance of parents of a given node up to the root, calls
-        _determine_rotations_and_call if rotations needed."""
-        if starting_point is None:
-            return
-        bal = self.balance(starting_point)
-        if previous is None:
-            if bal > 0:
-                previous = starting_point.left
-            elif bal < 0:
-                previous = starting_point.right
-        if bal > 1:
-            self._determine_rotations_and_call(starting_point, previous)
-            return
-        if bal < -1:
-            self._determine_rotations_and_call(starting_point, previous)
-            return
-        if starting_point.parent is None:
-            return
-        self._check_balance_and_call(starting_point.parent, starting_point)
-        return
+            parent._right = new
 
     def _determine_rotations_and_call(self, starting_point, previous):
         """Determine which rotations are needed and make them."""
@@ -483,24 +1753,239 @@ class BinarySearchTree(object):
             prev_bal = 0
         if start_bal < -1:
             if prev_bal > 0:
-                self._right_rotation(starting_point.right)
+                self._thaw(previous._left, previous)
+                self._right_rotation(previous)
             self._left_rotation(starting_point)
         elif start_bal > 1:
             if prev_bal < 0:
-                self._left_rotation(starting_point.left)
+                self._thaw(previous._right, previous)
+                self._left_rotation(previous)
             self._right_rotation(starting_point)
 
-    def _update_balance(self, starting_point):
-        """Updates the balance of the BST, it's intended this will be called
-        on self.root. Recursively calls itself until there are no more
-        children to update, then resets the depth value of all nodes."""
-        if starting_point.left:
-            left_depth = self._update_balance(starting_point.left)
-        else:
-            left_depth = 0
-        if starting_point.right:
-            right_depth = self._update_balance(starting_point.right)
-        else:
-            right_depth = 0
-        starting_point.depth = max(left_depth, right_depth) + 1
-        return starting_point.depth
+    def _update_node(self, node):
+        """Recomputes the depth, subtree size and live count of a single
+        node from its children, which must already be correct."""
+        left = node._left
+        right = node._right
+        left_depth = left.depth if left else 0
+        right_depth = right.depth if right else 0
+        node.depth = max(left_depth, right_depth) + 1
+        node.size = ((left.size if left else 0) +
+                     (right.size if right else 0) + 1)
+        node.live = ((left.live if left else 0) +
+                     (right.live if right else 0) +
+                     (0 if node.data is _DELETED else 1))
+        if self.monoid is not None:
+            combine = self.monoid.combine
+            agg = self._lift(node)
+            if left is not None:
+                agg = combine(left.agg, agg)
+            if right is not None:
+                agg = combine(agg, right.agg)
+            node.agg = agg
+
+    def _lift(self, node):
+        """Returns the monoid's element for node on its own, the identity
+        for a tombstone."""
+        if node.data is _DELETED:
+            return self.monoid.identity
+        return self.monoid.lift(node.val, node.data)
+
+    def _after_insert(self, node):
+        """Rebalances after node has been linked in as a new leaf."""
+        self._retrace(node._parent, True)
+
+    def _after_remove(self, parent, child, removed):
+        """Rebalances after node removed has been unlinked from parent, with
+        child (possibly None) taking its place."""
+        self._retrace(parent)
+
+    def _refresh_path(self, starting_point):
+        """Refreshes depths and sizes from starting_point up to the root,
+        without rotating anything."""
+        current = starting_point
+        while current is not None:
+            self._update_node(current)
+            current = current._parent
+
+    def _retrace(self, starting_point, grown=False):
+        """Walks from starting_point up to the root after an insert or
+        delete, refreshing depths and sizes and rotating any node that
+        has fallen out of balance.  This touches O(log n) nodes.  After an
+        insert (grown=True) the depths above are settled as soon as a
+        node's depth comes out unchanged or a rotation restores it, so from
+        there on only sizes are refreshed, with no balance checks."""
+        current = starting_point
+        while current is not None:
+            depth = current.depth
+            self._update_node(current)
+            bal = self.balance(current)
+            if bal > 1 or bal < -1:
+                if bal > 1:
+                    previous = self._thaw(current._left, current)
+                else:
+                    previous = self._thaw(current._right, current)
+                self._determine_rotations_and_call(current, previous)
+                current = current._parent
+                if grown:
+                    break
+            elif grown and current.depth == depth:
+                break
+            current = current._parent
+        if current is not None:
+            self._refresh_path(current._parent)
+
+
+if __name__ == '__main__':
+    import random
+    import timeit
+
+    print("")
+    print("Binary Search Tree")
+    print("")
+    print("Sequential inserts are the worst case for an unbalanced tree.  Each")
+    print("insert below only touches the path from the new leaf to the root,")
+    print("so time per key should grow with log(n), not n.")
+    print("")
+    for n in (10 ** 3, 10 ** 4, 10 ** 5, 10 ** 6):
+        result = timeit.timeit(
+            'for i in range({}): tree.insert(i)'.format(n),
+            setup='from __main__ import BinarySearchTree; '
+                  'tree = BinarySearchTree()',
+            number=1)
+        print("Input: {} sequential ints".format(n))
+        print("Total elapsed time: ", result)
+        print("Average time per insert: ", result / n)
+        print("")
+    print("Bulk loading builds the same keys without any rotations.")
+    print("")
+    for n in (10 ** 3, 10 ** 4, 10 ** 5, 10 ** 6):
+        result = timeit.timeit(
+            'BinarySearchTree.from_sorted(range({}))'.format(n),
+            setup='from __main__ import BinarySearchTree',
+            number=1)
+        print("Input: {} sorted ints".format(n))
+        print("Total elapsed time: ", result)
+        print("Average time per key: ", result / n)
+        print("")
+    print("Memory per key.  Nodes use __slots__, so each one is a single")
+    print("fixed-size object with no per-instance __dict__.")
+    print("")
+    node_bytes = sys.getsizeof(Node(0))
+    print("Bytes per Node object: ", node_bytes)
+    try:
+        import tracemalloc
+    except ImportError:
+        tracemalloc = None
+    if tracemalloc is not None:
+        n = 10 ** 5
+        keys = list(range(n))
+        tracemalloc.start()
+        before = tracemalloc.get_traced_memory()[0]
+        tree = BinarySearchTree.from_sorted(keys)
+        after = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        print("Input: {} ints, keys allocated beforehand".format(n))
+        print("Tree bytes per key: ", (after - before) / float(n))
+    print("")
+    print("Merging a small shard into a large one.  union splits the large")
+    print("tree around the small one's nodes instead of inserting per key.")
+    print("")
+    n = 10 ** 5
+    for m in (10, 10 ** 3, 10 ** 5):
+        setup = ('from __main__ import BinarySearchTree; '
+                 'big = BinarySearchTree.from_sorted(range(0, {0} * 2, 2)); '
+                 'small = BinarySearchTree.from_sorted(range(1, {1} * 2, 2))'
+                 ).format(n, m)
+        union = timeit.timeit('big.union(small)', setup=setup, number=1)
+        inserts = timeit.timeit('for val in small: big.insert(val)',
+                                setup=setup, number=1)
+        print("Input: {} keys into {} keys".format(m, n))
+        print("union elapsed time: ", union)
+        print("insert per key elapsed time: ", inserts)
+        print("")
+    print("Checkpointing.  dump writes the pre-order values and a byte of")
+    print("shape per node, and load relinks them in O(n) with no comparisons.")
+    print("")
+    import io
+    n = 10 ** 5
+    tree = BinarySearchTree()
+    for num in range(n):
+        tree.insert(num)
+    stream = io.BytesIO()
+    dump = timeit.timeit(lambda: tree.dump(stream), number=1)
+    size = len(stream.getvalue())
+    load = timeit.timeit(lambda: BinarySearchTree.load(
+        io.BytesIO(stream.getvalue())), number=1)
+    pickled = pickle.dumps(tree, pickle.HIGHEST_PROTOCOL)
+    unpickle = timeit.timeit(lambda: pickle.loads(pickled), number=1)
+    reinsert = timeit.timeit(
+        'copy = BinarySearchTree()\nfor val in tree.pre_order(): '
+        'copy.insert(val)',
+        setup='from __main__ import BinarySearchTree, tree', number=1)
+    print("Input: {} ints".format(n))
+    print("dump elapsed time: ", dump)
+    print("load elapsed time: ", load)
+    print("Dump bytes: ", size)
+    print("pickle.loads elapsed time: ", unpickle)
+    print("Pickle bytes: ", len(pickled))
+    print("Re-inserting elapsed time: ", reinsert)
+    print("")
+    print("Batches.  insert_many sorts the batch once and unions it in, and")
+    print("contains_many walks the sorted batch with a finger search.")
+    print("")
+    n = 10 ** 5
+    for m in (10 ** 3, 10 ** 5):
+        batch = random.sample(range(1, n * 2, 2), m)
+        setup = ('from __main__ import BinarySearchTree, batch; '
+                 'tree = BinarySearchTree.from_sorted(range(0, {0} * 2, 2))'
+                 ).format(n)
+        many = timeit.timeit('tree.insert_many(batch)', setup=setup,
+                             number=1)
+        inserts = timeit.timeit('for val in batch: tree.insert(val)',
+                                setup=setup, number=1)
+        batch.sort()
+        found_many = timeit.timeit('tree.contains_many(batch)',
+                                   setup=setup, number=1)
+        found = timeit.timeit('[tree.contains(val) for val in batch]',
+                              setup=setup, number=1)
+        print("Input: {} keys against {} keys".format(m, n))
+        print("insert_many elapsed time: ", many)
+        print("insert per key elapsed time: ", inserts)
+        print("contains_many elapsed time: ", found_many)
+        print("contains per key elapsed time: ", found)
+        print("")
+    print("Eviction.  lazy_delete only marks nodes, and the tree is rebuilt")
+    print("once tombstones pass compact_ratio of the nodes.")
+    print("")
+    n = 10 ** 5
+    evicted = random.sample(range(n), n // 2)
+    setup = ('from __main__ import BinarySearchTree, evicted; '
+             'tree = BinarySearchTree.from_sorted(range({0}))').format(n)
+    deletes = timeit.timeit('for val in evicted: tree.delete(val)',
+                            setup=setup, number=1)
+    lazy = timeit.timeit('for val in evicted: tree.lazy_delete(val)',
+                         setup=setup, number=1)
+    print("Input: {} of {} keys deleted".format(len(evicted), n))
+    print("delete elapsed time: ", deletes)
+    print("lazy_delete elapsed time: ", lazy)
+    print("")
+    print("Rolling sums.  With monoid=SUM each node keeps its subtree's sum,")
+    print("so aggregate reads O(log n) sums instead of walking the window.")
+    print("")
+    n = 10 ** 5
+    window = 10 ** 4
+    tree = BinarySearchTree(monoid=SUM)
+    for num in random.sample(range(n), n):
+        tree.insert(num)
+    starts = [random.randrange(n - window) for _ in range(100)]
+    aggregate = timeit.timeit(
+        lambda: [tree.aggregate(start, start + window) for start in starts],
+        number=1)
+    walk = timeit.timeit(
+        lambda: [sum(tree.range(start, start + window)) for start in starts],
+        number=1)
+    print("Input: {} windows of {} over {} keys".format(len(starts), window,
+                                                        n))
+    print("aggregate elapsed time: ", aggregate)
+    print("range and sum elapsed time: ", walk)
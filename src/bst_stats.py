@@ -0,0 +1,254 @@
+# -*- coding: utf-8 -*-
+"""File implements opt-in instrumentation for BinarySearchTree.
+
+BinarySearchTree.enable_stats hands a tree to instrument, which sets
+wrappers on that one tree's instance: around its insert, lookup and delete
+helpers, its rotations, its _new_node, and the function that turns a
+value into its sort key.  Keys made while stats are on are wrapped so
+every comparison a descent makes against them is counted, and the distinct
+nodes they're compared with are the nodes visited.  Nothing is set on the
+class, so trees without stats don't pay anything.
+
+split, join, the set operations and insert_many relink nodes in scratch
+trees, which get counting rotation wrappers of their own when the tree
+they work for has stats."""
+from __future__ import unicode_literals
+from collections import deque
+import time
+
+import bst
+
+OPERATIONS = {
+    'insert': '_insert',
+    'lookup': '_find_node',
+    'delete': '_delete',
+}
+WRITES = ('insert', 'delete')
+
+
+class _Counted(object):
+    """Wraps the key being searched for, counting each comparison made
+    against it, and each new node it's compared with as a visit."""
+
+    __slots__ = ('key', 'stats', 'last')
+
+    def __init__(self, key, stats):
+        """Wraps key for stats."""
+        self.key = key
+        self.stats = stats
+        self.last = None
+
+    def _note(self, other):
+        """Counts a comparison with other, returns the plain key to compare
+        against."""
+        if type(other) is _Counted:
+            other = other.key
+        stats = self.stats
+        stats.comparisons += 1
+        if other is not self.last:
+            self.last = other
+            stats._visits += 1
+        return other
+
+    def __eq__(self, other):
+        return self.key == self._note(other)
+
+    def __ne__(self, other):
+        return self.key != self._note(other)
+
+    def __lt__(self, other):
+        return self.key < self._note(other)
+
+    def __gt__(self, other):
+        return self.key > self._note(other)
+
+    def __le__(self, other):
+        return self.key <= self._note(other)
+
+    def __ge__(self, other):
+        return self.key >= self._note(other)
+
+    def __hash__(self):
+        return hash(self.key)
+
+
+class TreeStats(object):
+    """TreeStats holds the counters for one instrumented tree.
+
+    operations counts calls of each of insert, lookup and delete, visits
+    maps each of those to a histogram of nodes visited per call, and
+    timings (when timing is on) to a histogram of calls per power of two
+    microseconds.  comparisons and rotations are running totals, and
+    heights keeps the last `history` (write number, height) samples, one
+    per insert or delete."""
+
+    def __init__(self, timing=False, history=1000):
+        """Creates empty counters."""
+        self.timing = timing
+        self.history = history
+        self.reset()
+
+    def reset(self):
+        """Zeroes every counter."""
+        self.operations = dict((name, 0) for name in OPERATIONS)
+        self.visits = dict((name, {}) for name in OPERATIONS)
+        self.timings = dict((name, {}) for name in OPERATIONS)
+        self.comparisons = 0
+        self.rotations = 0
+        self.writes = 0
+        self.max_height = 0
+        self.heights = deque(maxlen=self.history)
+        self._visits = 0
+
+    def mean_visits(self, operation):
+        """Returns the average number of nodes visited per call of
+        operation, or 0.0 if there weren't any."""
+        histogram = self.visits[operation]
+        calls = sum(histogram.values())
+        if not calls:
+            return 0.0
+        return sum(visits * count for visits, count in histogram.items()) \
+            / float(calls)
+
+    def height_ratio(self, tree):
+        """Returns tree's height over the least height its size allows,
+        1.0 for a perfectly balanced tree.  AVL trees stay below about
+        1.44, so a rising ratio flags a degenerate workload."""
+        if tree.length == 0:
+            return 1.0
+        return tree.depth() / float(tree.length.bit_length())
+
+    def summary(self):
+        """Returns the counters as a plain dict, e.g. for logging."""
+        return {
+            'operations': dict(self.operations),
+            'mean_visits': dict((name, self.mean_visits(name))
+                                for name in OPERATIONS),
+            'comparisons': self.comparisons,
+            'rotations': self.rotations,
+            'max_height': self.max_height,
+            'height': self.heights[-1][1] if self.heights else 0,
+        }
+
+    def _record(self, operation, tree, elapsed):
+        """Files the visits (and time) of the call that just finished."""
+        self.operations[operation] += 1
+        histogram = self.visits[operation]
+        histogram[self._visits] = histogram.get(self._visits, 0) + 1
+        if elapsed is not None:
+            bucket = 1
+            micros = elapsed * 1e6
+            while bucket < micros:
+                bucket *= 2
+            histogram = self.timings[operation]
+            histogram[bucket] = histogram.get(bucket, 0) + 1
+        if operation in WRITES:
+            self.writes += 1
+            height = tree.root.depth if tree.root is not None else 0
+            self.max_height = max(self.max_height, height)
+            self.heights.append((self.writes, height))
+
+
+def _wrap_operation(tree, stats, operation, method):
+    """Returns a wrapper for a bound method that records each call as one
+    operation."""
+    timer = time.perf_counter if hasattr(time, 'perf_counter') \
+        else time.time
+
+    def wrapper(*args):
+        stats._visits = 0
+        if stats.timing:
+            start = timer()
+            result = method(*args)
+            stats._record(operation, tree, timer() - start)
+        else:
+            result = method(*args)
+            stats._record(operation, tree, None)
+        return result
+    return wrapper
+
+
+def _wrap_rotation(stats, method):
+    """Returns a wrapper for a rotation that counts it."""
+    def wrapper(pivot):
+        stats.rotations += 1
+        return method(pivot)
+    return wrapper
+
+
+def instrument(tree, timing=False, history=1000):
+    """Sets counting wrappers on tree and returns its new TreeStats, see
+    BinarySearchTree.enable_stats."""
+    stats = TreeStats(timing, history)
+    for operation, name in OPERATIONS.items():
+        setattr(tree, name, _wrap_operation(tree, stats, operation,
+                                            getattr(tree, name)))
+    count_rotations(tree, stats)
+    sort_key = tree._sort_key
+    if sort_key is None:
+        tree._sort_key = lambda val: _Counted(val, stats)
+    else:
+        tree._sort_key = lambda val: _Counted(sort_key(val), stats)
+    new_node = tree._new_node
+
+    def unwrapping_new_node(val, data, parent, key):
+        if type(key) is _Counted:
+            key = key.key
+        return new_node(val, data, parent, key)
+    tree._new_node = unwrapping_new_node
+    tree.stats = stats
+    return stats
+
+
+def count_rotations(tree, stats):
+    """Sets wrappers on tree that count its rotations into stats, and sets
+    it as tree.stats.  Used on scratch trees relinking nodes on behalf of
+    an instrumented tree; uninstrument removes them the same way."""
+    for name in ('_left_rotation', '_right_rotation'):
+        setattr(tree, name, _wrap_rotation(stats, getattr(tree, name)))
+    tree.stats = stats
+
+
+def uninstrument(tree):
+    """Removes the wrappers instrument set on tree, returns its stats or
+    None."""
+    stats = tree.__dict__.pop('stats', None)
+    if stats is None:
+        return None
+    for name in list(OPERATIONS.values()) + ['_left_rotation',
+                                             '_right_rotation', '_new_node']:
+        tree.__dict__.pop(name, None)
+    tree._sort_key = bst._sort_key(tree.key, tree.reverse)
+    return stats
+
+
+if __name__ == '__main__':
+    import random
+    import timeit
+
+    print("")
+    print("Tree Stats")
+    print("")
+    print("Insert and lookup time for random ints with stats off, on, and on")
+    print("with timing, then the counters for the last run.")
+    print("")
+    n = 10 ** 5
+    keys = random.sample(range(n * 10), n)
+    for label, options in (('off', None), ('on', {}),
+                           ('on with timing', {'timing': True})):
+        tree = bst.BinarySearchTree()
+        if options is not None:
+            stats = tree.enable_stats(**options)
+        insert = timeit.timeit('for key in keys: tree.insert(key)',
+                               setup='from __main__ import keys, tree',
+                               number=1)
+        lookup = timeit.timeit('for key in keys: tree.contains(key)',
+                               setup='from __main__ import keys, tree',
+                               number=1)
+        print("Stats {}".format(label))
+        print("Insert elapsed time: ", insert)
+        print("Lookup elapsed time: ", lookup)
+        print("")
+    print(stats.summary())
+    print("Insert time histogram (us: calls): ",
+          sorted(stats.timings['insert'].items()))
@@ -0,0 +1,362 @@
+# -*- coding: utf-8 -*-
+"""File implements an in-memory B+ tree with the BinarySearchTree API.
+
+Every node holds a sorted list of up to `order` keys that is searched with
+bisect, so a lookup makes one Python level hop per level of a tree that is
+only log base order/2 of n deep, instead of one per comparison.  Values
+(and their data) live only in the leaves, which are linked both ways so
+in-order and range scans walk the leaves without climbing back up."""
+from __future__ import unicode_literals
+from bisect import bisect_left, bisect_right
+
+
+class _Leaf(object):
+    """A leaf holds sorted values and their data, and links to its
+    neighbouring leaves."""
+
+    __slots__ = ('keys', 'data', 'next', 'prev')
+
+    def __init__(self, keys=None, data=None):
+        """Creates a leaf holding keys and their matching data."""
+        self.keys = keys if keys is not None else []
+        self.data = data if data is not None else []
+        self.next = None
+        self.prev = None
+
+
+class _Branch(object):
+    """An internal node, children[i] holds the values below keys[i] and
+    children[i + 1] the values from keys[i] up."""
+
+    __slots__ = ('keys', 'children')
+
+    def __init__(self, keys, children):
+        """Creates an internal node with separator keys and children."""
+        self.keys = keys
+        self.children = children
+
+
+class BTree(object):
+    """BTree implements an ordered container over a B+ tree, with the same
+    methods as our Binary Search Tree.  order is the most keys a node may
+    hold."""
+
+    def __init__(self, root=None, order=64):
+        """Create an instance of our B+ tree w/ supplied input, or an empty
+        tree."""
+        if order < 3:
+            raise ValueError('A BTree order must be at least 3.')
+        self.order = order
+        self.root = _Leaf()
+        self.length = 0
+        if root is not None:
+            self.insert(root)
+
+    def insert(self, val, data=None):
+        """Inserts a value into the tree.  If the value is already in the
+        tree it will be ignored."""
+        self._insert(val, data, False)
+
+    def __setitem__(self, val, data):
+        """Stores data with val, inserting val if it isn't in the tree."""
+        self._insert(val, data, True)
+
+    def _insert(self, val, data, replace):
+        """Helper method to insert and __setitem__, splits the root if it
+        overflows."""
+        try:
+            split = self._insert_into(self.root, val, data, replace)
+        except TypeError:
+            raise(TypeError('Insert values must be the same type'))
+        if split is not None:
+            separator, right = split
+            self.root = _Branch([separator], [self.root, right])
+
+    def _insert_into(self, node, val, data, replace):
+        """Inserts val under node and returns a (separator, new right
+        sibling) pair if node had to split, or None."""
+        if isinstance(node, _Leaf):
+            index = bisect_left(node.keys, val)
+            if index < len(node.keys) and node.keys[index] == val:
+                if replace:
+                    node.data[index] = data
+                return None
+            node.keys.insert(index, val)
+            node.data.insert(index, data)
+            self.length += 1
+            if len(node.keys) <= self.order:
+                return None
+            return self._split_leaf(node)
+        index = bisect_right(node.keys, val)
+        split = self._insert_into(node.children[index], val, data, replace)
+        if split is None:
+            return None
+        separator, right = split
+        node.keys.insert(index, separator)
+        node.children.insert(index + 1, right)
+        if len(node.keys) <= self.order:
+            return None
+        middle = len(node.keys) // 2
+        separator = node.keys[middle]
+        right = _Branch(node.keys[middle + 1:], node.children[middle + 1:])
+        del node.keys[middle:]
+        del node.children[middle + 1:]
+        return separator, right
+
+    def _split_leaf(self, leaf):
+        """Moves the top half of an overflowing leaf into a new leaf and
+        returns the (separator, new leaf) pair."""
+        middle = len(leaf.keys) // 2
+        right = _Leaf(leaf.keys[middle:], leaf.data[middle:])
+        del leaf.keys[middle:]
+        del leaf.data[middle:]
+        right.next = leaf.next
+        right.prev = leaf
+        if leaf.next is not None:
+            leaf.next.prev = right
+        leaf.next = right
+        return right.keys[0], right
+
+    def _find_leaf(self, val):
+        """Returns the leaf val is in, or would go in."""
+        node = self.root
+        try:
+            while not isinstance(node, _Leaf):
+                node = node.children[bisect_right(node.keys, val)]
+        except TypeError:
+            raise(TypeError('Node values must be the same type'))
+        return node
+
+    def _locate(self, val):
+        """Returns a (leaf, index) pair for val, with index None if val
+        isn't in the tree."""
+        leaf = self._find_leaf(val)
+        index = bisect_left(leaf.keys, val)
+        if index < len(leaf.keys) and leaf.keys[index] == val:
+            return leaf, index
+        return leaf, None
+
+    def contains(self, val):
+        """Will return True if val is in the tree, or False if it's not."""
+        return self._locate(val)[1] is not None
+
+    def __contains__(self, val):
+        """Lets us say 'val in tree'."""
+        return self.contains(val)
+
+    def __getitem__(self, val):
+        """Returns the data stored with val, raises KeyError if val isn't
+        in the tree."""
+        leaf, index = self._locate(val)
+        if index is None:
+            raise KeyError(val)
+        return leaf.data[index]
+
+    def get(self, val, default=None):
+        """Returns the data stored with val, or default if val isn't in the
+        tree."""
+        leaf, index = self._locate(val)
+        if index is None:
+            return default
+        return leaf.data[index]
+
+    def size(self):
+        """Will return the integer size of the tree, zero if empty."""
+        return self.length
+
+    def __len__(self):
+        """Returns size of tree using builtin length method."""
+        return self.length
+
+    def depth(self):
+        """Will return the number of levels in the tree, 0 if empty."""
+        if self.length == 0:
+            return 0
+        levels = 1
+        node = self.root
+        while not isinstance(node, _Leaf):
+            node = node.children[0]
+            levels += 1
+        return levels
+
+    def __iter__(self):
+        """Iterates over the values of the tree in order."""
+        return self._scan(self._end_leaf(False), 0, None, True)
+
+    def in_order(self, reverse=False):
+        """
+        This function will return a generator that will return the values
+        of the tree in order, one value at a time, by walking the linked
+        leaves.  With reverse=True the values come out largest first.
+        """
+        if self.length == 0:
+            raise IndexError("You can't in-order traverse an empty Tree.")
+        if reverse:
+            return self._scan_back(self._end_leaf(True))
+        return iter(self)
+
+    def items(self):
+        """Returns a generator of (value, data) pairs in value order."""
+        leaf = self._end_leaf(False)
+        while leaf is not None:
+            for pair in zip(leaf.keys, leaf.data):
+                yield pair
+            leaf = leaf.next
+
+    def range(self, low, high, inclusive=(True, True)):
+        """Returns a generator of the values between low and high in order.
+        inclusive is a pair saying whether low and high themselves count.
+        One descent finds the first leaf, then the scan follows the leaf
+        links, so this costs O(log n + k) for k results."""
+        low_inclusive, high_inclusive = inclusive
+        leaf = self._find_leaf(low)
+        if low_inclusive:
+            index = bisect_left(leaf.keys, low)
+        else:
+            index = bisect_right(leaf.keys, low)
+        return self._scan(leaf, index, high, high_inclusive)
+
+    def _scan(self, leaf, index, high, high_inclusive):
+        """Generator of values from leaf.keys[index] onward, stopping at
+        high if it isn't None."""
+        while leaf is not None:
+            keys = leaf.keys
+            if high is not None and keys:
+                if high_inclusive:
+                    stop = bisect_right(keys, high, index)
+                else:
+                    stop = bisect_left(keys, high, index)
+                for position in range(index, stop):
+                    yield keys[position]
+                if stop < len(keys):
+                    return
+            else:
+                for position in range(index, len(keys)):
+                    yield keys[position]
+            leaf = leaf.next
+            index = 0
+
+    def _scan_back(self, leaf):
+        """Generator of every value from leaf backwards."""
+        while leaf is not None:
+            for position in range(len(leaf.keys) - 1, -1, -1):
+                yield leaf.keys[position]
+            leaf = leaf.prev
+
+    def _end_leaf(self, last):
+        """Returns the first (or last) leaf."""
+        node = self.root
+        while not isinstance(node, _Leaf):
+            node = node.children[-1 if last else 0]
+        return node
+
+    def delete(self, val):
+        """Removes val from the tree, returns None.  Nodes that fall below
+        half full borrow from a neighbour or merge with it."""
+        try:
+            self._delete_from(self.root, val)
+        except TypeError:
+            raise(TypeError('Node values must be the same type'))
+        if isinstance(self.root, _Branch) and len(self.root.children) == 1:
+            self.root = self.root.children[0]
+
+    def __delitem__(self, val):
+        """Removes val and its data, raises KeyError if val isn't in the
+        tree."""
+        if not self.contains(val):
+            raise KeyError(val)
+        self.delete(val)
+
+    def _delete_from(self, node, val):
+        """Removes val from under node, then repairs the child it came from
+        if that child underflowed."""
+        if isinstance(node, _Leaf):
+            index = bisect_left(node.keys, val)
+            if index < len(node.keys) and node.keys[index] == val:
+                del node.keys[index]
+                del node.data[index]
+                self.length -= 1
+            return
+        index = bisect_right(node.keys, val)
+        child = node.children[index]
+        self._delete_from(child, val)
+        if len(child.keys) < self.order // 2:
+            self._repair(node, index)
+
+    def _repair(self, parent, index):
+        """Refills parent.children[index] from a sibling with keys to
+        spare, or merges it with a sibling."""
+        child = parent.children[index]
+        left = parent.children[index - 1] if index > 0 else None
+        right = parent.children[index + 1] \
+            if index + 1 < len(parent.children) else None
+        minimum = self.order // 2
+        if left is not None and len(left.keys) > minimum:
+            if isinstance(child, _Leaf):
+                child.keys.insert(0, left.keys.pop())
+                child.data.insert(0, left.data.pop())
+                parent.keys[index - 1] = child.keys[0]
+            else:
+                child.keys.insert(0, parent.keys[index - 1])
+                child.children.insert(0, left.children.pop())
+                parent.keys[index - 1] = left.keys.pop()
+        elif right is not None and len(right.keys) > minimum:
+            if isinstance(child, _Leaf):
+                child.keys.append(right.keys.pop(0))
+                child.data.append(right.data.pop(0))
+                parent.keys[index] = right.keys[0]
+            else:
+                child.keys.append(parent.keys[index])
+                child.children.append(right.children.pop(0))
+                parent.keys[index] = right.keys.pop(0)
+        elif left is not None:
+            self._merge(parent, index - 1)
+        elif right is not None:
+            self._merge(parent, index)
+
+    def _merge(self, parent, index):
+        """Merges parent.children[index + 1] into parent.children[index]."""
+        left = parent.children[index]
+        right = parent.children[index + 1]
+        if isinstance(left, _Leaf):
+            left.keys.extend(right.keys)
+            left.data.extend(right.data)
+            left.next = right.next
+            if right.next is not None:
+                right.next.prev = left
+        else:
+            left.keys.append(parent.keys[index])
+            left.keys.extend(right.keys)
+            left.children.extend(right.children)
+        del parent.keys[index]
+        del parent.children[index + 1]
+
+
+if __name__ == '__main__':
+    import random
+    import timeit
+    from bst import BinarySearchTree
+
+    print("")
+    print("B+ Tree")
+    print("")
+    print("Lookups over the same random ints in our Binary Search Tree and in")
+    print("B+ trees of several orders.  Depth is the number of node hops a")
+    print("lookup makes.")
+    print("")
+    n = 10 ** 5
+    keys = random.sample(range(n * 10), n)
+    trees = [('BinarySearchTree', BinarySearchTree.from_iterable(keys))]
+    for order in (16, 64, 256):
+        tree = BTree(order=order)
+        for key in keys:
+            tree.insert(key)
+        trees.append(('BTree order {}'.format(order), tree))
+    for name, tree in trees:
+        result = timeit.timeit('for key in keys: tree.contains(key)',
+                               setup='from __main__ import keys, tree',
+                               number=1)
+        print(name)
+        print("Depth: ", tree.depth())
+        print("Lookups per second: ", n / result)
+        print("")
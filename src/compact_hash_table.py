@@ -0,0 +1,230 @@
+# -*- coding: utf-8 -*-
+"""File implements a hash table laid out like CPython's compact dict.
+
+The table is split in two.  Entries go into dense, parallel arrays
+(hashes, keys and values) in the order they were first set.  The
+hashing is done over a sparse index of slots, each holding the number
+of an entry, or EMPTY, or DUMMY where an entry was deleted.  The index
+is the only part sized for the load factor.  Each of its slots is a
+1, 2, 4 or 8 byte int, whichever is the smallest that can number the
+entries, so the empty room a hash table needs costs a few bytes per
+slot rather than three references.
+
+Entries keep their insertion order, so items() is a scan down the
+dense arrays.  A deleted entry's key is blanked, and the dense arrays
+are squeezed back together the next time the index is rebuilt.
+
+Probing follows CPython: each step mixes in five more high bits of the
+hash, so keys whose hashes share low bits part ways quickly.
+
+http://mail.python.org/pipermail/python-dev/2012-December/123028.html
+"""
+from array import array
+
+from hash_table import HashTable, _array_typecode
+
+EMPTY = -1
+DUMMY = -2
+PERTURB_SHIFT = 5
+HASH_SPACE = 1 << 64
+HASH_TYPECODE = _array_typecode(('Q', 'L'), 8)
+_DELETED = object()
+
+
+def _index_typecode(size):
+    """Returns the smallest array typecode that can number size entries
+    and hold EMPTY and DUMMY."""
+    for typecode in ('b', 'h', 'i', _array_typecode(('q', 'l'), 8)):
+        if typecode is not None and \
+                size <= 1 << (8 * array(str(typecode)).itemsize - 1):
+            return typecode
+    raise OverflowError('Too many slots for an array index.')
+
+
+class CompactHashTable(HashTable):
+
+    """
+    This class is a hash table with the same get, set, delete and reserve
+    functions as HashTable, that also remembers the order keys were first
+    set in, see items.  The number of index slots is always a power of
+    two, and load_factor must be below 1.  Incremental rehashing isn't
+    offered.
+    """
+
+    def __init__(self, size=8, hash_func='builtin_hash',
+                 load_factor=2.0 / 3, seed=None):
+        if not load_factor < 1:
+            raise ValueError('load_factor must be below 1')
+        size = 1 << max(size - 1, 1).bit_length()
+        super(CompactHashTable, self).__init__(size, hash_func, load_factor,
+                                               seed=seed)
+
+    def set(self, key, val):
+        """
+        This function stores the given val using the given key, replacing
+        any val already stored with it.  A new key goes after every key
+        already in the table, see items; replacing a val keeps its key's
+        place
+        """
+        hash_value = self._hash(key, HASH_SPACE)
+        slot, entry = self._lookup(key, hash_value)
+        if entry >= 0:
+            self._vals[entry] = val
+            return
+        self._index[slot] = len(self._keys)
+        self._hashes.append(hash_value)
+        self._keys.append(key)
+        self._vals.append(val)
+        self.length += 1
+        self._fill += 1
+        if self._fill > self.size * self.load_factor:
+            if self.length > self.size * self.load_factor / 2:
+                self._resize(self.size * 2)
+            else:
+                self._resize(self.size)
+
+    def get(self, key):
+        """
+        This function returns the value stored with the given key, or
+        raises KeyError if there isn't one
+        """
+        entry = self._lookup(key, self._hash(key, HASH_SPACE))[1]
+        if entry < 0:
+            raise KeyError('This key was not found in the hash table')
+        return self._vals[entry]
+
+    def delete(self, key):
+        """
+        This function removes the given key and its value, or raises
+        KeyError if it isn't in the table
+        """
+        hash_value = self._hash(key, HASH_SPACE)
+        slot, entry = self._lookup(key, hash_value)
+        if entry < 0:
+            raise KeyError('This key was not found in the hash table')
+        self._index[slot] = DUMMY
+        self._keys[entry] = _DELETED
+        self._vals[entry] = None
+        self.length -= 1
+        if self.size > self._min_size and \
+                self.length < self.size * self.load_factor / 4:
+            self._resize(max(self.size // 2, self._min_size))
+
+    def items(self):
+        """
+        This function is a generator of (key, val) pairs in the order the
+        keys were first set
+        """
+        for key, val in zip(self._keys, self._vals):
+            if key is not _DELETED:
+                yield key, val
+
+    def __iter__(self):
+        """
+        This function iterates over the keys in the order they were first
+        set
+        """
+        return (key for key in self._keys if key is not _DELETED)
+
+    def _lookup(self, key, hash_value):
+        """
+        This function returns (slot, entry) for key: entry is key's entry
+        number and slot the slot pointing at it, or entry is EMPTY and
+        slot the empty slot key would go in
+        """
+        index = self._index
+        hashes = self._hashes
+        keys = self._keys
+        mask = self.size - 1
+        perturb = hash_value
+        slot = hash_value & mask
+        while True:
+            entry = index[slot]
+            if entry == EMPTY:
+                return slot, EMPTY
+            if entry >= 0 and hashes[entry] == hash_value and \
+                    keys[entry] == key:
+                return slot, entry
+            perturb >>= PERTURB_SHIFT
+            slot = (slot * 5 + perturb + 1) & mask
+
+    def _allocate(self, size):
+        """
+        This function sets up an empty index of size slots, and no entries
+        """
+        self._index = array(str(_index_typecode(size)), [EMPTY]) * size
+        self._hashes = [] if HASH_TYPECODE is None \
+            else array(str(HASH_TYPECODE))
+        self._keys = []
+        self._vals = []
+        self._fill = 0
+
+    def _resize(self, size):
+        """
+        This function squeezes out deleted entries and rebuilds the index
+        with size slots, by the stored hashes
+        """
+        hashes = self._hashes
+        keys = self._keys
+        vals = self._vals
+        self._allocate(size)
+        self.size = size
+        mask = size - 1
+        index = self._index
+        for entry, key in enumerate(keys):
+            if key is _DELETED:
+                continue
+            hash_value = hashes[entry]
+            perturb = hash_value
+            slot = hash_value & mask
+            while index[slot] != EMPTY:
+                perturb >>= PERTURB_SHIFT
+                slot = (slot * 5 + perturb + 1) & mask
+            index[slot] = len(self._keys)
+            self._hashes.append(hash_value)
+            self._keys.append(key)
+            self._vals.append(vals[entry])
+        self._fill = len(self._keys)
+
+
+if __name__ == '__main__':
+    import timeit
+    try:
+        import tracemalloc
+    except ImportError:
+        tracemalloc = None
+
+    print("")
+    print("Compact Hash Table")
+    print("")
+    print("Set time, memory per key and a full scan of every (key, val) pair")
+    print("against the chained HashTable, both with builtin_hash.")
+    print("")
+    for n in (10 ** 5, 10 ** 6):
+        words = ['word{}'.format(num) for num in range(n)]
+        for table_type in (HashTable, CompactHashTable):
+            table = table_type(8, 'builtin_hash')
+            sets = timeit.timeit(lambda: [table.set(word, num) for num, word
+                                          in enumerate(words)], number=1)
+            gets = timeit.timeit(lambda: [table.get(word) for word in words],
+                                 number=1)
+            if table_type is HashTable:
+                scan = timeit.timeit(lambda: [pair for bucket in table._buckets
+                                              if bucket for pair in bucket],
+                                     number=1)
+            else:
+                scan = timeit.timeit(lambda: list(table.items()), number=1)
+            print("Input: {} keys, {}".format(n, table_type.__name__))
+            print("Set elapsed time: ", sets)
+            print("Get elapsed time: ", gets)
+            print("Scan elapsed time: ", scan)
+            if tracemalloc is not None:
+                tracemalloc.start()
+                table = table_type(8, 'builtin_hash')
+                for num, word in enumerate(words):
+                    table.set(word, num)
+                used = tracemalloc.get_traced_memory()[0]
+                tracemalloc.stop()
+                print("Bytes per key, including the int values: ",
+                      used / float(n))
+        print("")
@@ -0,0 +1,831 @@
+# -*- coding: utf-8 -*-
+"""File implements a disk resident B+ tree over int or float keys.
+
+The tree lives in one file of fixed size pages that is accessed through
+mmap, so opening an index only maps the file, and a page is decoded the
+first time a lookup touches it.  Decoded pages are kept in a bounded LRU
+cache and written back when they fall out of it or on flush.
+
+Writes are crash safe with a rollback journal, the same scheme SQLite
+uses: before a page that was part of the last flushed state is overwritten,
+its old bytes are appended to `<path>-journal` and synced.  flush syncs the
+file and then deletes the journal, so on open a journal left behind by a
+crash is played back, and the file comes back exactly as of the last
+flush.
+
+Every key carries a 64 bit int of data, e.g. a row offset, defaulting
+to 0."""
+from __future__ import unicode_literals
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+import mmap
+import numbers
+import os
+import struct
+import zlib
+
+PAGE_SIZE = 4096
+NONE = 0
+MAGIC = b'DBPT'
+JOURNAL_MAGIC = b'DBPJ'
+HEADER = struct.Struct(str('<4scxHIqqqq'))
+NODE = struct.Struct(str('<BxHqq'))
+JOURNAL = struct.Struct(str('<4sI'))
+RECORD = struct.Struct(str('<qI'))
+FREE, LEAF, BRANCH = 0, 1, 2
+
+
+class _Page(object):
+    """A decoded page.  values holds a leaf's data, or a branch's child
+    page numbers."""
+
+    __slots__ = ('number', 'leaf', 'keys', 'values', 'next', 'prev', 'dirty')
+
+    def __init__(self, number, leaf, keys, values, next=NONE, prev=NONE):
+        """Creates a page, next and prev link leaves (and free pages)."""
+        self.number = number
+        self.leaf = leaf
+        self.keys = keys
+        self.values = values
+        self.next = next
+        self.prev = prev
+        self.dirty = False
+
+
+def _check_item(key, typecode, val, data):
+    """Raises TypeError unless val packs with struct key and data is an
+    int.  Floats are turned away from int typecodes up front, since py27's
+    struct truncates them with only a warning."""
+    if not isinstance(data, numbers.Integral) or \
+            (typecode not in ('d', 'f') and
+             not isinstance(val, numbers.Integral)):
+        raise(TypeError('Insert values must be numbers'))
+    try:
+        key.pack(val)
+        struct.pack(str('<q'), data)
+    except struct.error:
+        raise(TypeError('Insert values must be numbers'))
+
+
+def _fsync_dir(path):
+    """Syncs the directory holding path, so a created or deleted file
+    survives a crash.  Not every platform can open a directory."""
+    try:
+        fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+class DiskBTree(object):
+    """DiskBTree implements an ordered index over a B+ tree stored in a
+    file, with the same methods as our Binary Search Tree.  typecode is
+    'q' for 64 bit int keys or 'd' for floats, order is the most keys a
+    page may hold (as many as fit by default) and cache_pages bounds how
+    many decoded pages stay in memory.  Both only apply to a new file."""
+
+    def __init__(self, path, typecode='q', order=None, cache_pages=256):
+        """Opens the index at path, creating it if it doesn't exist, and
+        rolling back any changes a crash left unflushed."""
+        self.path = path
+        self.journal_path = path + '-journal'
+        self.cache_pages = max(cache_pages, 1)
+        self._cache = OrderedDict()
+        self._journal = None
+        self._journaled = set()
+        if not os.path.exists(path) or os.path.getsize(path) == 0:
+            self._create(path, typecode, order)
+        if os.path.exists(self.journal_path):
+            self._recover()
+        self._file = open(path, 'r+b')
+        self._map = mmap.mmap(self._file.fileno(), 0)
+        header = self._map[:HEADER.size]
+        magic, typecode, order, page_size, root, pages, length, free = \
+            HEADER.unpack(header)
+        if magic != MAGIC or page_size != PAGE_SIZE:
+            self.close()
+            raise ValueError('Not a DiskBTree file.')
+        self.typecode = typecode.decode('ascii')
+        self._key = struct.Struct(str('<') + str(self.typecode))
+        self.order = order
+        self.root = root
+        self.length = length
+        self._pages = pages
+        self._committed_pages = pages
+        self._free = free
+
+    @staticmethod
+    def _max_order(typecode):
+        """Returns the most keys that fit in a page of this key type."""
+        key_size = struct.calcsize(str('<') + str(typecode))
+        return (PAGE_SIZE - NODE.size - 8) // (key_size + 8)
+
+    @classmethod
+    def _check_order(cls, typecode, order):
+        """Returns order, or the largest that fits if it's None."""
+        if typecode not in ('q', 'd'):
+            raise ValueError("typecode must be 'q' or 'd'.")
+        largest = cls._max_order(typecode)
+        if order is None:
+            return largest
+        if not 3 <= order <= largest:
+            raise ValueError(
+                'order must be between 3 and {}.'.format(largest))
+        return order
+
+    @classmethod
+    def _create(cls, path, typecode, order):
+        """Writes a new file holding just an empty root leaf."""
+        order = cls._check_order(typecode, order)
+        with open(path, 'wb') as fileobj:
+            fileobj.write(HEADER.pack(
+                MAGIC, typecode.encode('ascii'), order, PAGE_SIZE, 1, 2, 0,
+                NONE).ljust(PAGE_SIZE, b'\0'))
+            fileobj.write(NODE.pack(LEAF, 0, NONE, NONE).ljust(
+                PAGE_SIZE, b'\0'))
+            fileobj.flush()
+            os.fsync(fileobj.fileno())
+        _fsync_dir(path)
+
+    @classmethod
+    def bulk_load(cls, path, items, typecode='q', order=None,
+                  cache_pages=256):
+        """Builds a new index at path from (val, data) pairs sorted by val,
+        replacing any file there, and returns it opened.  Leaves are
+        written full and in order, one page at a time, so only the first
+        key of each leaf is held in memory.  Raises ValueError if the vals
+        aren't strictly increasing."""
+        order = cls._check_order(typecode, order)
+        key = struct.Struct(str('<') + str(typecode))
+        for stale in (path, path + '-journal'):
+            if os.path.exists(stale):
+                os.remove(stale)
+        try:
+            with open(path, 'wb') as fileobj:
+                fileobj.write(b'\0' * PAGE_SIZE)
+                root, pages, length = cls._load_pages(fileobj, items, key,
+                                                      typecode, order)
+                fileobj.flush()
+                os.fsync(fileobj.fileno())
+                fileobj.seek(0)
+                fileobj.write(HEADER.pack(
+                    MAGIC, typecode.encode('ascii'), order, PAGE_SIZE, root,
+                    pages, length, NONE))
+                fileobj.flush()
+                os.fsync(fileobj.fileno())
+        except Exception:
+            os.remove(path)
+            raise
+        _fsync_dir(path)
+        return cls(path, cache_pages=cache_pages)
+
+    @staticmethod
+    def _load_pages(fileobj, items, key, typecode, order):
+        """Helper method to bulk_load, writes the pages after the header.
+        Returns (root, page count, length)."""
+        builder = _Loader(fileobj, typecode, order)
+        last = None
+        leaf = ([], [])
+        for val, data in items:
+            _check_item(key, typecode, val, data)
+            try:
+                increasing = last is None or last < val
+            except TypeError:
+                raise(TypeError('Insert values must be numbers'))
+            if not increasing:
+                raise ValueError('bulk_load needs strictly increasing '
+                                 'values.')
+            last = val
+            if len(leaf[0]) == order:
+                builder.add_leaf(*leaf)
+                leaf = ([], [])
+            leaf[0].append(val)
+            leaf[1].append(data)
+        builder.add_leaf(*leaf)
+        return builder.finish()
+
+    def _recover(self):
+        """Plays a journal left by a crash back into the file, then
+        deletes it.  A record torn by the crash was never followed by a
+        write to the file, so reading stops at the first bad one."""
+        with open(self.journal_path, 'rb') as journal, \
+                open(self.path, 'r+b') as fileobj:
+            header = journal.read(JOURNAL.size)
+            if len(header) == JOURNAL.size and \
+                    JOURNAL.unpack(header) == (JOURNAL_MAGIC, PAGE_SIZE):
+                while True:
+                    record = journal.read(RECORD.size)
+                    if len(record) != RECORD.size:
+                        break
+                    number, checksum = RECORD.unpack(record)
+                    page = journal.read(PAGE_SIZE)
+                    if len(page) != PAGE_SIZE or \
+                            zlib.crc32(page) & 0xffffffff != checksum:
+                        break
+                    fileobj.seek(number * PAGE_SIZE)
+                    fileobj.write(page)
+                fileobj.flush()
+                os.fsync(fileobj.fileno())
+        os.remove(self.journal_path)
+        _fsync_dir(self.path)
+
+    def _decode(self, number):
+        """Reads page number out of the map."""
+        offset = number * PAGE_SIZE
+        kind, count, next, prev = NODE.unpack_from(self._map, offset)
+        offset += NODE.size
+        keys = list(struct.unpack_from(
+            str('<{}{}').format(count, self.typecode), self._map, offset))
+        offset += count * self._key.size
+        if kind == BRANCH:
+            count += 1
+        elif kind == FREE:
+            count = 0
+        values = list(struct.unpack_from(
+            str('<{}q').format(count), self._map, offset))
+        return _Page(number, kind == LEAF, keys, values, next, prev)
+
+    def _encode(self, page):
+        """Returns the bytes of a page."""
+        if page.leaf is None:
+            kind = FREE
+        else:
+            kind = LEAF if page.leaf else BRANCH
+        count = len(page.keys)
+        return b''.join((
+            NODE.pack(kind, count, page.next, page.prev),
+            struct.pack(str('<{}{}').format(count, self.typecode),
+                        *page.keys),
+            struct.pack(str('<{}q').format(len(page.values)),
+                        *page.values)))
+
+    def _read(self, number):
+        """Returns page number from the cache, decoding it on a miss."""
+        page = self._cache.get(number)
+        if page is None:
+            page = self._cache[number] = self._decode(number)
+        else:
+            # pop and reinsert rather than move_to_end, which py27 lacks
+            self._cache[number] = self._cache.pop(number)
+        return page
+
+    def _trim(self):
+        """Evicts the least recently used pages, writing back dirty ones,
+        until the cache is back to size.  Only called between operations,
+        so no page being worked on is ever evicted."""
+        while len(self._cache) > self.cache_pages:
+            number, page = self._cache.popitem(last=False)
+            if page.dirty:
+                if self._journal_page(number):
+                    self._sync_journal()
+                self._write(page)
+
+    def _allocate(self, leaf):
+        """Returns a new, dirty, empty page, reusing a free page if there
+        is one."""
+        if self._free != NONE:
+            page = self._read(self._free)
+            self._free = page.next
+            page.leaf = leaf
+            page.next = page.prev = NONE
+        else:
+            number = self._pages
+            self._pages += 1
+            if self._pages * PAGE_SIZE > len(self._map):
+                size = max(len(self._map) * 2, self._pages * PAGE_SIZE)
+                self._map.close()
+                self._map = None
+                self._file.truncate(size)
+                self._map = mmap.mmap(self._file.fileno(), 0)
+            page = self._cache[number] = _Page(number, leaf, [], [])
+        page.dirty = True
+        return page
+
+    def _release(self, page):
+        """Puts page on the free list."""
+        page.leaf = None
+        page.keys = []
+        page.values = []
+        page.next = self._free
+        page.prev = NONE
+        page.dirty = True
+        self._free = page.number
+
+    def _journal_page(self, number):
+        """Appends the flushed contents of page number to the journal,
+        unless this flush already saved them or the page is new.  Returns
+        True if anything was written."""
+        if number >= self._committed_pages or number in self._journaled:
+            return False
+        if self._journal is None:
+            self._journal = open(self.journal_path, 'wb')
+            self._journal.write(JOURNAL.pack(JOURNAL_MAGIC, PAGE_SIZE))
+            self._sync_journal()
+            _fsync_dir(self.journal_path)
+        offset = number * PAGE_SIZE
+        page = self._map[offset:offset + PAGE_SIZE]
+        self._journal.write(RECORD.pack(number,
+                                        zlib.crc32(page) & 0xffffffff))
+        self._journal.write(page)
+        self._journaled.add(number)
+        return True
+
+    def _sync_journal(self):
+        """Makes everything journaled so far durable."""
+        self._journal.flush()
+        os.fsync(self._journal.fileno())
+
+    def _write(self, page):
+        """Writes a page into the map."""
+        offset = page.number * PAGE_SIZE
+        data = self._encode(page)
+        self._map[offset:offset + len(data)] = data
+        page.dirty = False
+
+    def flush(self):
+        """Writes every change to the file and makes it durable.  Until a
+        flush, a crash rolls the file back to the previous one."""
+        dirty = [page for page in self._cache.values() if page.dirty]
+        if not dirty and self._journal is None and \
+                self._pages == self._committed_pages:
+            return
+        for page in dirty:
+            self._journal_page(page.number)
+        self._journal_page(0)
+        self._sync_journal()
+        for page in dirty:
+            self._write(page)
+        self._map[:HEADER.size] = HEADER.pack(
+            MAGIC, self.typecode.encode('ascii'), self.order, PAGE_SIZE,
+            self.root, self._pages, self.length, self._free)
+        self._map.flush()
+        os.fsync(self._file.fileno())
+        self._journal.close()
+        self._journal = None
+        os.remove(self.journal_path)
+        _fsync_dir(self.journal_path)
+        self._journaled = set()
+        self._committed_pages = self._pages
+
+    def close(self):
+        """Flushes and closes the index."""
+        if getattr(self, '_file', None) is None:
+            return
+        if getattr(self, '_map', None) is not None:
+            if hasattr(self, 'root'):
+                self.flush()
+            self._map.close()
+        self._file.close()
+        self._map = self._file = None
+
+    def __enter__(self):
+        """Lets the index be used in a with statement."""
+        return self
+
+    def __exit__(self, *exc_info):
+        """Closes the index at the end of a with statement."""
+        self.close()
+
+    def insert(self, val, data=0):
+        """Inserts a value into the tree.  If the value is already in the
+        tree it will be ignored."""
+        self._insert(val, data, False)
+
+    def __setitem__(self, val, data):
+        """Stores data with val, inserting val if it isn't in the tree."""
+        self._insert(val, data, True)
+
+    def _insert(self, val, data, replace):
+        """Helper method to insert and __setitem__, splits the root if it
+        overflows."""
+        _check_item(self._key, self.typecode, val, data)
+        split = self._insert_into(self._read(self.root), val, data, replace)
+        if split is not None:
+            separator, right = split
+            root = self._allocate(False)
+            root.keys = [separator]
+            root.values = [self.root, right.number]
+            self.root = root.number
+        self._trim()
+
+    def _insert_into(self, page, val, data, replace):
+        """Inserts val under page and returns a (separator, new right
+        sibling) pair if page had to split, or None."""
+        if page.leaf:
+            index = bisect_left(page.keys, val)
+            if index < len(page.keys) and page.keys[index] == val:
+                if replace:
+                    page.values[index] = data
+                    page.dirty = True
+                return None
+            page.keys.insert(index, val)
+            page.values.insert(index, data)
+            page.dirty = True
+            self.length += 1
+            if len(page.keys) <= self.order:
+                return None
+            return self._split_leaf(page)
+        index = bisect_right(page.keys, val)
+        split = self._insert_into(self._read(page.values[index]), val, data,
+                                  replace)
+        if split is None:
+            return None
+        separator, right = split
+        page.keys.insert(index, separator)
+        page.values.insert(index + 1, right.number)
+        page.dirty = True
+        if len(page.keys) <= self.order:
+            return None
+        middle = len(page.keys) // 2
+        separator = page.keys[middle]
+        right = self._allocate(False)
+        right.keys = page.keys[middle + 1:]
+        right.values = page.values[middle + 1:]
+        del page.keys[middle:]
+        del page.values[middle + 1:]
+        return separator, right
+
+    def _split_leaf(self, leaf):
+        """Moves the top half of an overflowing leaf into a new leaf and
+        returns the (separator, new leaf) pair."""
+        middle = len(leaf.keys) // 2
+        right = self._allocate(True)
+        right.keys = leaf.keys[middle:]
+        right.values = leaf.values[middle:]
+        del leaf.keys[middle:]
+        del leaf.values[middle:]
+        right.next = leaf.next
+        right.prev = leaf.number
+        if leaf.next != NONE:
+            following = self._read(leaf.next)
+            following.prev = right.number
+            following.dirty = True
+        leaf.next = right.number
+        return right.keys[0], right
+
+    def _find_leaf(self, val):
+        """Returns the leaf page val is in, or would go in."""
+        page = self._read(self.root)
+        try:
+            while not page.leaf:
+                page = self._read(page.values[bisect_right(page.keys, val)])
+        except TypeError:
+            raise(TypeError('Node values must be numbers'))
+        return page
+
+    def _locate(self, val):
+        """Returns a (leaf, index) pair for val, with index None if val
+        isn't in the tree."""
+        leaf = self._find_leaf(val)
+        self._trim()
+        index = bisect_left(leaf.keys, val)
+        if index < len(leaf.keys) and leaf.keys[index] == val:
+            return leaf, index
+        return leaf, None
+
+    def contains(self, val):
+        """Will return True if val is in the tree, or False if it's not."""
+        return self._locate(val)[1] is not None
+
+    def __contains__(self, val):
+        """Lets us say 'val in tree'."""
+        return self.contains(val)
+
+    def __getitem__(self, val):
+        """Returns the data stored with val, raises KeyError if val isn't
+        in the tree."""
+        leaf, index = self._locate(val)
+        if index is None:
+            raise KeyError(val)
+        return leaf.values[index]
+
+    def get(self, val, default=None):
+        """Returns the data stored with val, or default if val isn't in the
+        tree."""
+        leaf, index = self._locate(val)
+        if index is None:
+            return default
+        return leaf.values[index]
+
+    def size(self):
+        """Will return the integer size of the tree, zero if empty."""
+        return self.length
+
+    def __len__(self):
+        """Returns size of tree using builtin length method."""
+        return self.length
+
+    def depth(self):
+        """Will return the number of levels in the tree, 0 if empty."""
+        if self.length == 0:
+            return 0
+        levels = 1
+        page = self._read(self.root)
+        while not page.leaf:
+            page = self._read(page.values[0])
+            levels += 1
+        self._trim()
+        return levels
+
+    def __iter__(self):
+        """Iterates over the values of the tree in order."""
+        return self._scan(self._end_leaf(False), 0, None, True)
+
+    def in_order(self, reverse=False):
+        """
+        This function will return a generator that will return the values
+        of the tree in order, one value at a time, by walking the linked
+        leaves.  With reverse=True the values come out largest first.
+        """
+        if self.length == 0:
+            raise IndexError("You can't in-order traverse an empty Tree.")
+        if reverse:
+            return self._scan_back(self._end_leaf(True))
+        return iter(self)
+
+    def items(self):
+        """Returns a generator of (value, data) pairs in value order."""
+        number = self._end_leaf(False).number
+        while number != NONE:
+            leaf = self._read(number)
+            pairs = list(zip(leaf.keys, leaf.values))
+            number = leaf.next
+            self._trim()
+            for pair in pairs:
+                yield pair
+
+    def range(self, low, high, inclusive=(True, True)):
+        """Returns a generator of the values between low and high in order.
+        inclusive is a pair saying whether low and high themselves count.
+        One descent finds the first leaf, then the scan follows the leaf
+        links."""
+        low_inclusive, high_inclusive = inclusive
+        leaf = self._find_leaf(low)
+        if low_inclusive:
+            index = bisect_left(leaf.keys, low)
+        else:
+            index = bisect_right(leaf.keys, low)
+        return self._scan(leaf, index, high, high_inclusive)
+
+    def _scan(self, leaf, index, high, high_inclusive):
+        """Generator of values from leaf.keys[index] onward, stopping at
+        high if it isn't None.  Each leaf's keys are copied out before
+        yielding, so the cache can be trimmed mid scan."""
+        while True:
+            keys = leaf.keys
+            stop = len(keys)
+            if high is not None:
+                if high_inclusive:
+                    stop = bisect_right(keys, high, index)
+                else:
+                    stop = bisect_left(keys, high, index)
+            chunk = keys[index:stop]
+            number = leaf.next if stop == len(keys) else NONE
+            self._trim()
+            for val in chunk:
+                yield val
+            if number == NONE:
+                return
+            leaf = self._read(number)
+            index = 0
+
+    def _scan_back(self, leaf):
+        """Generator of every value from leaf backwards."""
+        while True:
+            chunk = leaf.keys[::-1]
+            number = leaf.prev
+            self._trim()
+            for val in chunk:
+                yield val
+            if number == NONE:
+                return
+            leaf = self._read(number)
+
+    def _end_leaf(self, last):
+        """Returns the first (or last) leaf."""
+        page = self._read(self.root)
+        while not page.leaf:
+            page = self._read(page.values[-1 if last else 0])
+        return page
+
+    def delete(self, val):
+        """Removes val from the tree, returns None.  Pages that fall below
+        half full borrow from a neighbour or merge with it, and emptied
+        pages go on a free list for reuse."""
+        try:
+            self._delete_from(self._read(self.root), val)
+        except TypeError:
+            raise(TypeError('Node values must be numbers'))
+        root = self._read(self.root)
+        if not root.leaf and len(root.values) == 1:
+            self.root = root.values[0]
+            self._release(root)
+        self._trim()
+
+    def __delitem__(self, val):
+        """Removes val and its data, raises KeyError if val isn't in the
+        tree."""
+        if not self.contains(val):
+            raise KeyError(val)
+        self.delete(val)
+
+    def _delete_from(self, page, val):
+        """Removes val from under page, then repairs the child it came from
+        if that child underflowed."""
+        if page.leaf:
+            index = bisect_left(page.keys, val)
+            if index < len(page.keys) and page.keys[index] == val:
+                del page.keys[index]
+                del page.values[index]
+                page.dirty = True
+                self.length -= 1
+            return
+        index = bisect_right(page.keys, val)
+        child = self._read(page.values[index])
+        self._delete_from(child, val)
+        if len(child.keys) < self.order // 2:
+            self._repair(page, index)
+
+    def _repair(self, parent, index):
+        """Refills child page index of parent from a sibling with keys to
+        spare, or merges it with a sibling."""
+        child = self._read(parent.values[index])
+        left = self._read(parent.values[index - 1]) if index > 0 else None
+        right = self._read(parent.values[index + 1]) \
+            if index + 1 < len(parent.values) else None
+        minimum = self.order // 2
+        if left is not None and len(left.keys) > minimum:
+            if child.leaf:
+                child.keys.insert(0, left.keys.pop())
+                child.values.insert(0, left.values.pop())
+                parent.keys[index - 1] = child.keys[0]
+            else:
+                child.keys.insert(0, parent.keys[index - 1])
+                child.values.insert(0, left.values.pop())
+                parent.keys[index - 1] = left.keys.pop()
+            left.dirty = True
+        elif right is not None and len(right.keys) > minimum:
+            if child.leaf:
+                child.keys.append(right.keys.pop(0))
+                child.values.append(right.values.pop(0))
+                parent.keys[index] = right.keys[0]
+            else:
+                child.keys.append(parent.keys[index])
+                child.values.append(right.values.pop(0))
+                parent.keys[index] = right.keys.pop(0)
+            right.dirty = True
+        elif left is not None:
+            self._merge(parent, index - 1)
+            return
+        elif right is not None:
+            self._merge(parent, index)
+            return
+        child.dirty = parent.dirty = True
+
+    def _merge(self, parent, index):
+        """Merges child page index + 1 of parent into child page index and
+        frees it."""
+        left = self._read(parent.values[index])
+        right = self._read(parent.values[index + 1])
+        if left.leaf:
+            left.keys.extend(right.keys)
+            left.values.extend(right.values)
+            left.next = right.next
+            if right.next != NONE:
+                following = self._read(right.next)
+                following.prev = left.number
+                following.dirty = True
+        else:
+            left.keys.append(parent.keys[index])
+            left.keys.extend(right.keys)
+            left.values.extend(right.values)
+        del parent.keys[index]
+        del parent.values[index + 1]
+        left.dirty = parent.dirty = True
+        self._release(right)
+
+
+class _Loader(object):
+    """Helper to DiskBTree.bulk_load, writes pages to the end of a new file
+    bottom level first."""
+
+    def __init__(self, fileobj, typecode, order):
+        """Starts writing pages at page 1 of fileobj."""
+        self.fileobj = fileobj
+        self.typecode = typecode
+        self.order = order
+        self.pages = 1
+        self.length = 0
+        self.pending = None
+        self.written = None
+        self.level = []
+
+    def _write(self, kind, keys, values, next=NONE, prev=NONE):
+        """Writes one page at the end of the file and returns its
+        number."""
+        self.fileobj.write(b''.join((
+            NODE.pack(kind, len(keys), next, prev),
+            struct.pack(str('<{}{}').format(len(keys), self.typecode),
+                        *keys),
+            struct.pack(str('<{}q').format(len(values)), *values),
+        )).ljust(PAGE_SIZE, b'\0'))
+        self.pages += 1
+        return self.pages - 1
+
+    def add_leaf(self, keys, values):
+        """Queues a leaf.  The previous one is held back and written now,
+        once it's known another leaf follows it."""
+        if self.pending is not None:
+            self._flush_leaf(True)
+        self.pending = (keys, values)
+        self.length += len(keys)
+
+    def _flush_leaf(self, more):
+        """Writes the held back leaf, linked to its neighbours, which are
+        always the pages either side."""
+        keys, values = self.pending
+        number = self.pages
+        prev = number - 1 if self.level else NONE
+        self._write(LEAF, keys, values, number + 1 if more else NONE, prev)
+        self.written = self.pending
+        self.level.append((keys[0] if keys else None, number))
+
+    def finish(self):
+        """Writes the last leaf and every branch level above the leaves.
+        Returns (root, page count, length)."""
+        keys, values = self.pending
+        minimum = self.order // 2
+        if self.level and len(keys) < minimum:
+            # the last leaf came up short, so write the full leaf before it
+            # again, less the keys it hands over
+            before_keys, before_values = self.written
+            self.level.pop()
+            self.pages -= 1
+            self.fileobj.seek(self.pages * PAGE_SIZE)
+            move = minimum - len(keys)
+            keys = before_keys[-move:] + keys
+            values = before_values[-move:] + values
+            self.pending = (before_keys[:-move], before_values[:-move])
+            self._flush_leaf(True)
+        self.pending = (keys, values)
+        self._flush_leaf(False)
+        level = self.level
+        while len(level) > 1:
+            groups = -(-len(level) // (self.order + 1))
+            above = []
+            start = 0
+            for group in range(groups):
+                stop = start + (len(level) - start) // (groups - group)
+                children = level[start:stop]
+                number = self._write(BRANCH,
+                                     [first for first, _ in children[1:]],
+                                     [child for _, child in children])
+                above.append((children[0][0], number))
+                start = stop
+            level = above
+        return level[0][1], self.pages, self.length
+
+
+if __name__ == '__main__':
+    import tempfile
+    import timeit
+    import random
+
+    print("")
+    print("Disk B+ Tree")
+    print("")
+    print("Bulk load, cold open and lookups for a file backed index, against")
+    print("rebuilding the index key by key.")
+    print("")
+    n = 10 ** 5
+    directory = tempfile.mkdtemp()
+    path = os.path.join(directory, 'index')
+    keys = list(range(0, n * 2, 2))
+    load = timeit.timeit(
+        lambda: DiskBTree.bulk_load(path, ((key, key) for key in keys))
+        .close(), number=1)
+    cold = timeit.timeit(lambda: DiskBTree(path).close(), number=1)
+    with DiskBTree(path) as index:
+        probes = random.sample(keys, 10000)
+        lookup = timeit.timeit(lambda: [index.contains(key)
+                                        for key in probes], number=1)
+        depth = index.depth()
+    os.remove(path)
+
+    def rebuild():
+        with DiskBTree(path) as index:
+            for key in keys:
+                index.insert(key, key)
+    rebuilt = timeit.timeit(rebuild, number=1)
+    print("Input: {} sorted ints".format(n))
+    print("Bulk load time: ", load)
+    print("Cold open time: ", cold)
+    print("Rebuild key by key time: ", rebuilt)
+    print("Depth: ", depth)
+    print("Lookups per second: ", len(probes) / lookup)
+    print("")
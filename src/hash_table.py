@@ -12,7 +12,21 @@
     came from:
 
     http://www.github.com/crashtack
+
+    FNV-1a and SipHash-2-4 follow:
+
+    http://www.isthe.com/chongo/tech/comp/fnv/
+    https://www.aumasson.jp/siphash/siphash.pdf
 """
+from array import array
+from functools import partial
+import random
+import struct
+
+MASK_64 = (1 << 64) - 1
+FNV_OFFSET = 0xcbf29ce484222325
+FNV_PRIME = 0x100000001b3
+_WORD = struct.Struct(str('<Q'))
 
 
 def bp_hash(key, size):
@@ -30,51 +44,389 @@ def simple_hash(key, size):
     return hash_value
 
 
+def _key_bytes(key):
+    """
+    This function returns a str key UTF-8 encoded, or a bytes, bytearray or
+    memoryview key as bytes
+    """
+    if isinstance(key, bytes):
+        return key
+    if isinstance(key, memoryview):
+        return key.tobytes()
+    if isinstance(key, bytearray):
+        return bytes(key)
+    return key.encode('utf-8')
+
+
+def fnv1a_hash(key, size):
+    """
+    This function returns the 64 bit FNV-1a hash of the key's bytes, which
+    spreads short and anagram keys well, reduced below size only once
+    """
+    hash_value = FNV_OFFSET
+    for byte in bytearray(_key_bytes(key)):
+        hash_value = ((hash_value ^ byte) * FNV_PRIME) & MASK_64
+    # int() so py27 hands back an int rather than a long when it fits
+    return int(hash_value % size)
+
+
+def _sip_rounds(v0, v1, v2, v3, rounds):
+    """
+    This function runs rounds SipRounds over the SipHash state
+    """
+    for _ in range(rounds):
+        v0 = (v0 + v1) & MASK_64
+        v1 = ((v1 << 13) | (v1 >> 51)) & MASK_64
+        v1 ^= v0
+        v0 = ((v0 << 32) | (v0 >> 32)) & MASK_64
+        v2 = (v2 + v3) & MASK_64
+        v3 = ((v3 << 16) | (v3 >> 48)) & MASK_64
+        v3 ^= v2
+        v0 = (v0 + v3) & MASK_64
+        v3 = ((v3 << 21) | (v3 >> 43)) & MASK_64
+        v3 ^= v0
+        v2 = (v2 + v1) & MASK_64
+        v1 = ((v1 << 17) | (v1 >> 47)) & MASK_64
+        v1 ^= v2
+        v2 = ((v2 << 32) | (v2 >> 32)) & MASK_64
+    return v0, v1, v2, v3
+
+
+def sip_hash(key, size, seed=0):
+    """
+    This function returns the SipHash-2-4 of the key's bytes under a 128
+    bit seed, so keys can't be picked to collide without knowing it
+    """
+    data = _key_bytes(key)
+    k0 = seed & MASK_64
+    k1 = (seed >> 64) & MASK_64
+    v0 = k0 ^ 0x736f6d6570736575
+    v1 = k1 ^ 0x646f72616e646f6d
+    v2 = k0 ^ 0x6c7967656e657261
+    v3 = k1 ^ 0x7465646279746573
+    length = len(data)
+    end = length - length % 8
+    for offset in range(0, end, 8):
+        word = _WORD.unpack_from(data, offset)[0]
+        v3 ^= word
+        v0, v1, v2, v3 = _sip_rounds(v0, v1, v2, v3, 2)
+        v0 ^= word
+    word = (length & 0xff) << 56
+    for shift, byte in enumerate(bytearray(data[end:])):
+        word |= byte << (8 * shift)
+    v3 ^= word
+    v0, v1, v2, v3 = _sip_rounds(v0, v1, v2, v3, 2)
+    v0 ^= word
+    v2 ^= 0xff
+    v0, v1, v2, v3 = _sip_rounds(v0, v1, v2, v3, 4)
+    return int((v0 ^ v1 ^ v2 ^ v3) % size)
+
+
+def builtin_hash(key, size, seed=0):
+    """
+    This function returns Python's own hash of the key mixed with a seed,
+    by far the fastest here since it runs in C and str caches it
+    """
+    if not isinstance(key, (type(''), bytes)):
+        key = _key_bytes(key)
+    return hash((seed, key)) % size
+
+
+HASH_FUNCTIONS = {
+    'simple_hash': simple_hash,
+    'bp_hash': bp_hash,
+    'fnv1a_hash': fnv1a_hash,
+    'sip_hash': sip_hash,
+    'builtin_hash': builtin_hash,
+}
+SEEDED_HASH_FUNCTIONS = (sip_hash, builtin_hash)
+
+
+def _array_typecode(typecodes, itemsize):
+    """
+    This function returns the first of typecodes that the array module
+    has with items itemsize bytes wide, or None.  py27 has no 'q' or 'Q',
+    but its 'l' and 'L' are 8 bytes wide on most 64 bit platforms
+    """
+    for typecode in typecodes:
+        try:
+            if array(str(typecode)).itemsize == itemsize:
+                return typecode
+        except ValueError:
+            pass
+    return None
+
+
 class HashTable(object):
 
     """
-    This class is a hash table. It contains 2 public(get, set) and 2 private
-    functions (__init__, _hash)to create a hash table.
+    This class is a hash table. It contains public get, set and delete
+    functions and keeps the number of buckets in step with the number of
+    keys.
+
+    Once there are more than load_factor keys per bucket the buckets are
+    doubled, and once there are fewer than a quarter of that they're
+    halved, but never below the size the table was made with (or
+    reserved).  Each resize rehashes every key, which is O(n), but a
+    resize only happens after O(n) sets or deletes, so each of those is
+    still O(1) on average and buckets stay short however big the table
+    gets.
+
+    With rehash_step set, a resize doesn't move any keys itself: the old
+    buckets are kept, and every get, set and delete moves the next
+    rehash_step of them over (and, for a set or delete, the bucket its
+    own key is in), so no single call pays for the whole rehash.  Keys
+    are looked up in the old buckets until their bucket has moved.  A
+    step of at least 8 / load_factor always finishes one rehash before
+    the next is due; if it doesn't, the next resize finishes it first.
+    Empty buckets are None, so the new buckets are one flat list.
+
+    hash_func names one of HASH_FUNCTIONS.  The default, fnv1a_hash, uses
+    the full 64 bit range before it is reduced to a bucket.  simple_hash
+    only sums bytes, so its values stay small and a grown table leaves
+    most of its buckets empty; it suits small fixed size tables only.
+    sip_hash and builtin_hash are seeded per table, with seed or a random
+    one, so one table's collisions say nothing about another's.
     """
 
-    def __init__(self, size, hash_func='simple_hash'):
+    def __init__(self, size=8, hash_func='fnv1a_hash', load_factor=0.75,
+                 rehash_step=None, seed=None):
+        if not size >= 1:
+            raise ValueError('size must be at least 1')
         self.size = size
-        self._buckets = [list() for _ in range(self.size)]
-        self.hash_functions = {
-            'simple_hash': simple_hash,
-            'bp_hash': bp_hash
-        }
+        self._allocate(size)
+        self._min_size = size
+        self.length = 0
+        self.hash_functions = HASH_FUNCTIONS
 
         if hash_func in self.hash_functions:
             self.hash_func = self.hash_functions[hash_func]
         else:
             raise TypeError(
-                'You must select simple_hash or bp_hash as a hash function'
+                'You must select one of {} as a hash function'.format(
+                    ', '.join(sorted(self.hash_functions)))
                 )
+        self.seed = random.getrandbits(128) if seed is None else seed
+        if self.hash_func in SEEDED_HASH_FUNCTIONS:
+            self.hash_func = partial(self.hash_func, seed=self.seed)
+        if not load_factor > 0:
+            raise ValueError('load_factor must be above 0')
+        if rehash_step is not None and rehash_step < 1:
+            raise ValueError('rehash_step must be at least 1')
+        self.load_factor = load_factor
+        self.rehash_step = rehash_step
+        self._old_buckets = None
+        self._old_size = 0
+        self._next_bucket = 0
 
     def set(self, key, val):
         """
-        This function stores the given val using the given key
+        This function stores the given val using the given key, replacing
+        any val already stored with it
         """
-        try:
-            hash_key = self._hash(key, self.size)
-        except AttributeError:
-            raise KeyError('Value must be a string')
-        if val not in self._buckets[hash_key]:
-            self._buckets[hash_key].append((key, val))
+        buckets, index = self._locate(key, True)
+        bucket = buckets[index]
+        if bucket is None:
+            buckets[index] = [(key, val)]
+        else:
+            for position, item in enumerate(bucket):
+                if item[0] == key:
+                    bucket[position] = (key, val)
+                    return
+            bucket.append((key, val))
+        self.length += 1
+        if self.length > self.size * self.load_factor:
+            self._resize(self.size * 2)
 
     def get(self, key):
         """
-        This function returns the value stored with the given key
+        This function returns the value stored with the given key, or
+        raises KeyError if there isn't one
         """
-        hash_key = self._hash(key, self.size)
-        for item in self._buckets[hash_key]:
+        buckets, index = self._locate(key, False)
+        for item in buckets[index] or ():
             if item[0] == key:
                 return item[1]
-        return KeyError('This key was not found in the hash table')
+        raise KeyError('This key was not found in the hash table')
+
+    def delete(self, key):
+        """
+        This function removes the given key and its value, or raises
+        KeyError if it isn't in the table
+        """
+        buckets, index = self._locate(key, True)
+        bucket = buckets[index]
+        for position, item in enumerate(bucket or ()):
+            if item[0] == key:
+                del bucket[position]
+                break
+        else:
+            raise KeyError('This key was not found in the hash table')
+        if not bucket:
+            buckets[index] = None
+        self.length -= 1
+        if self.size > self._min_size and \
+                self.length < self.size * self.load_factor / 4:
+            self._resize(max(self.size // 2, self._min_size))
+
+    def reserve(self, count):
+        """
+        This function sizes the table to hold count keys without resizing
+        again, and stops it shrinking below that
+        """
+        size = self.size
+        while count > size * self.load_factor:
+            size *= 2
+        self._min_size = max(self._min_size, size)
+        if size != self.size:
+            self._resize(size)
+
+    def __len__(self):
+        """
+        This function returns the number of keys in the table
+        """
+        return self.length
+
+    def _allocate(self, size):
+        """
+        This function sets up size empty buckets
+        """
+        self._buckets = [None] * size
+
+    def _locate(self, key, write):
+        """
+        This function returns the list of buckets key's bucket is in and
+        its index there.  Mid-rehash it first moves the next rehash_step
+        old buckets, then reads key from its old bucket if that hasn't
+        moved yet, or moves it now for a write
+        """
+        if self._old_buckets is not None:
+            self._rehash(self.rehash_step)
+        if self._old_buckets is not None:
+            index = self._hash(key, self._old_size)
+            if self._old_buckets[index] is not None:
+                if not write:
+                    return self._old_buckets, index
+                self._move_bucket(index)
+        return self._buckets, self._hash(key, self.size)
+
+    def _resize(self, size):
+        """
+        This function starts moving every key into a new list of size
+        buckets, and finishes unless there's a rehash_step
+        """
+        if self._old_buckets is not None:
+            self._rehash(self._old_size)
+        self._old_buckets = self._buckets
+        self._old_size = self.size
+        self._next_bucket = 0
+        self._buckets = [None] * size
+        self.size = size
+        if self.rehash_step is None:
+            self._rehash(self._old_size)
+
+    def _rehash(self, count):
+        """
+        This function moves the next count old buckets into the new ones,
+        and drops the old buckets once they've all moved
+        """
+        stop = min(self._next_bucket + count, self._old_size)
+        for index in range(self._next_bucket, stop):
+            if self._old_buckets[index] is not None:
+                self._move_bucket(index)
+        self._next_bucket = stop
+        if stop == self._old_size:
+            self._old_buckets = None
+
+    def _move_bucket(self, index):
+        """
+        This function moves the keys of old bucket index into the new
+        buckets
+        """
+        buckets = self._buckets
+        for item in self._old_buckets[index]:
+            new_index = self._hash(item[0], self.size)
+            if buckets[new_index] is None:
+                buckets[new_index] = [item]
+            else:
+                buckets[new_index].append(item)
+        self._old_buckets[index] = None
 
     def _hash(self, key, size):
         """
-        This function returns the hashed value of the key provided
+        This function returns the hashed value of the key provided, as a
+        bucket number below size
         """
-        return self.hash_func(key, self.size)
+        try:
+            return self.hash_func(key, size) % size
+        except (AttributeError, TypeError):
+            raise KeyError('Value must be a string')
+
+
+if __name__ == '__main__':
+    import itertools
+    import time
+    import timeit
+
+    print("")
+    print("Hash Table")
+    print("")
+    print("Set and get time per key with a table that starts at 1024")
+    print("buckets and grows, against one stuck at 1024 buckets.")
+    print("")
+    for n in (10 ** 3, 10 ** 4, 10 ** 5):
+        words = ['word{}'.format(num) for num in range(n)]
+        for label, load_factor in (('growing', 0.75), ('fixed', float(n))):
+            table = HashTable(1024, 'bp_hash', load_factor)
+            sets = timeit.timeit(lambda: [table.set(word, word)
+                                          for word in words], number=1)
+            gets = timeit.timeit(lambda: [table.get(word)
+                                          for word in words], number=1)
+            print("Input: {} keys, {} table".format(n, label))
+            print("Set time per key: ", sets / n)
+            print("Get time per key: ", gets / n)
+        print("")
+    print("Worst single set while growing from 8 buckets, rehashing all at")
+    print("once against 16 buckets per call.")
+    print("")
+    timer = time.perf_counter if hasattr(time, 'perf_counter') \
+        else time.time
+    for n in (10 ** 5, 10 ** 6):
+        words = ['word{}'.format(num) for num in range(n)]
+        for label, step in (('all at once', None), ('incremental', 16)):
+            table = HashTable(8, 'bp_hash', rehash_step=step)
+            worst = 0
+            for word in words:
+                start = timer()
+                table.set(word, word)
+                worst = max(worst, timer() - start)
+            print("Input: {} keys, {}".format(n, label))
+            print("Worst set time: ", worst)
+        print("")
+    print("Hash functions.  Largest bucket and share of empty buckets for")
+    print("numbered words plus every anagram of 'abcdefg', hashed into as")
+    print("many buckets as keys, and hashes per second for str and bytes.")
+    print("An ideal hash leaves about 37% of buckets empty.")
+    print("")
+    keys = ['word{}'.format(num) for num in range(10 ** 4)]
+    keys += [''.join(letters) for letters in
+             itertools.permutations('abcdefg')]
+    byte_keys = [key.encode('utf-8') for key in keys]
+    for name in sorted(HASH_FUNCTIONS):
+        func = HashTable(8, name).hash_func
+        counts = [0] * len(keys)
+        for key in keys:
+            counts[func(key, len(keys)) % len(keys)] += 1
+        strs = timeit.timeit(lambda: [func(key, 1024) for key in keys],
+                             number=1)
+        print(name)
+        print("Largest bucket: ", max(counts))
+        print("Empty buckets: ", counts.count(0) / float(len(keys)))
+        print("str hashes per second: ", len(keys) / strs)
+        try:
+            raw = timeit.timeit(lambda: [func(key, 1024)
+                                         for key in byte_keys], number=1)
+            print("bytes hashes per second: ", len(keys) / raw)
+        except (AttributeError, TypeError):
+            print("bytes hashes per second: ", "n/a, str keys only")
+        print("")
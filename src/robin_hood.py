@@ -0,0 +1,254 @@
+# -*- coding: utf-8 -*-
+"""File implements an open addressing hash table with Robin Hood probing.
+
+hash_table.HashTable chains a (key, val) tuple per entry in a list per
+bucket.  RobinHoodHashTable keeps every entry in one of three flat,
+parallel arrays of slots instead (keys, values and 64 bit hashes), so an
+entry costs three slots rather than a tuple and a share of a list.
+
+A key goes in the first free slot from the one its hash picks.  On the
+way, if it has probed further than the entry already sitting in a slot,
+it takes that slot and the poorer entry carries on probing in its place.
+That evens out probe lengths, so a lookup can stop as soon as it meets
+an entry closer to home than itself.  Deleting shifts the following run
+of displaced entries back one slot rather than leaving a tombstone.
+
+The stored hashes mean a resize never calls the hash function, and a
+probe only compares keys whose hashes match.  Hashes are multiplied by
+2**64 over the golden ratio and a slot is picked by the top bits of the
+product, which every bit of the hash feeds into, so hashes that only
+differ in their high bits (as bp_hash's and simple_hash's do) still
+spread out.
+
+Robin Hood probing is described in:
+
+https://cs.uwaterloo.ca/research/tr/1986/CS-86-14.pdf
+"""
+from array import array
+
+from hash_table import HashTable, _array_typecode
+
+_EMPTY = object()
+HASH_SPACE = 1 << 64
+MASK_64 = HASH_SPACE - 1
+GOLDEN = 0x9e3779b97f4a7c15
+# None where no unsigned array type is 64 bits, the hashes are a list then
+HASH_TYPECODE = _array_typecode(('Q', 'L'), 8)
+
+
+class RobinHoodHashTable(HashTable):
+
+    """
+    This class is a hash table with the same get, set, delete and reserve
+    functions as HashTable, stored with open addressing.  The number of
+    slots is always a power of two, and load_factor must be below 1.
+    Incremental rehashing isn't offered, since moving entries would
+    upset the probe sequences.
+    """
+
+    def __init__(self, size=8, hash_func='builtin_hash', load_factor=0.9,
+                 seed=None):
+        if not load_factor < 1:
+            raise ValueError('load_factor must be below 1')
+        size = 1 << max(size - 1, 1).bit_length()
+        super(RobinHoodHashTable, self).__init__(size, hash_func,
+                                                 load_factor, seed=seed)
+
+    def set(self, key, val):
+        """
+        This function stores the given val using the given key, replacing
+        any val already stored with it
+        """
+        hash_value = self._mix(key)
+        keys = self._keys
+        hashes = self._hashes
+        mask = self.size - 1
+        shift = self._shift
+        index = hash_value >> shift
+        distance = 0
+        while True:
+            slot_key = keys[index]
+            if slot_key is _EMPTY:
+                break
+            if hashes[index] == hash_value and slot_key == key:
+                self._vals[index] = val
+                return
+            if (index - (hashes[index] >> shift)) & mask < distance:
+                break
+            index = (index + 1) & mask
+            distance += 1
+        self._place(index, hash_value, key, val)
+        self.length += 1
+        if self.length > self.size * self.load_factor:
+            self._resize(self.size * 2)
+
+    def get(self, key):
+        """
+        This function returns the value stored with the given key, or
+        raises KeyError if there isn't one
+        """
+        index = self._find(key)
+        if index is None:
+            raise KeyError('This key was not found in the hash table')
+        return self._vals[index]
+
+    def delete(self, key):
+        """
+        This function removes the given key and its value, or raises
+        KeyError if it isn't in the table
+        """
+        index = self._find(key)
+        if index is None:
+            raise KeyError('This key was not found in the hash table')
+        keys = self._keys
+        vals = self._vals
+        hashes = self._hashes
+        mask = self.size - 1
+        shift = self._shift
+        following = (index + 1) & mask
+        while keys[following] is not _EMPTY and \
+                (following - (hashes[following] >> shift)) & mask:
+            keys[index] = keys[following]
+            vals[index] = vals[following]
+            hashes[index] = hashes[following]
+            index = following
+            following = (following + 1) & mask
+        keys[index] = _EMPTY
+        vals[index] = None
+        self.length -= 1
+        if self.size > self._min_size and \
+                self.length < self.size * self.load_factor / 4:
+            self._resize(max(self.size // 2, self._min_size))
+
+    def probe_lengths(self):
+        """
+        This function returns a dict of how many entries sit each number
+        of slots past the one their hash picks
+        """
+        counts = {}
+        mask = self.size - 1
+        for index, key in enumerate(self._keys):
+            if key is not _EMPTY:
+                distance = (index - (self._hashes[index] >> self._shift)) \
+                    & mask
+                counts[distance] = counts.get(distance, 0) + 1
+        return counts
+
+    def _find(self, key):
+        """
+        This function returns the slot holding key, or None.  The probe
+        stops at an empty slot or one whose entry is closer to home than
+        key would be, since key would have taken that slot
+        """
+        hash_value = self._mix(key)
+        keys = self._keys
+        hashes = self._hashes
+        mask = self.size - 1
+        shift = self._shift
+        index = hash_value >> shift
+        distance = 0
+        while True:
+            slot_key = keys[index]
+            if slot_key is _EMPTY or \
+                    (index - (hashes[index] >> shift)) & mask < distance:
+                return None
+            if hashes[index] == hash_value and slot_key == key:
+                return index
+            index = (index + 1) & mask
+            distance += 1
+
+    def _place(self, index, hash_value, key, val):
+        """
+        This function puts an entry known not to be in the table at slot
+        index of its probe sequence, pushing richer entries further along
+        """
+        keys = self._keys
+        vals = self._vals
+        hashes = self._hashes
+        mask = self.size - 1
+        shift = self._shift
+        distance = (index - (hash_value >> shift)) & mask
+        while keys[index] is not _EMPTY:
+            slot_distance = (index - (hashes[index] >> shift)) & mask
+            if slot_distance < distance:
+                hash_value, hashes[index] = hashes[index], hash_value
+                key, keys[index] = keys[index], key
+                val, vals[index] = vals[index], val
+                distance = slot_distance
+            index = (index + 1) & mask
+            distance += 1
+        keys[index] = key
+        vals[index] = val
+        hashes[index] = hash_value
+
+    def _mix(self, key):
+        """
+        This function returns the hash stored for key, whose top bits pick
+        its home slot
+        """
+        return (self._hash(key, HASH_SPACE) * GOLDEN) & MASK_64
+
+    def _allocate(self, size):
+        """
+        This function sets up size empty slots
+        """
+        self._shift = 65 - size.bit_length()
+        self._keys = [_EMPTY] * size
+        self._vals = [None] * size
+        if HASH_TYPECODE is None:
+            self._hashes = [0] * size
+        else:
+            self._hashes = array(str(HASH_TYPECODE), [0]) * size
+
+    def _resize(self, size):
+        """
+        This function moves every entry into size new slots, by its stored
+        hash
+        """
+        keys = self._keys
+        vals = self._vals
+        hashes = self._hashes
+        self._allocate(size)
+        self.size = size
+        for index, key in enumerate(keys):
+            if key is not _EMPTY:
+                self._place(hashes[index] >> self._shift, hashes[index], key,
+                            vals[index])
+
+
+if __name__ == '__main__':
+    import timeit
+    try:
+        import tracemalloc
+    except ImportError:
+        tracemalloc = None
+
+    print("")
+    print("Robin Hood Hash Table")
+    print("")
+    print("Set and get time, memory per key and longest probe against the")
+    print("chained HashTable, both with builtin_hash.")
+    print("")
+    for n in (10 ** 5, 10 ** 6):
+        words = ['word{}'.format(num) for num in range(n)]
+        for table_type in (HashTable, RobinHoodHashTable):
+            table = table_type(8, 'builtin_hash')
+            sets = timeit.timeit(lambda: [table.set(word, num) for num, word
+                                          in enumerate(words)], number=1)
+            gets = timeit.timeit(lambda: [table.get(word) for word in words],
+                                 number=1)
+            print("Input: {} keys, {}".format(n, table_type.__name__))
+            print("Set elapsed time: ", sets)
+            print("Get elapsed time: ", gets)
+            if tracemalloc is not None:
+                tracemalloc.start()
+                table = table_type(8, 'builtin_hash')
+                for num, word in enumerate(words):
+                    table.set(word, num)
+                used = tracemalloc.get_traced_memory()[0]
+                tracemalloc.stop()
+                print("Bytes per key, including the int values: ",
+                      used / float(n))
+            if table_type is RobinHoodHashTable:
+                print("Longest probe: ", max(table.probe_lengths()))
+        print("")
@@ -0,0 +1,196 @@
+# -*- coding: utf-8 -*-
+"""File tests the array backed binary search tree."""
+from __future__ import unicode_literals
+
+import io
+import pytest
+import random
+
+INT_CASES = [random.sample(range(1000),
+             random.randrange(2, 100)) for n in range(10)
+             ]
+
+
+def _array_bst_checker(tree, index):
+    """helper method that returns the true depth of index's subtree, or -1
+    if the order, a stored depth, a parent link or the balance is wrong"""
+    from array_bst import NIL
+    if index == NIL:
+        return 0
+    left = tree._left[index]
+    right = tree._right[index]
+    for child in (left, right):
+        if child != NIL and tree._parent[child] != index:
+            return -1
+    if left != NIL and tree._keys[left] > tree._keys[index]:
+        return -1
+    if right != NIL and tree._keys[right] < tree._keys[index]:
+        return -1
+    left_depth = _array_bst_checker(tree, left)
+    right_depth = _array_bst_checker(tree, right)
+    if left_depth < 0 or right_depth < 0 or \
+            abs(left_depth - right_depth) > 1:
+        return -1
+    if tree._depth[index] != max(left_depth, right_depth) + 1:
+        return -1
+    return tree._depth[index]
+
+
+@pytest.fixture(scope='function', params=INT_CASES)
+def full_array_bst(request):
+    '''Return a full array bst and its sorted values for testing'''
+    from array_bst import ArrayBinarySearchTree
+    tree = ArrayBinarySearchTree(typecode='q')
+    for val in request.param:
+        tree.insert(val)
+    return tree, sorted(request.param)
+
+
+def test_array_bst_init_empty():
+    """test that an empty tree has no root and no size"""
+    from array_bst import ArrayBinarySearchTree, NIL
+    tree = ArrayBinarySearchTree()
+    assert tree.root == NIL
+    assert tree.size() == 0
+    assert tree.depth() == 0
+    assert tree.balance() == 0
+
+
+def test_array_bst_init_root():
+    """test that a tree initialized w/ val gets that val at the root"""
+    from array_bst import ArrayBinarySearchTree
+    tree = ArrayBinarySearchTree(0)
+    assert tree._keys[tree.root] == 0
+    assert len(tree) == 1
+
+
+def test_array_bst_in_order(full_array_bst):
+    """test in order traversal output, both ways"""
+    tree, sorted_list = full_array_bst
+    assert list(tree.in_order()) == sorted_list
+    assert list(tree.in_order(reverse=True)) == sorted_list[::-1]
+    assert _array_bst_checker(tree, tree.root) == tree.depth()
+
+
+def test_array_bst_traversals():
+    """test pre order, post order and breadth first output"""
+    from array_bst import ArrayBinarySearchTree
+    tree = ArrayBinarySearchTree(typecode='q')
+    for num in [10, 5, 3, 7, 15, 13, 17]:
+        tree.insert(num)
+    assert list(tree.pre_order()) == [10, 5, 3, 7, 15, 13, 17]
+    assert list(tree.post_order()) == [3, 7, 5, 13, 17, 15, 10]
+    assert list(tree.breadth_first()) == [10, 5, 15, 3, 7, 13, 17]
+
+
+def test_array_bst_empty_traversals():
+    """test traversals on an empty tree raise IndexError"""
+    from array_bst import ArrayBinarySearchTree
+    tree = ArrayBinarySearchTree()
+    with pytest.raises(IndexError):
+        tree.in_order()
+    with pytest.raises(IndexError):
+        tree.pre_order()
+    with pytest.raises(IndexError):
+        tree.post_order()
+    with pytest.raises(IndexError):
+        next(tree.breadth_first())
+
+
+def test_array_bst_contains(full_array_bst):
+    """test contains for values in and out of the tree"""
+    tree, sorted_list = full_array_bst
+    assert all(tree.contains(val) for val in sorted_list)
+    assert not tree.contains(1000)
+    assert not tree.contains(-1)
+
+
+def test_array_bst_sequential_balanced():
+    """test sequential float inserts keep the tree balanced"""
+    from array_bst import ArrayBinarySearchTree
+    tree = ArrayBinarySearchTree()
+    for num in range(1000):
+        tree.insert(num / 2.0)
+    assert tree.depth() <= 14
+    assert _array_bst_checker(tree, tree.root) == tree.depth()
+    assert list(tree.in_order())[:3] == [0.0, 0.5, 1.0]
+
+
+def test_array_bst_insert_duplicate():
+    """test inserting a value twice leaves the size alone"""
+    from array_bst import ArrayBinarySearchTree
+    tree = ArrayBinarySearchTree()
+    tree.insert(1)
+    tree.insert(1)
+    assert tree.size() == 1
+
+
+def test_array_bst_insert_type_error():
+    """test non numeric inserts raise TypeError"""
+    from array_bst import ArrayBinarySearchTree
+    tree = ArrayBinarySearchTree()
+    with pytest.raises(TypeError):
+        tree.insert('one')
+    tree.insert(1)
+    with pytest.raises(TypeError):
+        tree.insert('one')
+
+
+def test_array_bst_delete(full_array_bst):
+    """test deleting every value in random order keeps the tree correct"""
+    tree, sorted_list = full_array_bst
+    remaining = list(sorted_list)
+    for val in random.sample(sorted_list, len(sorted_list)):
+        tree.delete(val)
+        remaining.remove(val)
+        assert tree.size() == len(remaining)
+        assert _array_bst_checker(tree, tree.root) >= 0
+        if remaining:
+            assert list(tree.in_order()) == remaining
+    assert tree.depth() == 0
+
+
+def test_array_bst_delete_missing():
+    """test deleting a value that isn't there does nothing"""
+    from array_bst import ArrayBinarySearchTree
+    tree = ArrayBinarySearchTree(5)
+    assert tree.delete(7) is None
+    assert tree.size() == 1
+
+
+def test_array_bst_free_list_reused():
+    """test deleted slots are reused rather than growing the arrays"""
+    from array_bst import ArrayBinarySearchTree
+    tree = ArrayBinarySearchTree(typecode='q')
+    for num in range(100):
+        tree.insert(num)
+    for num in range(0, 100, 2):
+        tree.delete(num)
+    for num in range(100, 150):
+        tree.insert(num)
+    assert len(tree._keys) == 100
+    assert list(tree.in_order()) == list(range(1, 100, 2)) + \
+        list(range(100, 150))
+
+
+def test_array_bst_dump_load(full_array_bst):
+    """test a dumped tree loads back with the same shape"""
+    from array_bst import ArrayBinarySearchTree
+    tree, sorted_list = full_array_bst
+    tree.delete(sorted_list[0])
+    stream = io.BytesIO()
+    tree.dump(stream)
+    stream.seek(0)
+    loaded = ArrayBinarySearchTree.load(stream)
+    assert loaded.typecode == 'q'
+    assert list(loaded.pre_order()) == list(tree.pre_order())
+    assert loaded.size() == tree.size()
+    loaded.insert(sorted_list[0])
+    assert list(loaded.in_order()) == sorted_list
+
+
+def test_array_bst_load_bad_input():
+    """test loading something that isn't a dump raises ValueError"""
+    from array_bst import ArrayBinarySearchTree
+    with pytest.raises(ValueError):
+        ArrayBinarySearchTree.load(io.BytesIO(b'not a tree'))
@@ -0,0 +1,307 @@
+# -*- coding: utf-8 -*-
+"""File tests the red-black, treap and scapegoat balancing engines."""
+from __future__ import unicode_literals
+
+import io
+import math
+import pytest
+import random
+
+ENGINE_NAMES = ['avl', 'red-black', 'treap', 'scapegoat']
+
+RANDOM_CASES = [random.sample(range(-500, 500), random.randrange(2, 300))
+                for n in range(5)]
+
+
+def _shape_checker(node, floor=0):
+    """helper method that returns the true size of node's subtree, or -1 if
+    the order, a stored depth or size, or the parent link of a node made
+    at or after floor (one the tree owns) is wrong"""
+    if node is None:
+        return 0
+    for child in (node.left, node.right):
+        if child is not None and child._epoch >= floor and \
+                child.parent is not node:
+            return -1
+    if node.left and node.left.val > node.val:
+        return -1
+    if node.right and node.right.val < node.val:
+        return -1
+    left = _shape_checker(node.left, floor)
+    right = _shape_checker(node.right, floor)
+    if left < 0 or right < 0:
+        return -1
+    depth = max(node.left.depth if node.left else 0,
+                node.right.depth if node.right else 0) + 1
+    if node.depth != depth or node.size != left + right + 1:
+        return -1
+    return node.size
+
+
+def _black_height(node):
+    """helper method that returns the black height of a red-black subtree,
+    or -1 if a red node has a red child or black heights differ"""
+    from balanced_bst import _is_red
+    if node is None:
+        return 1
+    if _is_red(node) and (_is_red(node.left) or _is_red(node.right)):
+        return -1
+    left = _black_height(node.left)
+    right = _black_height(node.right)
+    if left < 0 or left != right:
+        return -1
+    return left + (0 if _is_red(node) else 1)
+
+
+def _heap_checker(node):
+    """helper method that checks treap priorities are in max-heap order"""
+    if node is None:
+        return True
+    for child in (node.left, node.right):
+        if child is not None and child._tag > node._tag:
+            return False
+    return _heap_checker(node.left) and _heap_checker(node.right)
+
+
+def _engine_checker(tree):
+    """helper method that checks a tree of any engine is valid"""
+    from balanced_bst import RedBlackTree, Treap, ScapegoatTree, _is_red
+    if _shape_checker(tree.root, tree._floor) != tree.length:
+        return False
+    if tree.root is not None and tree.root._epoch >= tree._floor and \
+            tree.root.parent is not None:
+        return False
+    if isinstance(tree, RedBlackTree):
+        return not _is_red(tree.root) and _black_height(tree.root) > 0
+    if isinstance(tree, Treap):
+        return _heap_checker(tree.root)
+    if isinstance(tree, ScapegoatTree):
+        limit = math.log(max(tree._max_length, 2), 1 / tree.alpha)
+        return tree.depth() <= int(limit) + 2
+    return abs(tree.balance()) <= 1
+
+
+@pytest.fixture(scope='function', params=ENGINE_NAMES)
+def engine(request):
+    '''Return each tree class in turn'''
+    from balanced_bst import ENGINES
+    return ENGINES[request.param]
+
+
+def test_engines_registered():
+    """test every engine is a BinarySearchTree"""
+    from balanced_bst import ENGINES
+    from bst import BinarySearchTree
+    assert sorted(ENGINES) == sorted(ENGINE_NAMES)
+    assert all(issubclass(cls, BinarySearchTree) for cls in ENGINES.values())
+
+
+@pytest.mark.parametrize('sequence', RANDOM_CASES)
+def test_engine_insert(engine, sequence):
+    """test random inserts keep each engine valid"""
+    tree = engine()
+    for val in sequence:
+        tree.insert(val)
+        assert _engine_checker(tree)
+    assert list(tree.in_order()) == sorted(sequence)
+
+
+def test_engine_sequential_insert_depth(engine):
+    """test sequential inserts stay logarithmically deep"""
+    tree = engine()
+    for num in range(2000):
+        tree.insert(num)
+    assert _engine_checker(tree)
+    assert tree.depth() <= 3 * math.log(2000, 2)
+
+
+@pytest.mark.parametrize('sequence', RANDOM_CASES)
+def test_engine_delete(engine, sequence):
+    """test random deletes keep each engine valid"""
+    tree = engine()
+    for val in sequence:
+        tree[val] = -val
+    remaining = sorted(sequence)
+    for val in random.sample(sequence, len(sequence)):
+        tree.delete(val)
+        remaining.remove(val)
+        assert _engine_checker(tree)
+    assert remaining == [] and tree.root is None
+
+
+def test_engine_mapping_and_queries(engine):
+    """test the mapping and order statistic methods on each engine"""
+    tree = engine()
+    for num in random.sample(range(100), 100):
+        tree[num] = str(num)
+    assert tree[42] == '42'
+    assert tree.select(10) == 10
+    assert tree.rank(50) == 50
+    assert list(tree.range(10, 14)) == [10, 11, 12, 13, 14]
+    assert tree.pop_min() == (0, '0')
+    assert tree.pop_max() == (99, '99')
+    assert _engine_checker(tree)
+
+
+def test_engine_from_sorted(engine):
+    """test a bulk loaded tree of each engine is valid and takes inserts"""
+    tree = engine.from_sorted(range(0, 300, 3))
+    assert _engine_checker(tree)
+    for num in range(1, 300, 3):
+        tree.insert(num)
+    assert _engine_checker(tree)
+    assert len(tree) == 200
+
+
+def test_engine_set_operations(engine):
+    """test the set operations on each engine against Python's sets"""
+    first = random.sample(range(200), 80)
+    second = random.sample(range(200), 80)
+    for name in ('union', 'intersection', 'difference',
+                 'symmetric_difference'):
+        one = engine.from_iterable(first)
+        two = engine.from_iterable(second)
+        result = getattr(one, name)(two)
+        expected = getattr(set(first), name)(set(second))
+        assert list(result) == sorted(expected)
+        assert _engine_checker(result)
+        result.insert(500)
+        result.delete(500)
+        assert _engine_checker(result)
+
+
+def test_engine_split(engine):
+    """test split on each engine"""
+    tree = engine()
+    for num in random.sample(range(100), 100):
+        tree.insert(num)
+    left, right = tree.split(37)
+    assert list(left) == list(range(37))
+    assert list(right) == list(range(37, 100))
+    assert _engine_checker(left) and _engine_checker(right)
+
+
+def test_engine_snapshot(engine):
+    """test snapshots of each engine are unaffected by later writes"""
+    tree = engine()
+    for num in random.sample(range(200), 200):
+        tree.insert(num)
+    snap = tree.snapshot()
+    shape = list(snap.pre_order())
+    links = [(node, node.left, node.right, node.parent)
+             for node in snap.root._in_order()]
+    for num in random.sample(range(200), 150):
+        tree.delete(num)
+    for num in range(200, 300):
+        tree.insert(num)
+    assert list(snap.pre_order()) == shape
+    assert list(snap) == list(range(200))
+    assert _shape_checker(snap.root) == 200
+    assert all(node.left is left and node.right is right and
+               node.parent is parent
+               for node, left, right, parent in links)
+    assert _shape_checker(tree.root, tree._floor) == tree.length
+
+
+def test_engine_dump_load(engine):
+    """test each engine loads back a dump with the same shape and
+    balancing data, in either order"""
+    tree = engine()
+    for num in random.sample(range(300), 300):
+        tree.insert(num)
+    for shape in (True, False):
+        stream = io.BytesIO()
+        tree.dump(stream, shape=shape)
+        stream.seek(0)
+        loaded = engine.load(stream)
+        assert type(loaded) is engine
+        if shape:
+            assert [(node.val, node._tag) for node in
+                    loaded.root._pre_order()] == \
+                [(node.val, node._tag) for node in tree.root._pre_order()]
+        assert _engine_checker(loaded)
+        for num in range(300, 400):
+            loaded.insert(num)
+        assert _engine_checker(loaded)
+
+
+def test_engine_key_and_reverse(engine):
+    """test each engine orders by a cached key, largest first"""
+    tree = engine(key=lambda val: val % 1000, reverse=True)
+    for num in random.sample(range(1000, 1300), 300):
+        tree.insert(num)
+    assert list(tree) == list(range(1299, 999, -1))
+    for num in range(1000, 1300, 2):
+        tree.delete(num)
+    assert list(tree) == list(range(1299, 999, -2))
+    assert tree.contains(1001) and not tree.contains(1000)
+
+
+def test_engine_batch_methods(engine):
+    """test insert_many and contains_many on each engine"""
+    tree = engine.from_iterable(range(0, 400, 2))
+    tree.insert_many(random.sample(range(1, 400, 2), 200))
+    assert list(tree) == list(range(400))
+    assert _engine_checker(tree)
+    assert tree.contains_many([399, -1, 0, 400]) == [True, False, True,
+                                                     False]
+
+
+def test_engine_lazy_delete(engine):
+    """test lazy deletes, revives and compaction on each engine"""
+    tree = engine.from_iterable(range(300))
+    for num in random.sample(range(300), 200):
+        tree.lazy_delete(num)
+        if tree.tombstones == 0:
+            assert _engine_checker(tree)
+    tree.insert(-1)
+    survivors = [-1] + [num for num in range(300) if tree.contains(num)]
+    assert list(tree) == survivors and len(tree) == 101
+    assert tree.pop_min()[0] == -1
+    tree.compact()
+    assert _engine_checker(tree)
+    assert list(tree) == survivors[1:]
+
+
+def test_engine_aggregate(engine):
+    """test summaries stay right through each engine's rebalancing"""
+    from bst import SUM
+    tree = engine(monoid=SUM)
+    vals = set(random.sample(range(1000), 500))
+    for val in vals:
+        tree.insert(val)
+    for val in random.sample(sorted(vals), 300):
+        tree.delete(val)
+        vals.remove(val)
+    assert all(node.agg == sum(item.val for item in node._in_order())
+               for node in tree.root._in_order())
+    assert tree.aggregate(200, 700) == sum(val for val in vals
+                                           if 200 <= val <= 700)
+
+
+def test_scapegoat_alpha_range():
+    """test scapegoat rejects an alpha outside [0.5, 1)"""
+    from balanced_bst import ScapegoatTree
+    with pytest.raises(ValueError):
+        ScapegoatTree(alpha=1)
+    tree = ScapegoatTree(5, alpha=0.75)
+    assert tree.root.val == 5
+
+
+def test_red_black_fewer_rotations_than_avl():
+    """test red-black makes fewer rotations than AVL on sequential
+    inserts"""
+    from balanced_bst import RedBlackTree
+    from bst import BinarySearchTree
+    counts = {}
+    for cls in (BinarySearchTree, RedBlackTree):
+        tree = cls()
+        counts[cls] = [0]
+
+        def counting(pivot, original=tree._left_rotation, count=counts[cls]):
+            count[0] += 1
+            original(pivot)
+        tree._left_rotation = counting
+        for num in range(1000):
+            tree.insert(num)
+    assert counts[RedBlackTree][0] <= counts[BinarySearchTree][0]
@@ -3,9 +3,15 @@
 from __future__ import unicode_literals
 
 from collections import namedtuple
+import io
+import pickle
 import pytest
 import random
 import string
+import sys
+
+# py27 orders values of different types rather than raising TypeError
+MIXED_TYPES_RAISE = sys.version_info[0] > 2
 
 INT_CASES = [random.sample(range(1000),
              random.randrange(2, 100)) for n in range(10)
@@ -43,6 +49,69 @@ def _bst_tree_checker(node):
     return all([_bst_tree_checker(node.left), _bst_tree_checker(node.right)])
 
 
+def _size_checker(node):
+    """helper method that returns the true size of node's subtree, or -1 if
+    any stored size is stale"""
+    if node is None:
+        return 0
+    left = _size_checker(node.left)
+    right = _size_checker(node.right)
+    if left < 0 or right < 0 or node.size != left + right + 1:
+        return -1
+    return node.size
+
+
+def _avl_checker(node):
+    """helper method that returns the true depth of node's subtree, or -1 if
+    any stored depth is stale or any node is out of AVL balance"""
+    if node is None:
+        return 0
+    left = _avl_checker(node.left)
+    right = _avl_checker(node.right)
+    if left < 0 or right < 0 or abs(left - right) > 1:
+        return -1
+    if node.depth != max(left, right) + 1:
+        return -1
+    return node.depth
+
+
+def _parent_checker(root, floor=0):
+    """helper method that checks the parent link of every node under root
+    made at or after floor, the nodes a tree with that floor owns (the
+    rest keep the parent links of the tree they were shared from)"""
+    if root is None:
+        return True
+    if root._epoch >= floor and root.parent is not None:
+        return False
+    stack = [root]
+    while stack:
+        node = stack.pop()
+        for child in (node.left, node.right):
+            if child is not None:
+                if child._epoch >= floor and child.parent is not node:
+                    return False
+                stack.append(child)
+    return True
+
+
+def _full_checker(tree):
+    """helper method that checks order, balance, depths, sizes and the
+    parent links of the nodes it owns of a whole tree at once"""
+    if tree.root is None:
+        return tree.length == 0
+    if not _parent_checker(tree.root, tree._floor):
+        return False
+    return (_bst_tree_checker(tree.root) and
+            _avl_checker(tree.root) > 0 and
+            _size_checker(tree.root) == tree.length)
+
+
+SET_CASES = [(random.sample(range(300), random.randrange(0, 150)),
+              random.sample(range(300), random.randrange(0, 150)))
+             for n in range(10)] + [([], []), (list(range(100)), [50]),
+                                    ([50], list(range(100)))]
+
+
 @pytest.fixture(scope='function', params=TEST_CASES)
 def full_bst(request):
     '''Return a full bst for testing'''
@@ -514,3 +583,1400 @@ def test_bst_big_tree_deletion_two(to_delete, sequence):
         tree.insert(item)
     tree.delete(to_delete)
     assert _bst_tree_checker(tree.root)
+
+
+def test_bst_insert_sequential_stays_balanced():
+    """test that sequential inserts keep every depth correct and the tree
+    within AVL bounds"""
+    from bst import BinarySearchTree
+    tree = BinarySearchTree()
+    for num in range(1000):
+        tree.insert(num)
+    assert _avl_checker(tree.root) == tree.depth()
+    assert tree.depth() <= 14
+    assert list(tree.in_order()) == list(range(1000))
+
+
+def test_bst_insert_random_stays_balanced(full_bst):
+    """test that random inserts keep the tree within AVL bounds"""
+    assert _avl_checker(full_bst.bin_tree.root) > 0
+    assert _bst_tree_checker(full_bst.bin_tree.root)
+
+
+def test_bst_insert_duplicate_ignored():
+    """test that inserting a value twice leaves size and shape alone"""
+    from bst import BinarySearchTree
+    tree = BinarySearchTree()
+    for num in [5, 3, 8, 3, 5]:
+        tree.insert(num)
+    assert tree.size() == 3
+    assert list(tree.pre_order()) == [5, 3, 8]
+
+
+@pytest.mark.skipif(not MIXED_TYPES_RAISE, reason='py27 orders mixed types')
+def test_bst_insert_type_error():
+    """test that mixing types on insert raises TypeError"""
+    from bst import BinarySearchTree
+    tree = BinarySearchTree()
+    tree.insert(5)
+    with pytest.raises(TypeError):
+        tree.insert('five')
+
+
+def test_bst_from_iterable(full_bst):
+    """test that from_iterable builds a balanced tree of the unique values"""
+    from bst import BinarySearchTree
+    tree = BinarySearchTree.from_iterable(full_bst.sorted_list[::-1] * 2)
+    assert list(tree.in_order()) == full_bst.sorted_list
+    assert tree.size() == full_bst.length
+    assert _avl_checker(tree.root) > 0
+
+
+def test_bst_from_sorted_is_perfectly_balanced():
+    """test that from_sorted gives the minimum possible depth"""
+    from bst import BinarySearchTree
+    tree = BinarySearchTree.from_sorted(range(1023))
+    assert tree.depth() == 10
+    assert tree.balance() == 0
+    assert _avl_checker(tree.root) == 10
+
+
+def test_bst_from_sorted_drops_duplicates():
+    """test that from_sorted drops adjacent duplicates"""
+    from bst import BinarySearchTree
+    tree = BinarySearchTree.from_sorted([1, 1, 2, 3, 3, 3])
+    assert list(tree.in_order()) == [1, 2, 3]
+    assert len(tree) == 3
+
+
+def test_bst_from_iterable_empty():
+    """test that from_iterable on an empty input gives an empty tree"""
+    from bst import BinarySearchTree
+    tree = BinarySearchTree.from_iterable([])
+    assert tree.root is None
+    assert tree.size() == 0
+
+
+def test_bst_from_iterable_then_insert():
+    """test that a bulk loaded tree keeps balancing on later inserts"""
+    from bst import BinarySearchTree
+    tree = BinarySearchTree.from_iterable(range(0, 200, 2))
+    for num in range(1, 200, 2):
+        tree.insert(num)
+    assert list(tree.in_order()) == list(range(200))
+    assert _avl_checker(tree.root) > 0
+
+
+def test_bst_in_order_reverse(full_bst):
+    """test reverse in order traversal output"""
+    results = full_bst.bin_tree.in_order(reverse=True)
+    assert list(results) == full_bst.sorted_list[::-1]
+
+
+def test_bst_in_order_subtree():
+    """test in order traversal from a starting node covers only its
+    subtree"""
+    from bst import BinarySearchTree
+    tree = BinarySearchTree.from_sorted(range(15))
+    assert list(tree.in_order(tree.root.left)) == list(range(7))
+    assert list(tree.in_order(tree.root.right, True)) == list(range(14, 7, -1))
+
+
+def test_bst_traversals_deep_tree():
+    """test traversals of a degenerate tree deeper than the recursion
+    limit"""
+    import sys
+    from bst import BinarySearchTree, Node
+    tree = BinarySearchTree()
+    count = sys.getrecursionlimit() + 100
+    tree.root = node = Node(0)
+    for num in range(1, count):
+        node.right = Node(num)
+        node = node.right
+    tree.length = count
+    assert list(tree.in_order()) == list(range(count))
+    assert list(tree.in_order(reverse=True)) == list(range(count))[::-1]
+    assert list(tree.pre_order()) == list(range(count))
+    assert list(tree.post_order()) == list(range(count))[::-1]
+
+
+def test_bst_pre_post_order_random(full_bst):
+    """test pre and post order contain every value with the root at the
+    correct end"""
+    tree = full_bst.bin_tree
+    pre = list(tree.pre_order())
+    post = list(tree.post_order())
+    assert sorted(pre) == sorted(post) == full_bst.sorted_list
+    assert pre[0] == post[-1] == tree.root.val
+
+
+def test_bst_sizes_after_inserts(full_bst):
+    """test that every node's size is right after random inserts"""
+    assert _size_checker(full_bst.bin_tree.root) == full_bst.length
+
+
+@pytest.mark.parametrize('to_delete, sequence', _random_generator())
+def test_bst_sizes_and_balance_after_delete(to_delete, sequence):
+    """test that delete keeps sizes, depths and balance correct"""
+    from bst import BinarySearchTree
+    tree = BinarySearchTree()
+    for item in sequence:
+        tree.insert(item)
+    tree.delete(to_delete)
+    assert _size_checker(tree.root) == len(sequence) - 1
+    assert _avl_checker(tree.root) > 0
+    assert list(tree.in_order()) == sorted(set(sequence) - {to_delete})
+
+
+def test_bst_delete_everything():
+    """test that deleting every value in turn leaves an empty tree"""
+    from bst import BinarySearchTree
+    tree = BinarySearchTree.from_sorted(range(100))
+    for num in random.sample(range(100), 100):
+        tree.delete(num)
+        assert _avl_checker(tree.root) >= 0
+    assert tree.root is None
+    assert tree.size() == 0
+
+
+def test_bst_rank_and_select(full_bst):
+    """test that rank and select agree with the sorted values"""
+    tree = full_bst.bin_tree
+    for index, val in enumerate(full_bst.sorted_list):
+        assert tree.rank(val) == index
+        assert tree.select(index) == val
+    assert tree.select(-1) == full_bst.sorted_list[-1]
+
+
+def test_bst_rank_missing_value():
+    """test rank of values that aren't in the tree"""
+    from bst import BinarySearchTree
+    tree = BinarySearchTree.from_sorted(range(0, 100, 10))
+    assert tree.rank(-5) == 0
+    assert tree.rank(15) == 2
+    assert tree.rank(500) == 10
+
+
+def test_bst_select_out_of_range():
+    """test select raises IndexError out of range"""
+    from bst import BinarySearchTree
+    tree = BinarySearchTree.from_sorted(range(5))
+    with pytest.raises(IndexError):
+        tree.select(5)
+    with pytest.raises(IndexError):
+        BinarySearchTree().select(0)
+
+
+def test_bst_count_range():
+    """test count_range is inclusive at both ends"""
+    from bst import BinarySearchTree
+    tree = BinarySearchTree.from_sorted(range(0, 100, 2))
+    assert tree.count_range(10, 20) == 6
+    assert tree.count_range(11, 19) == 4
+    assert tree.count_range(-50, 500) == 50
+    assert tree.count_range(20, 10) == 0
+
+
+def test_bst_percentile():
+    """test nearest-rank percentiles"""
+    from bst import BinarySearchTree
+    tree = BinarySearchTree.from_iterable(range(1, 101))
+    assert tree.percentile(50) == 50
+    assert tree.percentile(99) == 99
+    assert tree.percentile(100) == 100
+    assert tree.percentile(0) == 1
+    with pytest.raises(ValueError):
+        tree.percentile(101)
+
+
+def test_bst_range(full_bst):
+    """test range matches filtering the sorted values"""
+    tree = full_bst.bin_tree
+    low = full_bst.sorted_list[len(full_bst.sorted_list) // 4]
+    high = full_bst.sorted_list[len(full_bst.sorted_list) // 2]
+    expected = [val for val in full_bst.sorted_list if low <= val <= high]
+    assert list(tree.range(low, high)) == expected
+    expected = [val for val in full_bst.sorted_list if low < val < high]
+    assert list(tree.range(low, high, inclusive=(False, False))) == expected
+
+
+def test_bst_range_bounds_outside_tree():
+    """test range with bounds that aren't values in the tree"""
+    from bst import BinarySearchTree
+    tree = BinarySearchTree.from_sorted(range(0, 100, 10))
+    assert list(tree.range(15, 45)) == [20, 30, 40]
+    assert list(tree.range(-100, 5)) == [0]
+    assert list(tree.range(95, 200)) == []
+    assert list(tree.range(50, 40)) == []
+    assert list(BinarySearchTree().range(0, 10)) == []
+
+
+def test_bst_range_is_pruned():
+    """test range only visits nodes on the boundary paths and the result"""
+    from bst import BinarySearchTree
+    tree = BinarySearchTree.from_sorted(range(1 << 12))
+    visited = []
+
+    class Key(int):
+        def __lt__(self, other):
+            visited.append(other)
+            return int(self) < other
+
+        def __gt__(self, other):
+            visited.append(other)
+            return int(self) > other
+    result = list(tree.range(Key(1000), Key(1009)))
+    assert result == list(range(1000, 1010))
+    assert len(visited) < 100
+
+
+def test_bst_floor_ceiling():
+    """test floor and ceiling on values in and out of the tree"""
+    from bst import BinarySearchTree
+    tree = BinarySearchTree.from_sorted(range(0, 100, 10))
+    assert tree.floor(40) == 40
+    assert tree.floor(45) == 40
+    assert tree.floor(-1) is None
+    assert tree.ceiling(40) == 40
+    assert tree.ceiling(45) == 50
+    assert tree.ceiling(91) is None
+
+
+def test_bst_successor_predecessor(full_bst):
+    """test successor and predecessor walk the sorted values"""
+    tree = full_bst.bin_tree
+    values = full_bst.sorted_list
+    for index, val in enumerate(values):
+        after = values[index + 1] if index + 1 < len(values) else None
+        before = values[index - 1] if index > 0 else None
+        assert tree.successor(val) == after
+        assert tree.predecessor(val) == before
+
+
+def test_bst_insert_keeps_data():
+    """test that insert stores the data on every branch"""
+    from bst import BinarySearchTree
+    tree = BinarySearchTree()
+    for num in [50, 25, 75, 10, 30, 60, 90]:
+        tree.insert(num, str(num))
+    for num in [50, 25, 75, 10, 30, 60, 90]:
+        assert tree[num] == str(num)
+
+
+def test_bst_mapping_get_set_del():
+    """test the mapping item methods"""
+    from bst import BinarySearchTree
+    tree = BinarySearchTree()
+    tree[3] = 'c'
+    tree[1] = 'a'
+    tree[2] = 'b'
+    tree[3] = 'C'
+    assert len(tree) == 3
+    assert tree[3] == 'C'
+    assert tree.get(4) is None
+    assert tree.get(4, 'd') == 'd'
+    assert 2 in tree
+    del tree[2]
+    assert 2 not in tree
+    with pytest.raises(KeyError):
+        tree[2]
+    with pytest.raises(KeyError):
+        del tree[2]
+
+
+def test_bst_mapping_views(full_bst):
+    """test keys, values and items come out in value order"""
+    tree = full_bst.bin_tree
+    for val in full_bst.sorted_list:
+        tree[val] = [val]
+    assert list(tree) == full_bst.sorted_list
+    assert list(tree.keys()) == full_bst.sorted_list
+    assert list(reversed(tree.keys())) == full_bst.sorted_list[::-1]
+    assert list(tree.values()) == [[val] for val in full_bst.sorted_list]
+    assert list(tree.items()) == [(val, [val])
+                                  for val in full_bst.sorted_list]
+    assert list(reversed(tree.items()))[0] == (full_bst.sorted_list[-1],
+                                               [full_bst.sorted_list[-1]])
+    assert (full_bst.sorted_list[0], [full_bst.sorted_list[0]]) in \
+        tree.items()
+    assert len(tree.items()) == full_bst.length
+
+
+def test_bst_mapping_views_are_live():
+    """test views reflect changes made after they were created"""
+    from bst import BinarySearchTree
+    tree = BinarySearchTree()
+    keys = tree.keys()
+    values = tree.values()
+    assert list(keys) == []
+    tree[2] = 'two'
+    tree[1] = 'one'
+    assert list(keys) == [1, 2]
+    assert list(values) == ['one', 'two']
+    assert 1 in keys
+
+
+def test_bst_pop_min_max():
+    """test pop_min and pop_max remove the ends and return their data"""
+    from bst import BinarySearchTree
+    tree = BinarySearchTree()
+    for num in random.sample(range(50), 50):
+        tree[num] = num * 2
+    assert tree.pop_min() == (0, 0)
+    assert tree.pop_max() == (49, 98)
+    assert tree.pop_min() == (1, 2)
+    assert len(tree) == 47
+    assert list(tree) == list(range(2, 49))
+    assert _avl_checker(tree.root) > 0
+
+
+def test_bst_pop_min_empty():
+    """test pop_min and pop_max on an empty tree raise KeyError"""
+    from bst import BinarySearchTree
+    tree = BinarySearchTree()
+    with pytest.raises(KeyError):
+        tree.pop_min()
+    with pytest.raises(KeyError):
+        tree.pop_max()
+
+
+def test_bst_delete_keeps_data():
+    """test that deleting a node with two children keeps every other
+    value's data"""
+    from bst import BinarySearchTree
+    tree = BinarySearchTree()
+    for num in range(20):
+        tree[num] = -num
+    tree.delete(tree.root.val)
+    assert all(tree[val] == -val for val in tree)
+
+
+def test_bst_node_has_no_dict():
+    """test that Node uses __slots__ and so carries no __dict__"""
+    from bst import Node
+    node = Node(1)
+    assert not hasattr(node, '__dict__')
+    with pytest.raises(AttributeError):
+        node.colour = 'red'
+
+
+def test_bst_rotations_keep_parent_links(full_bst):
+    """test that every child's parent link points back at its parent"""
+    stack = [full_bst.bin_tree.root]
+    assert full_bst.bin_tree.root.parent is None
+    while stack:
+        node = stack.pop()
+        for child in (node.left, node.right):
+            if child is not None:
+                assert child.parent is node
+                stack.append(child)
+
+
+def test_bst_insert_stops_retracing_early():
+    """test an insert that leaves its parent's depth alone checks no
+    balances above it, but still refreshes sizes up to the root"""
+    from bst import BinarySearchTree
+    tree = BinarySearchTree.from_sorted(range(0, 2046, 2))
+    tree.insert(1)
+    calls = []
+    balance = tree.balance
+    tree.balance = lambda node: calls.append(node) or balance(node)
+    tree.insert(-1)
+    del tree.balance
+    assert len(calls) == 1
+    assert _full_checker(tree)
+
+
+def test_bst_breadth_first_by_level():
+    """test breadth-first grouped into levels"""
+    from bst import BinarySearchTree
+    tree = BinarySearchTree.from_sorted(range(1, 8))
+    result = [[4], [2, 6], [1, 3, 5, 7]]
+    assert list(tree.breadth_first(by_level=True)) == result
+
+
+def test_bst_breadth_first_max_depth():
+    """test breadth-first stops after max_depth levels"""
+    from bst import BinarySearchTree
+    tree = BinarySearchTree.from_sorted(range(1, 8))
+    assert list(tree.breadth_first(max_depth=2)) == [4, 2, 6]
+    assert list(tree.breadth_first(by_level=True, max_depth=1)) == [[4]]
+    assert list(tree.breadth_first(max_depth=0)) == []
+
+
+def test_bst_breadth_first_starting_point():
+    """test breadth-first from a node handle or a value in the tree"""
+    from bst import BinarySearchTree
+    tree = BinarySearchTree.from_sorted(range(1, 8))
+    assert list(tree.breadth_first(tree.root.right)) == [6, 5, 7]
+    assert list(tree.breadth_first(2)) == [2, 1, 3]
+    with pytest.raises(IndexError):
+        next(tree.breadth_first(99))
+
+
+def test_bst_breadth_first_skips_deleted_levels():
+    """test levels holding only tombstones aren't yielded as empty lists"""
+    from bst import BinarySearchTree
+    tree = BinarySearchTree.from_sorted(range(1, 8))
+    tree.compact_ratio = 1
+    for num in (2, 6):
+        tree.lazy_delete(num)
+    assert list(tree.breadth_first(by_level=True)) == [[4], [1, 3, 5, 7]]
+    tree.lazy_delete(4)
+    assert list(tree.breadth_first(by_level=True, max_depth=2)) == []
+    assert list(tree.breadth_first()) == [1, 3, 5, 7]
+
+
+def test_bst_breadth_first_full(full_bst):
+    """test breadth-first visits every value once with the root first"""
+    tree = full_bst.bin_tree
+    result = list(tree.breadth_first())
+    assert sorted(result) == full_bst.sorted_list
+    assert result[0] == tree.root.val
+    levels = list(tree.breadth_first(by_level=True))
+    assert len(levels) == tree.depth()
+
+
+@pytest.mark.parametrize('first, second', SET_CASES)
+def test_bst_set_operations(first, second):
+    """test each set operation against Python's sets"""
+    from bst import BinarySearchTree
+    operations = [
+        ('union', set.union),
+        ('intersection', set.intersection),
+        ('difference', set.difference),
+        ('symmetric_difference', set.symmetric_difference),
+    ]
+    for name, expected in operations:
+        one = BinarySearchTree.from_iterable(first)
+        two = BinarySearchTree.from_iterable(second)
+        result = getattr(one, name)(two)
+        assert list(result) == sorted(expected(set(first), set(second)))
+        assert _full_checker(result)
+        assert list(one) == sorted(set(first)) and len(one) == len(first)
+        assert list(two) == sorted(set(second))
+        assert _shared_checker(one) and _shared_checker(two)
+
+
+def _shared_checker(tree):
+    """helper method that checks order, balance and sizes of a tree that
+    may share nodes with others, whose parent links aren't its own"""
+    if tree.root is None:
+        return tree.length == 0
+    return (_bst_tree_checker(tree.root) and
+            _avl_checker(tree.root) > 0 and
+            _size_checker(tree.root) == tree.length + tree.tombstones)
+
+
+def test_bst_set_operations_independent():
+    """test the result and both inputs of a set operation can each be
+    changed without the others seeing it"""
+    from bst import BinarySearchTree
+    one = BinarySearchTree.from_sorted(range(0, 300, 2))
+    two = BinarySearchTree.from_sorted(range(0, 300, 3))
+    result = one.union(two)
+    expected = sorted(set(range(0, 300, 2)) | set(range(0, 300, 3)))
+    for num in range(0, 300, 6):
+        one.delete(num)
+        result[num + 1] = 'new'
+        two.lazy_delete(num)
+    assert list(one) == [num for num in range(0, 300, 2) if num % 6]
+    assert list(two) == [num for num in range(0, 300, 3) if num % 6]
+    assert list(result) == sorted(set(expected) |
+                                  set(range(1, 300, 6)))
+    assert _full_checker(result)
+    assert _shared_checker(one) and _shared_checker(two)
+
+
+def _links(tree):
+    """helper method that captures the identity of every node of a tree
+    and of its children and parent"""
+    if tree.root is None:
+        return []
+    return [tuple(id(item) for item in (node, node.left, node.right,
+                                        node.parent))
+            for node in tree.root._in_order()]
+
+
+def test_bst_derived_trees_keep_input_parents():
+    """test split, join and set operations, and later writes to the trees
+    they return, leave every link of their inputs alone"""
+    from bst import BinarySearchTree
+    one = BinarySearchTree.from_sorted(range(0, 40, 2))
+    two = BinarySearchTree.from_sorted(range(0, 60, 3))
+    parent = one.find_node(10).parent
+    before = _links(one), _links(two)
+    union = one.union(two)
+    union.insert(100)
+    left, right = one.split(21)
+    left.insert(-1)
+    right.delete(30)
+    joined = BinarySearchTree.join(*two.split(30))
+    joined.insert(31)
+    difference = two.difference(one)
+    difference.pop_min()
+    assert one.find_node(10).parent is parent
+    assert (_links(one), _links(two)) == before
+    assert _parent_checker(one.root) and _parent_checker(two.root)
+    for tree in (union, left, right, joined, difference):
+        assert _full_checker(tree)
+
+
+def test_bst_set_operations_copy_only_touched_nodes():
+    """test a union of a small tree into a large one copies few of the
+    large tree's nodes"""
+    from bst import BinarySearchTree
+    big = BinarySearchTree.from_sorted(range(0, 2 ** 15, 2))
+    small = BinarySearchTree.from_sorted([7, 5001, 20001])
+    result = big.union(small)
+    big_nodes = set(id(node) for node in big.root._in_order())
+    new_nodes = [node for node in result.root._in_order()
+                 if id(node) not in big_nodes]
+    assert len(new_nodes) <= 3 * 4 * big.depth()
+    assert len(result) == len(big) + 3
+
+
+@pytest.mark.parametrize('first, second', SET_CASES)
+def test_bst_set_operations_with_tombstones(first, second):
+    """test set operations between trees with lazily deleted values, which
+    count as absent whichever side they're on"""
+    from bst import BinarySearchTree
+    one = BinarySearchTree.from_iterable(first + second[::4])
+    two = BinarySearchTree.from_iterable(second + first[::4])
+    for tree in (one, two):
+        tree.compact_ratio = 1
+    for val in first[::3] + second[::4]:
+        one.lazy_delete(val)
+    for val in second[::3] + first[::4]:
+        two.lazy_delete(val)
+    first_live = set(one)
+    second_live = set(two)
+    for name in ('union', 'intersection', 'difference',
+                 'symmetric_difference'):
+        result = getattr(one, name)(two)
+        assert list(result) == sorted(getattr(first_live, name)(
+            second_live))
+        assert _shared_checker(result)
+        assert len(result) == len(list(result))
+        assert set(one) == first_live and set(two) == second_live
+
+
+def test_bst_union_keeps_own_data():
+    """test union and intersection keep the first tree's data for values in
+    both, whichever tree is larger"""
+    from bst import BinarySearchTree
+    for small, large in ((range(10, 20), range(100)),
+                         (range(100), range(10, 20))):
+        for name in ('union', 'intersection'):
+            one = BinarySearchTree()
+            two = BinarySearchTree()
+            for num in small:
+                one[num] = 'one'
+            for num in large:
+                two[num] = 'two'
+            result = getattr(one, name)(two)
+            assert all(result[num] == 'one' for num in range(10, 20))
+
+
+def test_bst_set_operation_same_tree():
+    """test a set operation of a tree with itself raises ValueError"""
+    from bst import BinarySearchTree
+    tree = BinarySearchTree.from_sorted(range(10))
+    with pytest.raises(ValueError):
+        tree.union(tree)
+
+
+@pytest.mark.parametrize('val', [-1, 0, 17, 50, 51, 99, 100, 500])
+def test_bst_split(val):
+    """test split puts smaller values left and the rest right"""
+    from bst import BinarySearchTree
+    tree = BinarySearchTree()
+    sample = list(range(0, 100, 3)) + list(range(1, 100, 3))
+    for num in random.sample(sample, len(sample)):
+        tree[num] = str(num)
+    values = list(tree)
+    left, right = tree.split(val)
+    assert list(left) == [num for num in values if num < val]
+    assert list(right) == [num for num in values if num >= val]
+    assert _full_checker(left) and _full_checker(right)
+    assert all(right[num] == str(num) for num in right)
+    assert list(tree) == values and _shared_checker(tree)
+    left.insert(val + 0.5)
+    assert list(tree) == values
+
+
+def test_bst_join():
+    """test join of trees of very different depths"""
+    from bst import BinarySearchTree
+    left = BinarySearchTree.from_sorted(range(3))
+    right = BinarySearchTree.from_sorted(range(10, 1000))
+    result = BinarySearchTree.join(left, right)
+    assert list(result) == list(range(3)) + list(range(10, 1000))
+    assert _full_checker(result)
+    assert list(left) == list(range(3))
+    assert list(right) == list(range(10, 1000))
+    result = BinarySearchTree.join(result, BinarySearchTree())
+    assert len(result) == 993
+    result = BinarySearchTree.join(BinarySearchTree.from_sorted([-5]),
+                                   result)
+    assert result.select(0) == -5
+    assert _full_checker(result)
+
+
+def test_bst_join_overlapping():
+    """test join raises ValueError when the trees overlap"""
+    from bst import BinarySearchTree
+    left = BinarySearchTree.from_sorted(range(10))
+    right = BinarySearchTree.from_sorted(range(5, 15))
+    with pytest.raises(ValueError):
+        BinarySearchTree.join(left, right)
+    assert len(left) == 10
+
+
+def _shape(tree):
+    """helper method that captures a tree's values, data, shape, depths and
+    sizes without following parent links"""
+    if tree.root is None:
+        return []
+    return [(node.val, node.data, node.depth, node.size,
+             node.left.val if node.left else None,
+             node.right.val if node.right else None)
+            for node in tree.root._pre_order()]
+
+
+def test_bst_snapshot_unchanged_by_writes(full_bst):
+    """test a snapshot keeps its values, data and shape while the original
+    is changed every way it can be"""
+    tree = full_bst.bin_tree
+    for val in full_bst.sorted_list:
+        tree[val] = 'old'
+    snap = tree.snapshot()
+    before = _shape(snap)
+    for val in full_bst.sorted_list[::3]:
+        tree.delete(val)
+    for val in full_bst.sorted_list[1::3]:
+        tree[val] = 'new'
+    for val in full_bst.sorted_list[::6]:
+        tree.insert(val)
+    tree.pop_min()
+    tree.pop_max()
+    assert _shape(snap) == before
+    assert len(snap) == full_bst.length
+    assert list(snap.values()) == ['old'] * full_bst.length
+    assert _full_checker(tree)
+
+
+def test_bst_snapshot_keeps_parent_links():
+    """test rotations and relinking in the original after a snapshot leave
+    every link of the snapshot's nodes alone"""
+    from bst import BinarySearchTree
+    tree = BinarySearchTree.from_sorted(range(0, 40, 2))
+    snap = tree.snapshot()
+    before = _links(snap)
+    for val in (20, 30, 36):
+        tree.delete(val)
+    for val in range(41, 61, 2):
+        tree.insert(val)
+    tree.pop_min()
+    assert _links(snap) == before and _parent_checker(snap.root)
+    assert _full_checker(tree)
+
+
+def test_bst_copy_original_unchanged_by_copy_writes():
+    """test writes to a copy leave the original alone"""
+    from bst import BinarySearchTree
+    tree = BinarySearchTree.from_sorted(range(100))
+    copy = tree.copy()
+    before = _shape(tree)
+    for num in range(0, 100, 2):
+        copy.delete(num)
+    copy[500] = 'x'
+    assert _shape(tree) == before
+    assert list(copy) == list(range(1, 100, 2)) + [500]
+    assert list(tree) == list(range(100))
+
+
+def test_bst_snapshot_is_read_only():
+    """test every write to a snapshot raises and leaves it alone, while
+    copies and trees derived from it can be changed"""
+    from bst import BinarySearchTree
+    tree = BinarySearchTree.from_sorted(range(10))
+    snap = tree.snapshot()
+    writes = [lambda: snap.insert(20), lambda: snap.delete(3),
+              lambda: snap.lazy_delete(3), lambda: snap.pop_min(),
+              lambda: snap.pop_max(), lambda: snap.insert_many([20]),
+              lambda: snap.compact(), lambda: snap.__setitem__(20, 'x'),
+              lambda: snap.__delitem__(3)]
+    for write in writes:
+        with pytest.raises(TypeError):
+            write()
+    assert list(snap) == list(range(10)) and _full_checker(snap)
+    assert snap.snapshot().read_only
+    copy = snap.copy()
+    copy.delete(3)
+    left, right = snap.split(5)
+    left.insert(20)
+    union = snap.union(copy)
+    union.insert(30)
+    assert list(copy) == [0, 1, 2, 4, 5, 6, 7, 8, 9]
+    assert list(left) == [0, 1, 2, 3, 4, 20]
+    assert list(union) == list(range(10)) + [30]
+    assert list(snap) == list(range(10))
+
+
+def test_bst_snapshot_copies_only_touched_path():
+    """test one insert after a snapshot copies O(log n) nodes"""
+    from bst import BinarySearchTree
+    tree = BinarySearchTree.from_sorted(range(1023))
+    snap = tree.snapshot()
+    tree.insert(2000)
+    old_nodes = set(id(node) for node in snap.root._in_order())
+    new_nodes = [node for node in tree.root._in_order()
+                 if id(node) not in old_nodes]
+    assert len(new_nodes) <= 2 * tree.depth()
+
+
+def test_bst_snapshot_of_snapshot():
+    """test snapshots can be taken repeatedly and from snapshots"""
+    from bst import BinarySearchTree
+    tree = BinarySearchTree.from_sorted(range(10))
+    first = tree.snapshot()
+    tree.insert(10)
+    second = tree.snapshot()
+    tree.insert(11)
+    third = first.snapshot()
+    copy = first.copy()
+    copy.delete(0)
+    assert list(copy) == list(range(1, 10))
+    assert list(first) == list(range(10))
+    assert list(second) == list(range(11))
+    assert list(third) == list(range(10))
+    assert list(tree) == list(range(12))
+
+
+def test_bst_snapshot_then_set_operation():
+    """test set operations on a tree with a snapshot leave the snapshot
+    alone"""
+    from bst import BinarySearchTree
+    tree = BinarySearchTree.from_sorted(range(0, 100, 2))
+    snap = tree.snapshot()
+    before = _shape(snap)
+    result = tree.union(BinarySearchTree.from_sorted(range(1, 100, 2)))
+    assert list(result) == list(range(100))
+    assert _full_checker(result)
+    assert _shape(snap) == before
+    left, right = snap.split(50)
+    assert list(left) == list(range(0, 50, 2))
+
+
+def _round_trip(tree, shape=True):
+    """helper method that dumps a tree and loads it back"""
+    stream = io.BytesIO()
+    tree.dump(stream, shape=shape)
+    stream.seek(0)
+    return tree.load(stream)
+
+
+def test_bst_dump_load_same_shape(full_bst):
+    """test a dumped tree loads back with the same values and shape"""
+    tree = full_bst.bin_tree
+    for val in full_bst.sorted_list[::2]:
+        tree[val] = [val]
+    loaded = _round_trip(tree)
+    assert _shape(loaded) == _shape(tree)
+    assert _full_checker(loaded)
+    assert len(loaded) == full_bst.length
+
+
+def test_bst_dump_load_sorted(full_bst):
+    """test a dump in sorted order loads back perfectly balanced"""
+    tree = full_bst.bin_tree
+    loaded = _round_trip(tree, shape=False)
+    assert list(loaded) == full_bst.sorted_list
+    assert _full_checker(loaded)
+    assert loaded.depth() == full_bst.length.bit_length()
+
+
+def test_bst_dump_int_keys_as_array():
+    """test int and float values are written raw and data is left out
+    when there isn't any"""
+    from bst import BinarySearchTree
+    for vals, itemsize in ((range(1000), 8), ([i / 2.0 for i in range(1000)],
+                                              8)):
+        stream = io.BytesIO()
+        BinarySearchTree.from_sorted(vals).dump(stream)
+        assert len(stream.getvalue()) < 1000 * (itemsize + 1) + 100
+
+
+def test_bst_dump_load_empty():
+    """test an empty tree survives a round trip"""
+    from bst import BinarySearchTree
+    loaded = _round_trip(BinarySearchTree())
+    assert loaded.root is None and len(loaded) == 0
+    loaded.insert(1)
+    assert list(loaded) == [1]
+
+
+def test_bst_dump_load_then_write():
+    """test a loaded tree takes inserts and deletes"""
+    from bst import BinarySearchTree
+    tree = BinarySearchTree()
+    for num in random.sample(range(500), 500):
+        tree.insert(num)
+    loaded = _round_trip(tree)
+    for num in range(0, 500, 2):
+        loaded.delete(num)
+    for num in range(500, 600):
+        loaded.insert(num)
+    assert _full_checker(loaded)
+    assert list(loaded) == list(range(1, 500, 2)) + list(range(500, 600))
+
+
+def test_bst_load_bad_input():
+    """test loading something that isn't a whole dump raises ValueError"""
+    from bst import BinarySearchTree
+    with pytest.raises(ValueError):
+        BinarySearchTree.load(io.BytesIO(b'not a tree at all'))
+    stream = io.BytesIO()
+    BinarySearchTree.from_sorted(range(100)).dump(stream)
+    with pytest.raises(ValueError):
+        BinarySearchTree.load(io.BytesIO(stream.getvalue()[:-10]))
+
+
+RECORDS = [{'name': name, 'age': age} for name, age in
+           zip(random.sample(string.ascii_letters, 40),
+               random.sample(range(100), 40))]
+
+
+def _ordered_checker(tree, expected):
+    """helper method that checks a keyed tree iterates in expected order
+    and keeps its depths, sizes and balance"""
+    return (list(tree) == expected and
+            _avl_checker(tree.root) >= 0 and
+            _size_checker(tree.root) == tree.length)
+
+
+def test_bst_key_orders_records():
+    """test a key function orders records by a derived field, and lookups
+    take records"""
+    from bst import BinarySearchTree
+    tree = BinarySearchTree(key=lambda record: record['age'])
+    for record in RECORDS:
+        tree[record] = record['name']
+    by_age = sorted(RECORDS, key=lambda record: record['age'])
+    assert _ordered_checker(tree, by_age)
+    assert all(tree[record] == record['name'] for record in RECORDS)
+    assert {'age': by_age[3]['age']} in tree
+    assert tree.rank(by_age[5]) == 5
+    assert tree.floor({'age': 1000}) is by_age[-1]
+    assert list(tree.range(by_age[2], by_age[4])) == by_age[2:5]
+    for record in by_age[::2]:
+        tree.delete(record)
+    assert _ordered_checker(tree, by_age[1::2])
+
+
+def test_bst_key_computed_once_per_value():
+    """test the key function runs once per insert and once per lookup,
+    never per comparison"""
+    from bst import BinarySearchTree
+    calls = [0]
+
+    def key(val):
+        calls[0] += 1
+        return -val
+    tree = BinarySearchTree(key=key)
+    for num in random.sample(range(500), 500):
+        tree.insert(num)
+    assert calls[0] == 500
+    assert tree.contains(250)
+    assert calls[0] == 501
+    assert list(tree)[:3] == [499, 498, 497]
+
+
+@pytest.mark.parametrize('vals', [random.sample(range(-200, 200), 150),
+                                  random.sample(string.printable, 80)])
+def test_bst_reverse(vals):
+    """test reverse trees of numbers and of strings run largest first"""
+    from bst import BinarySearchTree
+    tree = BinarySearchTree(reverse=True)
+    for val in vals:
+        tree.insert(val)
+    expected = sorted(vals, reverse=True)
+    assert _ordered_checker(tree, expected)
+    assert tree.select(0) == expected[0]
+    assert tree.ceiling(expected[10]) == expected[10]
+    assert tree.successor(expected[10]) == expected[11]
+    assert list(tree.range(expected[3], expected[6])) == expected[3:7]
+    assert tree.count_range(expected[3], expected[6]) == 4
+    assert tree.pop_min() == (expected[0], None)
+    left, right = tree.split(expected[20])
+    assert list(left) == expected[1:20]
+    assert list(right) == expected[20:]
+
+
+def test_bst_reverse_mixed_numbers():
+    """test reverse trees of mixed number types, bools and Fractions
+    included, order largest first"""
+    from bst import BinarySearchTree
+    from fractions import Fraction
+    vals = [3, 2.5, True, 7, Fraction(9, 2)]
+    tree = BinarySearchTree(reverse=True)
+    for val in vals:
+        tree.insert(val)
+    assert list(tree) == sorted(vals, reverse=True)
+    assert tree.contains(1) and tree.contains(Fraction(5, 2))
+    if MIXED_TYPES_RAISE:
+        with pytest.raises(TypeError):
+            tree.insert('a')
+
+
+def test_bst_key_returning_none():
+    """test a key function that returns None orders by None, not by the
+    value"""
+    from bst import BinarySearchTree
+    tree = BinarySearchTree(key=lambda val: None)
+    for val in ('b', 'a', 'c'):
+        tree.insert(val)
+    assert list(tree) == ['b'] and tree.root.key is None
+    assert tree.contains('z')
+
+
+def test_bst_reverse_with_key_and_bulk_load():
+    """test from_iterable and dump/load keep a key and reverse order"""
+    from bst import BinarySearchTree
+    key = len
+    words = ['a', 'bbb', 'cc', 'dddd', 'ee', 'f']
+    tree = BinarySearchTree.from_iterable(words, key=key, reverse=True)
+    assert list(tree) == ['dddd', 'bbb', 'cc', 'a']
+    assert _ordered_checker(tree, ['dddd', 'bbb', 'cc', 'a'])
+    stream = io.BytesIO()
+    tree.dump(stream)
+    stream.seek(0)
+    loaded = BinarySearchTree.load(stream, key=key, reverse=True)
+    assert _shape(loaded) == _shape(tree)
+    loaded.insert('eeeee')
+    assert list(loaded) == ['eeeee', 'dddd', 'bbb', 'cc', 'a']
+
+
+def test_bst_set_operations_with_key():
+    """test set operations on keyed trees, and that trees ordered
+    differently can't be combined"""
+    from bst import BinarySearchTree
+    key = abs
+    one = BinarySearchTree.from_iterable(range(-10, 0), key=key)
+    two = BinarySearchTree.from_iterable(range(5, 15), key=key)
+    result = one.union(two)
+    assert list(result) == list(range(-1, -10, -1)) + [-10] + \
+        list(range(11, 15))
+    assert _ordered_checker(result, list(result))
+    with pytest.raises(ValueError):
+        result.union(BinarySearchTree.from_iterable(range(3)))
+    with pytest.raises(ValueError):
+        BinarySearchTree.join(BinarySearchTree(reverse=True),
+                              BinarySearchTree())
+
+
+@pytest.mark.parametrize('first, second', SET_CASES)
+def test_bst_insert_many(first, second):
+    """test a batch insert matches inserting one at a time, and keeps
+    existing data"""
+    from bst import BinarySearchTree
+    tree = BinarySearchTree()
+    for val in first:
+        tree[val] = 'old'
+    tree.insert_many(second + second[:5])
+    expected = sorted(set(first) | set(second))
+    assert list(tree) == expected
+    assert _full_checker(tree)
+    assert all(tree[val] == 'old' for val in first)
+
+
+def test_bst_insert_many_sorted_batches():
+    """test sorted batches into a large tree stay balanced"""
+    from bst import BinarySearchTree
+    tree = BinarySearchTree.from_sorted(range(0, 20000, 2))
+    for start in range(1, 20000, 2000):
+        tree.insert_many(range(start, start + 2000, 2))
+    assert list(tree) == list(range(20000))
+    assert _full_checker(tree)
+
+
+def test_bst_insert_many_leaves_snapshot_alone():
+    """test a batch insert after a snapshot doesn't change the snapshot"""
+    from bst import BinarySearchTree
+    tree = BinarySearchTree.from_sorted(range(0, 100, 2))
+    snap = tree.snapshot()
+    before = _shape(snap)
+    tree.insert_many(range(1, 100, 2))
+    assert _shape(snap) == before
+    assert list(tree) == list(range(100))
+
+
+def test_bst_insert_many_copies_only_touched_nodes():
+    """test a small batch after a snapshot copies few of the shared nodes
+    rather than the whole tree"""
+    from bst import BinarySearchTree
+    tree = BinarySearchTree.from_sorted(range(0, 2 ** 15, 2))
+    snap = tree.snapshot()
+    tree.insert_many([7, 5001, 20001])
+    old_nodes = set(id(node) for node in snap.root._in_order())
+    copied = [node for node in tree.root._in_order()
+              if id(node) not in old_nodes]
+    assert len(copied) <= 3 * 4 * tree.depth()
+    assert len(tree) == len(snap) + 3 and _full_checker(tree)
+
+
+def test_bst_insert_many_keeps_tombstones(tombstoned):
+    """test a batch revives the tombstones it hits, leaves the others, and
+    doesn't compact the tree"""
+    tree, remaining = tombstoned
+    tree.insert_many([3, 6, 500])
+    assert list(tree) == sorted(remaining + [3, 6, 500])
+    assert tree.tombstones == 65 and tree.root.size == 201
+    assert not tree.contains(9)
+    assert _shared_checker(tree)
+
+
+def test_bst_contains_many(full_bst):
+    """test batch lookups, in input order, with repeats and misses"""
+    tree = full_bst.bin_tree
+    sorted_list = full_bst.sorted_list
+    probes = sorted_list[::-2] + [sorted_list[-1] * 2] + sorted_list[:3]
+    expected = [val in sorted_list for val in probes]
+    assert tree.contains_many(probes) == expected
+    assert tree.contains_many([]) == []
+
+
+def test_bst_contains_many_dense_batch():
+    """test a dense sorted batch over a large tree, and an empty tree"""
+    from bst import BinarySearchTree
+    tree = BinarySearchTree.from_sorted(range(0, 3000, 3))
+    probes = list(range(-5, 3005))
+    assert tree.contains_many(probes) == \
+        [0 <= num < 3000 and num % 3 == 0 for num in probes]
+    assert BinarySearchTree().contains_many([1, 2]) == [False, False]
+
+
+def test_bst_batch_with_key_and_reverse():
+    """test the batch methods on keyed and reversed trees"""
+    from bst import BinarySearchTree
+    tree = BinarySearchTree(key=lambda val: val % 100, reverse=True)
+    tree.insert_many(range(100, 150))
+    tree.insert_many(range(140, 260))
+    assert list(tree) == list(range(199, 139, -1)) + \
+        list(range(139, 99, -1))
+    assert tree.contains_many([5, 1005, 150, 99]) == [True] * 4
+    if MIXED_TYPES_RAISE:
+        with pytest.raises(TypeError):
+            BinarySearchTree(5).insert_many([1, 'a'])
+
+
+@pytest.fixture
+def tombstoned():
+    '''Return a tree of 0..199 that never compacts by itself, with the
+    multiples of 3 lazily deleted, and the values left'''
+    from bst import BinarySearchTree
+    tree = BinarySearchTree.from_iterable(range(200))
+    tree.compact_ratio = 1
+    for num in random.sample(range(0, 200, 3), 67):
+        tree.lazy_delete(num)
+    return tree, [num for num in range(200) if num % 3]
+
+
+def test_bst_lazy_delete_keeps_shape(tombstoned):
+    """test lazy deletes only mark nodes, and reads skip them"""
+    from bst import BinarySearchTree
+    tree, remaining = tombstoned
+    assert tree.tombstones == 67 and len(tree) == len(remaining)
+    assert tree.root.size == 200
+    assert [node.val for node in tree.root._pre_order()] == \
+        list(BinarySearchTree.from_iterable(range(200)).pre_order())
+    assert list(tree) == remaining
+    assert list(reversed(tree)) == remaining[::-1]
+    assert list(tree.items()) == [(num, None) for num in remaining]
+    assert sorted(tree.pre_order()) == sorted(tree.breadth_first()) == \
+        remaining
+    assert not tree.contains(3) and 4 in tree
+    assert tree.get(3, 'gone') == 'gone'
+    assert tree.contains_many([3, 4, 6]) == [False, True, False]
+    assert list(tree.range(3, 9)) == [4, 5, 7, 8]
+    assert tree.floor(6) == 5 and tree.ceiling(6) == 7
+    assert tree.predecessor(7) == 5 and tree.successor(5) == 7
+
+
+def test_bst_lazy_delete_missing(tombstoned):
+    """test deleting a missing or already deleted value does nothing, but
+    del raises KeyError"""
+    tree, remaining = tombstoned
+    tree.lazy_delete(3)
+    tree.lazy_delete(1000)
+    tree.delete(6)
+    assert tree.tombstones == 67 and len(tree) == len(remaining)
+    with pytest.raises(KeyError):
+        del tree[9]
+
+
+def test_bst_lazy_delete_revive(tombstoned):
+    """test inserting a deleted value revives its node with new data"""
+    tree, remaining = tombstoned
+    tree.insert(3, 'back')
+    tree[6] = 'six'
+    assert tree[3] == 'back' and tree[6] == 'six'
+    assert tree.tombstones == 65 and len(tree) == len(remaining) + 2
+    assert tree.root.size == 200
+
+
+def test_bst_lazy_delete_compacts():
+    """test the tree compacts itself once tombstones pass compact_ratio"""
+    from bst import BinarySearchTree
+    tree = BinarySearchTree()
+    for num in range(1000):
+        tree.insert(num)
+    for num in range(500):
+        tree.lazy_delete(num)
+    assert tree.tombstones == 500 and tree.root.size == 1000
+    tree.lazy_delete(500)
+    assert tree.tombstones == 0
+    assert list(tree) == list(range(501, 1000))
+    assert _full_checker(tree)
+
+
+def test_bst_order_statistics_skip_tombstones(tombstoned):
+    """test rank, select, count_range and percentile count only live
+    values, without compacting or copying anything"""
+    tree, remaining = tombstoned
+    snap = tree.snapshot()
+    root = tree.root
+    for index, val in enumerate(remaining):
+        assert tree.select(index) == val and tree.rank(val) == index
+    assert tree.select(-1) == remaining[-1]
+    assert tree.rank(3) == tree.rank(4) == 2
+    assert tree.count_range(3, 9) == 4
+    assert tree.percentile(50) == remaining[(len(remaining) + 1) // 2 - 1]
+    assert tree.tombstones == 67 and tree.root is root
+    assert snap.root is root
+
+
+def test_bst_lazy_delete_then_rank_stays_lazy():
+    """test alternating lazy deletes and rank queries never compacts
+    below compact_ratio"""
+    from bst import BinarySearchTree
+    tree = BinarySearchTree.from_sorted(range(1000))
+    for num in range(0, 400):
+        tree.lazy_delete(num)
+        assert tree.rank(999) == 998 - num
+        assert tree.select(0) == num + 1
+    assert tree.tombstones == 400 and tree.root.size == 1000
+    assert tree.root.live == len(tree) == 600
+
+
+def test_bst_compact(tombstoned):
+    """test compacting on demand, and that split carries tombstones over
+    rather than compacting"""
+    tree, remaining = tombstoned
+    tree.compact()
+    assert tree.tombstones == 0 and _full_checker(tree)
+    assert list(tree) == remaining
+    for num in range(0, 200, 2):
+        tree.lazy_delete(num)
+    left, right = tree.split(100)
+    assert list(left) + list(right) == [num for num in remaining
+                                        if num % 2]
+    assert left.tombstones + right.tombstones == tree.tombstones
+    assert _shared_checker(left) and _shared_checker(right)
+
+
+def test_bst_pop_skips_tombstones(tombstoned):
+    """test pop_min and pop_max unlink tombstones at the ends"""
+    tree, remaining = tombstoned
+    tree.lazy_delete(1)
+    tree.lazy_delete(199)
+    assert tree.pop_min() == (2, None)
+    assert tree.pop_max() == (197, None)
+    assert list(tree) == remaining[2:-2]
+    assert tree.tombstones + len(tree) == tree.root.size
+
+
+def test_bst_lazy_delete_leaves_snapshot_alone(tombstoned):
+    """test lazy deletes and compaction after a snapshot don't change
+    it, and a snapshot of a tree with tombstones has the right length"""
+    tree, remaining = tombstoned
+    snap = tree.snapshot()
+    assert len(snap) == len(remaining)
+    for num in range(1, 100, 3):
+        tree.lazy_delete(num)
+    tree.compact()
+    assert list(snap) == remaining and len(snap) == len(remaining)
+    assert list(tree) == [num for num in remaining if num >= 100 or
+                          num % 3 != 1]
+
+
+def test_bst_tombstones_dump_and_pickle(tombstoned):
+    """test dumped and pickled trees with tombstones load with only the
+    live values, a shape dump keeping the tombstones in place"""
+    tree, remaining = tombstoned
+    copy = pickle.loads(pickle.dumps(tree))
+    assert list(copy) == remaining and not copy.contains(3)
+    copy.insert(3)
+    assert copy.tombstones == 66
+    loaded = _round_trip(tree)
+    assert list(loaded) == remaining and loaded.tombstones == 67
+    assert _shape(loaded) == _shape(tree)
+    assert loaded.select(1) == 2 and not loaded.contains(3)
+    loaded = _round_trip(tree, shape=False)
+    assert list(loaded) == remaining and loaded.tombstones == 0
+    assert tree.tombstones == 67
+
+
+def test_bst_neighbours_skip_tombstones():
+    """test floor, ceiling, predecessor and successor step past runs of
+    tombstones"""
+    from bst import BinarySearchTree
+    vals = random.sample(range(300), 150)
+    tree = BinarySearchTree()
+    tree.compact_ratio = 1
+    for val in vals:
+        tree.insert(val)
+    dead = set(random.sample(vals, 100))
+    for val in dead:
+        tree.lazy_delete(val)
+    live = sorted(set(vals) - dead)
+    for probe in range(-1, 301):
+        below = [val for val in live if val < probe]
+        above = [val for val in live if val > probe]
+        assert tree.predecessor(probe) == (below[-1] if below else None)
+        assert tree.successor(probe) == (above[0] if above else None)
+        assert tree.floor(probe) == (probe if probe in live else
+                                     tree.predecessor(probe))
+
+
+def _agg_checker(node, monoid):
+    """helper method that returns the summary of the subtree at node, or
+    raises AssertionError if a stored summary doesn't match it"""
+    from bst import _DELETED
+    if node is None:
+        return monoid.identity
+    agg = monoid.combine(_agg_checker(node._left, monoid),
+                         monoid.identity if node.data is _DELETED else
+                         monoid.lift(node.val, node.data))
+    agg = monoid.combine(agg, _agg_checker(node._right, monoid))
+    assert node.agg == agg
+    return agg
+
+
+def _in_bounds(val, low, high, inclusive):
+    """helper method that says whether val is between low and high"""
+    return ((low <= val if inclusive[0] else low < val) and
+            (val <= high if inclusive[1] else val < high))
+
+
+BOUNDS = [(True, True), (True, False), (False, True), (False, False)]
+
+
+@pytest.fixture
+def full_bst_sums():
+    '''Return a tree summing its values after random inserts, deletes,
+    lazy deletes and revives, and its values'''
+    from bst import BinarySearchTree, SUM
+    tree = BinarySearchTree(monoid=SUM)
+    vals = set(random.sample(range(500), 300))
+    for val in vals:
+        tree.insert(val)
+    tree.compact_ratio = 1
+    for val in random.sample(sorted(vals), 100):
+        tree.delete(val)
+        vals.remove(val)
+    for val in random.sample(sorted(vals), 50):
+        tree.lazy_delete(val)
+        vals.remove(val)
+    tree.insert(min(set(range(500)) - vals))
+    vals.add(min(set(range(500)) - vals))
+    _agg_checker(tree.root, SUM)
+    return tree, sorted(vals)
+
+
+def test_bst_aggregate_sums(full_bst_sums):
+    """test range sums against filtered lists, for each kind of bound"""
+    tree, vals = full_bst_sums
+    for _ in range(50):
+        low, high = sorted(random.sample(range(-10, 510), 2))
+        for inclusive in BOUNDS:
+            assert tree.aggregate(low, high, inclusive) == \
+                sum(val for val in vals if _in_bounds(val, low, high,
+                                                      inclusive))
+    assert tree.aggregate(600, 700) == 0
+    assert tree.aggregate(5, 1) == 0
+
+
+def test_bst_aggregate_monoids():
+    """test min, max, count and an order sensitive monoid over data"""
+    from bst import BinarySearchTree, Monoid, MIN, MAX, COUNT
+    import operator
+    vals = random.sample(range(1000), 400)
+    joined = Monoid('', operator.add, lambda val, data: data)
+    for monoid in (MIN, MAX, COUNT, joined):
+        tree = BinarySearchTree(monoid=monoid)
+        for val in vals:
+            tree[val] = '{},'.format(val)
+        _agg_checker(tree.root, monoid)
+        inside = sorted(val for val in vals if 100 <= val <= 600)
+        expected = {MIN: inside[0], MAX: inside[-1], COUNT: len(inside),
+                    joined: ''.join('{},'.format(val) for val in inside)}
+        assert tree.aggregate(100, 600) == expected[monoid]
+    assert tree.aggregate(2000, 3000) == ''
+    tree[inside[0]] = 'first,'
+    assert tree.aggregate(100, 600).startswith('first,')
+    _agg_checker(tree.root, joined)
+
+
+def test_bst_aggregate_reverse_and_key():
+    """test aggregates follow the tree's own order"""
+    from bst import BinarySearchTree, Monoid
+    import operator
+    joined = Monoid('', operator.add, lambda val, data: val)
+    tree = BinarySearchTree.from_iterable('abcdefg', reverse=True,
+                                          monoid=joined)
+    assert tree.aggregate('f', 'b') == 'fedcb'
+    assert tree.aggregate('f', 'b', (False, False)) == 'edc'
+    tree = BinarySearchTree(key=len, monoid=joined)
+    for word in ('ccc', 'a', 'dddd', 'bb'):
+        tree.insert(word)
+    assert tree.aggregate('x', 'xxx') == 'abbccc'
+
+
+def test_bst_aggregate_through_relinking():
+    """test summaries survive snapshots, split, union and dump/load"""
+    from bst import BinarySearchTree, SUM
+    tree = BinarySearchTree.from_sorted(range(100), monoid=SUM)
+    snap = tree.snapshot()
+    for num in range(0, 100, 2):
+        tree.delete(num)
+    assert snap.aggregate(0, 99) == sum(range(100))
+    assert tree.aggregate(0, 99) == sum(range(1, 100, 2))
+    _agg_checker(snap.root, SUM)
+    left, right = tree.split(50)
+    _agg_checker(left.root, SUM)
+    assert right.aggregate(0, 99) == sum(range(51, 100, 2))
+    other = BinarySearchTree.from_sorted(range(0, 200, 2), monoid=SUM)
+    merged = left.union(other)
+    _agg_checker(merged.root, SUM)
+    assert merged.aggregate(0, 49) == sum(range(50))
+    stream = io.BytesIO()
+    merged.dump(stream)
+    stream.seek(0)
+    loaded = BinarySearchTree.load(stream, monoid=SUM)
+    _agg_checker(loaded.root, SUM)
+
+
+def test_bst_aggregate_errors():
+    """test aggregate on a tree without a monoid, and mixing monoids, raise
+    ValueError"""
+    from bst import BinarySearchTree, SUM, COUNT
+    with pytest.raises(ValueError):
+        BinarySearchTree.from_sorted(range(5)).aggregate(1, 3)
+    with pytest.raises(ValueError):
+        BinarySearchTree(1, monoid=SUM).union(
+            BinarySearchTree(2, monoid=COUNT))
+    if MIXED_TYPES_RAISE:
+        with pytest.raises(TypeError):
+            BinarySearchTree(1, monoid=SUM).aggregate('a', 'b')
@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+"""File tests the BinarySearchTree instrumentation."""
+from __future__ import unicode_literals
+
+import math
+import pytest
+import random
+
+
+@pytest.fixture
+def counted_tree():
+    '''Return an instrumented tree of 1000 random ints and its stats'''
+    from bst import BinarySearchTree
+    tree = BinarySearchTree()
+    stats = tree.enable_stats(timing=True)
+    for num in random.sample(range(1000), 1000):
+        tree.insert(num)
+    return tree, stats
+
+
+def test_stats_off_by_default():
+    """test a plain tree has no stats and no instance wrappers"""
+    from bst import BinarySearchTree
+    tree = BinarySearchTree.from_sorted(range(10))
+    assert tree.stats is None
+    assert tree.disable_stats() is None
+    assert '_insert' not in tree.__dict__
+
+
+def test_stats_counts_inserts(counted_tree):
+    """test inserts are counted, with visits close to the height"""
+    tree, stats = counted_tree
+    assert tree.stats is stats
+    assert stats.operations['insert'] == 1000
+    assert sum(stats.visits['insert'].values()) == 1000
+    assert 1 < stats.mean_visits('insert') <= tree.depth()
+    assert stats.comparisons >= sum(visits * count for visits, count in
+                                    stats.visits['insert'].items())
+    assert stats.rotations > 0
+    assert sum(stats.timings['insert'].values()) == 1000
+    assert stats.max_height == tree.depth()
+    assert stats.heights[-1] == (1000, tree.depth())
+
+
+def test_stats_lookups_and_deletes(counted_tree):
+    """test lookups and deletes are counted, however they're called"""
+    tree, stats = counted_tree
+    assert tree.contains(500)
+    assert tree.get(-1) is None
+    assert stats.operations['lookup'] == 2
+    for num in range(0, 1000, 2):
+        tree.delete(num)
+    del tree[1]
+    assert stats.operations['delete'] == 501
+    assert stats.writes == 1501
+    assert list(tree)[:3] == [3, 5, 7]
+    assert stats.heights[-1][1] == tree.depth()
+
+
+def test_stats_sequential_inserts_stay_logarithmic():
+    """test the height ratio on a sequential workload stays in AVL
+    bounds"""
+    from bst import BinarySearchTree
+    tree = BinarySearchTree()
+    stats = tree.enable_stats(history=10)
+    for num in range(2000):
+        tree.insert(num)
+    assert len(stats.heights) == 10
+    assert stats.height_ratio(tree) < 1.45
+    assert stats.mean_visits('insert') <= 1.45 * math.log(2000, 2)
+
+
+def test_stats_keys_stay_plain():
+    """test nodes made while stats are on store plain keys, for keyed and
+    reversed trees"""
+    from bst import BinarySearchTree
+    from bst_stats import _Counted
+    nums = random.sample(range(200), 200)
+    for tree, expected in ((BinarySearchTree(), sorted(nums)),
+                           (BinarySearchTree(reverse=True),
+                            sorted(nums, reverse=True)),
+                           (BinarySearchTree(key=str), sorted(nums, key=str))):
+        tree.enable_stats()
+        for num in nums:
+            tree[num] = num
+        assert not any(type(node.key) is _Counted
+                       for node in tree.root._in_order())
+        assert list(tree) == expected
+        tree.disable_stats()
+        tree.insert(500)
+        assert tree.contains(500) and len(tree) == 201
+
+
+def test_stats_disable_restores_tree():
+    """test disabling stats leaves a tree that behaves like new"""
+    from bst import BinarySearchTree
+    tree = BinarySearchTree()
+    stats = tree.enable_stats()
+    tree.insert(1)
+    assert tree.disable_stats() is stats
+    assert tree.__dict__.get('_sort_key') is None
+    tree.insert(2)
+    assert stats.operations['insert'] == 1
+    assert set(tree.__dict__) == set(BinarySearchTree().__dict__)
+
+
+def test_stats_not_shared_with_derived_trees(counted_tree):
+    """test snapshots, copies and split results start without stats"""
+    tree, stats = counted_tree
+    snap = tree.snapshot()
+    copy = tree.copy()
+    assert snap.stats is None and copy.stats is None
+    copy.insert(5000)
+    assert stats.operations['insert'] == 1000
+    left, right = tree.split(500)
+    assert left.stats is None and right.stats is None
+    assert tree.stats is stats
+
+
+def test_stats_on_engines():
+    """test rotations are counted for the other balancing engines"""
+    from balanced_bst import ENGINES
+    for name in ('red-black', 'treap'):
+        tree = ENGINES[name]()
+        stats = tree.enable_stats()
+        for num in range(500):
+            tree.insert(num)
+        assert stats.rotations > 0
+        assert stats.summary()['operations']['insert'] == 500
+
+
+def test_stats_count_relinking_rotations():
+    """test rotations made while building set operation, split and batch
+    results are counted, and the results carry no stats"""
+    from bst import BinarySearchTree
+    tree = BinarySearchTree.from_sorted(range(0, 2000, 2))
+    stats = tree.enable_stats()
+    other = BinarySearchTree.from_sorted(range(1, 3000, 7))
+    result = tree.union(other)
+    after_union = stats.rotations
+    assert after_union > 0
+    assert result.stats is None
+    assert '_left_rotation' not in result.__dict__
+    left, right = result.split(1001)
+    result.insert_many(range(3001, 3200))
+    assert stats.rotations == after_union
+    tree.insert_many(range(3001, 3200))
+    assert stats.rotations > after_union
+    assert list(tree)[-1] == 3199
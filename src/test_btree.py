@@ -0,0 +1,192 @@
+# -*- coding: utf-8 -*-
+"""File tests the B+ tree."""
+from __future__ import unicode_literals
+
+import pytest
+import random
+import sys
+
+# py27 orders values of different types rather than raising TypeError
+MIXED_TYPES_RAISE = sys.version_info[0] > 2
+
+INT_CASES = [random.sample(range(-500, 500), random.randrange(2, 400))
+             for n in range(5)]
+ORDERS = [3, 4, 7, 64]
+
+
+def _btree_checker(tree, node=None, low=None, high=None):
+    """helper method that returns the number of levels below node, or -1
+    if keys are out of order or outside their separators, a node is over
+    or under full, or the leaves sit at different levels"""
+    from btree import _Leaf
+    if node is None:
+        node = tree.root
+    keys = node.keys
+    if keys != sorted(set(keys)) or len(keys) > tree.order:
+        return -1
+    if node is not tree.root and len(keys) < tree.order // 2:
+        return -1
+    if keys and ((low is not None and keys[0] < low) or
+                 (high is not None and keys[-1] >= high)):
+        return -1
+    if isinstance(node, _Leaf):
+        return 1 if len(node.data) == len(keys) else -1
+    if len(node.children) != len(keys) + 1:
+        return -1
+    bounds = [low] + keys + [high]
+    levels = set(_btree_checker(tree, child, bounds[i], bounds[i + 1])
+                 for i, child in enumerate(node.children))
+    if len(levels) != 1 or -1 in levels:
+        return -1
+    return levels.pop() + 1
+
+
+def _leaf_chain(tree):
+    """helper method that returns the values along the leaf links, both
+    ways"""
+    forward = list(tree)
+    backward = list(tree._scan_back(tree._end_leaf(True)))
+    return forward, backward[::-1]
+
+
+@pytest.fixture(scope='function', params=[(case, order) for case in INT_CASES
+                                          for order in ORDERS])
+def full_btree(request):
+    '''Return a full B+ tree and its sorted values for testing'''
+    from btree import BTree
+    sequence, order = request.param
+    tree = BTree(order=order)
+    for val in sequence:
+        tree[val] = -val
+    return tree, sorted(sequence)
+
+
+def test_btree_init_empty():
+    """test that an empty tree has no values and no depth"""
+    from btree import BTree
+    tree = BTree()
+    assert tree.size() == 0
+    assert tree.depth() == 0
+    assert not tree.contains(1)
+    assert list(tree) == []
+
+
+def test_btree_init_root():
+    """test that a tree initialized w/ val holds that val"""
+    from btree import BTree
+    tree = BTree(5, order=3)
+    assert tree.contains(5)
+    assert len(tree) == 1
+
+
+def test_btree_order_too_small():
+    """test an order below 3 raises ValueError"""
+    from btree import BTree
+    with pytest.raises(ValueError):
+        BTree(order=2)
+
+
+def test_btree_insert(full_btree):
+    """test inserts keep the tree valid and every leaf at one level"""
+    tree, sorted_list = full_btree
+    assert _btree_checker(tree) == tree.depth()
+    assert tree.size() == len(sorted_list)
+    assert list(tree.in_order()) == sorted_list
+    assert list(tree.in_order(reverse=True)) == sorted_list[::-1]
+    forward, backward = _leaf_chain(tree)
+    assert forward == backward == sorted_list
+
+
+def test_btree_contains_and_getitem(full_btree):
+    """test lookups for values in and out of the tree"""
+    tree, sorted_list = full_btree
+    assert all(tree.contains(val) for val in sorted_list)
+    assert all(tree[val] == -val for val in sorted_list)
+    assert 1000 not in tree
+    assert tree.get(1000, 'missing') == 'missing'
+    with pytest.raises(KeyError):
+        tree[1000]
+    assert list(tree.items()) == [(val, -val) for val in sorted_list]
+
+
+def test_btree_insert_duplicate():
+    """test insert ignores duplicates and __setitem__ replaces data"""
+    from btree import BTree
+    tree = BTree(order=3)
+    tree.insert(1, 'one')
+    tree.insert(1, 'uno')
+    assert tree[1] == 'one' and len(tree) == 1
+    tree[1] = 'uno'
+    assert tree[1] == 'uno' and len(tree) == 1
+
+
+@pytest.mark.skipif(not MIXED_TYPES_RAISE, reason='py27 orders mixed types')
+def test_btree_type_error():
+    """test mixing value types raises TypeError"""
+    from btree import BTree
+    tree = BTree(1)
+    with pytest.raises(TypeError):
+        tree.insert('one')
+    with pytest.raises(TypeError):
+        tree.contains('one')
+
+
+def test_btree_range(full_btree):
+    """test range scans against a filtered list, for each kind of bound"""
+    tree, sorted_list = full_btree
+    for _ in range(10):
+        low, high = sorted(random.sample(sorted_list, 2))
+        for inclusive in ((True, True), (True, False), (False, True),
+                          (False, False)):
+            expected = [val for val in sorted_list
+                        if (low <= val if inclusive[0] else low < val) and
+                        (val <= high if inclusive[1] else val < high)]
+            assert list(tree.range(low, high, inclusive)) == expected
+    assert list(tree.range(-1000, 1000)) == sorted_list
+    assert list(tree.range(600, 700)) == []
+
+
+def test_btree_delete(full_btree):
+    """test deleting every value in random order keeps the tree valid"""
+    tree, sorted_list = full_btree
+    remaining = list(sorted_list)
+    for val in random.sample(sorted_list, len(sorted_list)):
+        tree.delete(val)
+        remaining.remove(val)
+        assert _btree_checker(tree) > 0
+        assert tree.size() == len(remaining)
+        assert val not in tree
+    assert tree.depth() == 0
+    assert _leaf_chain(tree) == ([], [])
+
+
+def test_btree_delete_missing():
+    """test deleting a value that isn't there does nothing, but del
+    raises KeyError"""
+    from btree import BTree
+    tree = BTree(5)
+    assert tree.delete(7) is None
+    assert tree.size() == 1
+    with pytest.raises(KeyError):
+        del tree[7]
+    del tree[5]
+    assert tree.size() == 0
+
+
+def test_btree_shallower_than_bst():
+    """test a wide B+ tree is several times shallower than the BST"""
+    from btree import BTree
+    from bst import BinarySearchTree
+    keys = random.sample(range(100000), 20000)
+    tree = BTree(order=128)
+    for key in keys:
+        tree.insert(key)
+    assert tree.depth() * 4 <= BinarySearchTree.from_iterable(keys).depth()
+    assert _btree_checker(tree) == tree.depth()
+
+
+def test_btree_empty_in_order():
+    """test in order traversal of an empty tree raises IndexError"""
+    from btree import BTree
+    with pytest.raises(IndexError):
+        BTree().in_order()
@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+"""File tests the compact, insertion ordered hash table."""
+from __future__ import unicode_literals
+
+from collections import OrderedDict
+import pytest
+import random
+
+WORDS = ['word{}'.format(num) for num in range(3000)]
+
+
+def _index_checker(table):
+    """helper method that returns True if every live entry is pointed at by
+    exactly one index slot, reachable from its hash without passing an
+    empty slot"""
+    from compact_hash_table import EMPTY, PERTURB_SHIFT, _DELETED
+    mask = table.size - 1
+    pointed = sorted(entry for entry in table._index if entry >= 0)
+    live = [entry for entry, key in enumerate(table._keys)
+            if key is not _DELETED]
+    if pointed != live or len(live) != len(table):
+        return False
+    for entry in live:
+        perturb = table._hashes[entry]
+        slot = perturb & mask
+        while table._index[slot] != entry:
+            if table._index[slot] == EMPTY:
+                return False
+            perturb >>= PERTURB_SHIFT
+            slot = (slot * 5 + perturb + 1) & mask
+    return True
+
+
+def test_compact_init():
+    """test the slot count rounds up to a power of two, and the index uses
+    the smallest int type that fits it"""
+    from compact_hash_table import CompactHashTable
+    assert CompactHashTable(1000).size == 1024
+    assert CompactHashTable(1).size == 2
+    assert len(CompactHashTable()) == 0
+    assert CompactHashTable(128)._index.typecode == 'b'
+    assert CompactHashTable(256)._index.typecode == 'h'
+    assert CompactHashTable(1 << 16)._index.typecode == 'i'
+
+
+def test_compact_bad_arguments():
+    """test a load factor of 1 or more, or an unknown hash function, is
+    refused"""
+    from compact_hash_table import CompactHashTable
+    with pytest.raises(ValueError):
+        CompactHashTable(load_factor=1)
+    with pytest.raises(TypeError):
+        CompactHashTable(hash_func='md5')
+
+
+@pytest.mark.parametrize('hash_func', ['simple_hash', 'bp_hash', 'fnv1a_hash',
+                                       'sip_hash', 'builtin_hash'])
+def test_compact_set_and_get(hash_func):
+    """test every key can be found as the table grows, for every hash
+    function, and keys come back in the order they were set"""
+    from compact_hash_table import CompactHashTable
+    table = CompactHashTable(8, hash_func)
+    for word in WORDS:
+        table.set(word, word.upper())
+    assert len(table) == len(WORDS)
+    assert len(table) <= table.size * table.load_factor
+    assert table._index.typecode == 'h'
+    assert all(table.get(word) == word.upper() for word in WORDS)
+    assert list(table) == WORDS
+    assert _index_checker(table)
+
+
+def test_compact_replace_and_missing():
+    """test setting a key twice replaces its value in place, and missing
+    or non string keys raise KeyError"""
+    from compact_hash_table import CompactHashTable
+    table = CompactHashTable()
+    table.set('key', 1)
+    table.set('other', 3)
+    table.set('key', 2)
+    assert list(table.items()) == [('key', 2), ('other', 3)]
+    with pytest.raises(KeyError):
+        table.get('missing')
+    with pytest.raises(KeyError):
+        table.delete('missing')
+    with pytest.raises(KeyError):
+        table.set(1, 2)
+
+
+def test_compact_matches_dict():
+    """test random sets and deletes against a dict, order included"""
+    from compact_hash_table import CompactHashTable
+    table = CompactHashTable(64, 'fnv1a_hash', seed=1)
+    expected = OrderedDict()
+    for _ in range(5000):
+        word = random.choice(WORDS[:500])
+        if word in expected and random.random() < 0.5:
+            table.delete(word)
+            del expected[word]
+        else:
+            expected[word] = random.random()
+            table.set(word, expected[word])
+    assert _index_checker(table)
+    assert len(table) == len(expected)
+    assert list(table.items()) == list(expected.items())
+
+
+def test_compact_churn_stays_compact():
+    """test deleting and setting keys without growing squeezes the deleted
+    entries out rather than letting the dense arrays grow"""
+    from compact_hash_table import CompactHashTable
+    table = CompactHashTable(64)
+    for word in WORDS[:20]:
+        table.set(word, word)
+    for num, word in enumerate(WORDS):
+        table.delete(WORDS[num % 20])
+        table.set(WORDS[num % 20], word)
+    assert table.size == 64 and len(table) == 20
+    assert list(table.items())[-1] == (WORDS[19], WORDS[-1])
+    assert len(table._keys) <= table.size * table.load_factor
+    assert _index_checker(table)
+
+
+def test_compact_shrink_and_reserve():
+    """test deletes shrink the table down to its reserved size"""
+    from compact_hash_table import CompactHashTable
+    table = CompactHashTable(16)
+    table.reserve(1000)
+    size = table.size
+    assert size >= 1000 / table.load_factor
+    for word in WORDS:
+        table.set(word, word)
+    for word in WORDS[10:]:
+        table.delete(word)
+    assert table.size == size
+    assert list(table.items()) == [(word, word) for word in WORDS[:10]]
+    assert _index_checker(table)
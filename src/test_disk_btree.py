@@ -0,0 +1,238 @@
+# -*- coding: utf-8 -*-
+"""File tests the disk resident B+ tree."""
+from __future__ import unicode_literals
+
+import os
+import pytest
+import random
+import shutil
+
+INT_CASES = [random.sample(range(-500, 500), random.randrange(2, 400))
+             for n in range(4)]
+
+
+def _disk_btree_checker(tree, number=None, low=None, high=None):
+    """helper method that returns the number of levels below page number,
+    or -1 if keys are out of order or outside their separators, a page is
+    over or under full, or the leaves sit at different levels"""
+    if number is None:
+        number = tree.root
+    page = tree._read(number)
+    keys = page.keys
+    if keys != sorted(set(keys)) or len(keys) > tree.order:
+        return -1
+    if number != tree.root and len(keys) < tree.order // 2:
+        return -1
+    if keys and ((low is not None and keys[0] < low) or
+                 (high is not None and keys[-1] >= high)):
+        return -1
+    if page.leaf:
+        return 1 if len(page.values) == len(keys) else -1
+    if len(page.values) != len(keys) + 1:
+        return -1
+    bounds = [low] + keys + [high]
+    levels = set(_disk_btree_checker(tree, child, bounds[i], bounds[i + 1])
+                 for i, child in enumerate(list(page.values)))
+    if len(levels) != 1 or -1 in levels:
+        return -1
+    return levels.pop() + 1
+
+
+@pytest.fixture
+def path(tmpdir):
+    '''Return a path for an index file in a fresh directory'''
+    return str(tmpdir.join('index'))
+
+
+@pytest.fixture(scope='function', params=INT_CASES)
+def full_disk_btree(request, path):
+    '''Return a full disk B+ tree with small pages and a tiny cache, and
+    its sorted values'''
+    from disk_btree import DiskBTree
+    tree = DiskBTree(path, order=4, cache_pages=3)
+    for val in request.param:
+        tree[val] = val * 2
+    yield tree, sorted(request.param)
+    tree.close()
+
+
+def test_disk_btree_init_empty(path):
+    """test a new index is empty and creates its file"""
+    from disk_btree import DiskBTree
+    with DiskBTree(path) as tree:
+        assert tree.size() == 0
+        assert tree.depth() == 0
+        assert not tree.contains(1)
+        assert list(tree) == []
+    assert os.path.exists(path)
+
+
+def test_disk_btree_bad_arguments(path):
+    """test a bad typecode or order raises ValueError"""
+    from disk_btree import DiskBTree
+    with pytest.raises(ValueError):
+        DiskBTree(path, typecode='s')
+    with pytest.raises(ValueError):
+        DiskBTree(path, order=2)
+    with pytest.raises(ValueError):
+        DiskBTree(path, order=100000)
+
+
+def test_disk_btree_not_an_index(path):
+    """test opening a file that isn't an index raises ValueError"""
+    from disk_btree import DiskBTree
+    with open(path, 'wb') as fileobj:
+        fileobj.write(b'not an index' * 1000)
+    with pytest.raises(ValueError):
+        DiskBTree(path)
+
+
+def test_disk_btree_insert(full_disk_btree):
+    """test inserts through a tiny cache keep the tree valid"""
+    tree, sorted_list = full_disk_btree
+    assert _disk_btree_checker(tree) == tree.depth()
+    assert tree.size() == len(sorted_list)
+    assert list(tree.in_order()) == sorted_list
+    assert list(tree.in_order(reverse=True)) == sorted_list[::-1]
+    assert list(tree.items()) == [(val, val * 2) for val in sorted_list]
+    assert all(tree[val] == val * 2 for val in sorted_list)
+    assert len(tree._cache) <= tree.cache_pages
+
+
+def test_disk_btree_range(full_disk_btree):
+    """test range scans against a filtered list"""
+    tree, sorted_list = full_disk_btree
+    for _ in range(10):
+        low, high = sorted(random.sample(sorted_list, 2))
+        assert list(tree.range(low, high)) == \
+            [val for val in sorted_list if low <= val <= high]
+        assert list(tree.range(low, high, (False, False))) == \
+            [val for val in sorted_list if low < val < high]
+
+
+def test_disk_btree_delete(full_disk_btree):
+    """test deleting every value keeps the tree valid and frees pages for
+    reuse"""
+    tree, sorted_list = full_disk_btree
+    remaining = list(sorted_list)
+    for val in random.sample(sorted_list, len(sorted_list)):
+        tree.delete(val)
+        remaining.remove(val)
+        assert _disk_btree_checker(tree) > 0
+        assert val not in tree
+    assert tree.size() == 0
+    pages = tree._pages
+    for val in sorted_list[:len(sorted_list) // 2]:
+        tree.insert(val)
+    assert tree._pages == pages
+    assert list(tree) == sorted_list[:len(sorted_list) // 2]
+
+
+def test_disk_btree_type_error(path):
+    """test non numeric values raise TypeError"""
+    from disk_btree import DiskBTree
+    with DiskBTree(path) as tree:
+        with pytest.raises(TypeError):
+            tree.insert('one')
+        with pytest.raises(TypeError):
+            tree.insert(1.5)
+        with pytest.raises(TypeError):
+            tree.insert(1, 'data')
+
+
+def test_disk_btree_reopen(path):
+    """test a closed index opens with everything in it"""
+    from disk_btree import DiskBTree
+    keys = random.sample(range(10000), 3000)
+    with DiskBTree(path, order=8, cache_pages=4) as tree:
+        for key in keys:
+            tree.insert(key, -key)
+        for key in keys[:1000]:
+            tree.delete(key)
+    with DiskBTree(path, typecode='d') as tree:
+        assert tree.typecode == 'q' and tree.order == 8
+        assert list(tree) == sorted(keys[1000:])
+        assert tree[keys[-1]] == -keys[-1]
+        assert _disk_btree_checker(tree) == tree.depth()
+
+
+def test_disk_btree_float_keys(path):
+    """test an index of float keys"""
+    from disk_btree import DiskBTree
+    with DiskBTree(path, typecode='d', order=5) as tree:
+        for num in range(100):
+            tree.insert(num / 4.0)
+    with DiskBTree(path) as tree:
+        assert list(tree.range(1.0, 2.0)) == [1.0, 1.25, 1.5, 1.75, 2.0]
+
+
+def test_disk_btree_crash_rolls_back(path, tmpdir):
+    """test an index copied mid write, as a crash would leave it, opens
+    as of the last flush"""
+    from disk_btree import DiskBTree
+    tree = DiskBTree(path, order=4, cache_pages=2)
+    for num in range(100):
+        tree.insert(num)
+    tree.flush()
+    for num in range(100, 300):
+        tree.insert(num)
+    for num in range(0, 100, 3):
+        tree.delete(num)
+    assert os.path.exists(tree.journal_path)
+    crashed = str(tmpdir.join('crashed'))
+    shutil.copy(path, crashed)
+    shutil.copy(tree.journal_path, crashed + '-journal')
+    tree.close()
+    with DiskBTree(crashed) as recovered:
+        assert list(recovered) == list(range(100))
+        assert _disk_btree_checker(recovered) == recovered.depth()
+    assert not os.path.exists(crashed + '-journal')
+    with DiskBTree(path) as tree:
+        assert list(tree) == [num for num in range(300) if
+                              num >= 100 or num % 3]
+
+
+def test_disk_btree_torn_journal(path, tmpdir):
+    """test a journal record cut short by a crash is ignored"""
+    from disk_btree import DiskBTree
+    tree = DiskBTree(path, order=4, cache_pages=2)
+    for num in range(50):
+        tree.insert(num)
+    tree.flush()
+    for num in range(50, 150):
+        tree.insert(num)
+    crashed = str(tmpdir.join('crashed'))
+    shutil.copy(path, crashed)
+    with open(tree.journal_path, 'rb') as journal:
+        data = journal.read()
+    with open(crashed + '-journal', 'wb') as journal:
+        journal.write(data + data[-100:])
+    tree.close()
+    with DiskBTree(crashed) as recovered:
+        assert list(recovered) == list(range(50))
+
+
+@pytest.mark.parametrize('count', [0, 1, 4, 5, 6, 17, 1000])
+def test_disk_btree_bulk_load(path, count):
+    """test bulk loaded indexes are valid for awkward sizes"""
+    from disk_btree import DiskBTree
+    items = [(num * 2, num) for num in range(count)]
+    with DiskBTree.bulk_load(path, iter(items), order=4) as tree:
+        assert tree.size() == count
+        assert list(tree.items()) == items
+        assert list(tree._scan_back(tree._end_leaf(True))) == \
+            [num * 2 for num in reversed(range(count))]
+        assert _disk_btree_checker(tree) == max(tree.depth(), 1)
+        tree.insert(1)
+        assert _disk_btree_checker(tree) > 0
+    with DiskBTree(path) as tree:
+        assert len(tree) == count + 1
+
+
+def test_disk_btree_bulk_load_unsorted(path):
+    """test bulk loading out of order values raises ValueError and leaves
+    no file"""
+    from disk_btree import DiskBTree
+    with pytest.raises(ValueError):
+        DiskBTree.bulk_load(path, [(2, 0), (1, 0)])
+    assert not os.path.exists(path)
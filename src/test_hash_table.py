@@ -1,9 +1,12 @@
 # -*- coding utf-8 -*-
 
+import itertools
 import pytest
 from hash_table import simple_hash, bp_hash, HashTable
+from hash_table import fnv1a_hash, sip_hash, builtin_hash
 
-HASH_FUNCTIONS = [simple_hash, bp_hash]
+HASH_FUNCTIONS = [simple_hash, bp_hash, fnv1a_hash, sip_hash, builtin_hash]
+NEW_HASH_FUNCTIONS = [fnv1a_hash, sip_hash, builtin_hash]
 
 
 @pytest.mark.parametrize('hash_func', HASH_FUNCTIONS)
@@ -33,9 +36,9 @@ def test_hash_table_init_hash_method_error():
 
 
 def test_hash_table_hash_method():
-    """Test to ensure hash table intializes with simple_hash function"""
+    """Test to ensure hash table intializes with fnv1a_hash function"""
     ht = HashTable(1024)
-    assert ht.hash_func == simple_hash
+    assert ht.hash_func == fnv1a_hash
 
 
 def test_hash_table_set_error():
@@ -45,6 +48,180 @@ def test_hash_table_set_error():
         ht.set(1, 2)
 
 
+WORDS = ['word{}'.format(num) for num in range(2000)]
+
+
+@pytest.mark.parametrize('hash_func', ['simple_hash', 'bp_hash', 'fnv1a_hash',
+                                       'sip_hash', 'builtin_hash'])
+def test_hash_table_grows(hash_func):
+    """Test the table doubles its buckets as keys are set, and keeps every
+    key."""
+    ht = HashTable(8, hash_func)
+    for word in WORDS:
+        ht.set(word, word.upper())
+    assert len(ht) == len(WORDS)
+    assert ht.size == 4096
+    assert len(ht) <= ht.size * ht.load_factor
+    assert all(ht.get(word) == word.upper() for word in WORDS)
+
+
+def test_hash_table_set_replaces():
+    """Test setting a key twice replaces its value."""
+    ht = HashTable(8)
+    ht.set('key', 1)
+    ht.set('key', 2)
+    assert ht.get('key') == 2
+    assert len(ht) == 1
+
+
+def test_hash_table_get_missing():
+    """Test getting a key that isn't there raises KeyError."""
+    ht = HashTable(8)
+    with pytest.raises(KeyError):
+        ht.get('missing')
+    with pytest.raises(KeyError):
+        HashTable(8, 'bp_hash').get(1)
+
+
+def test_hash_table_delete_shrinks():
+    """Test deleting keys shrinks the table, but not below its first
+    size."""
+    ht = HashTable(64, load_factor=1)
+    for word in WORDS:
+        ht.set(word, word)
+    for word in WORDS[:1990]:
+        ht.delete(word)
+    assert ht.size == 64
+    assert len(ht) == 10
+    assert all(ht.get(word) == word for word in WORDS[1990:])
+    with pytest.raises(KeyError):
+        ht.delete(WORDS[0])
+
+
+def test_hash_table_reserve():
+    """Test reserving room sizes the table once and keeps it that big."""
+    ht = HashTable(8)
+    ht.set('kept', 1)
+    ht.reserve(1000)
+    assert ht.size == 2048
+    for word in WORDS[:1000]:
+        ht.set(word, word)
+    assert ht.size == 2048
+    for word in WORDS[:1000]:
+        ht.delete(word)
+    assert ht.size == 2048
+    assert ht.get('kept') == 1
+
+
+def test_hash_table_size_error():
+    """Test a table with no buckets raises ValueError rather than hanging
+    in reserve."""
+    with pytest.raises(ValueError):
+        HashTable(0)
+
+
+def test_hash_table_load_factor_error():
+    """Test a load factor that isn't positive raises ValueError."""
+    with pytest.raises(ValueError):
+        HashTable(8, load_factor=0)
+
+
+def test_hash_table_incremental_rehash():
+    """Test an incremental table moves a few buckets per call, and finds
+    every key while it's part way through."""
+    ht = HashTable(64, 'bp_hash', rehash_step=4)
+    for word in WORDS[:48]:
+        ht.set(word, word)
+    assert ht._old_buckets is None
+    ht.set(WORDS[48], WORDS[48])
+    assert ht.size == 128 and ht._old_buckets is not None
+    moved = ht._next_bucket
+    assert ht.get(WORDS[0]) == WORDS[0]
+    assert ht._next_bucket == moved + 4
+    for word in WORDS[49:60]:
+        ht.set(word, word)
+        assert all(ht.get(key) == key for key in WORDS[:49])
+    ht.delete(WORDS[1])
+    with pytest.raises(KeyError):
+        ht.get(WORDS[1])
+    while ht._old_buckets is not None:
+        ht.get(WORDS[0])
+    assert len(ht) == 59
+    assert all(ht.get(word) == word for word in WORDS[:60] if
+               word != WORDS[1])
+
+
+@pytest.mark.parametrize('step', [1, 11])
+def test_hash_table_incremental_grow_and_shrink(step):
+    """Test an incremental table through growth and shrinking, where a
+    small step has to finish one rehash before starting the next."""
+    ht = HashTable(8, rehash_step=step)
+    for word in WORDS:
+        ht.set(word, word)
+    assert ht.size == 4096
+    for word in WORDS[:1900]:
+        ht.delete(word)
+    assert len(ht) == 100
+    assert all(ht.get(word) == word for word in WORDS[1900:])
+    ht.reserve(5000)
+    assert all(ht.get(word) == word for word in WORDS[1900:])
+
+
+def test_hash_table_rehash_step_error():
+    """Test a rehash_step below 1 raises ValueError."""
+    with pytest.raises(ValueError):
+        HashTable(8, rehash_step=0)
+
+
+@pytest.mark.parametrize('hash_func', NEW_HASH_FUNCTIONS)
+def test_hash_func_bytes_like(hash_func):
+    """Test the new hash functions give str keys and their UTF-8 bytes,
+    bytearray and memoryview the same hash, below size."""
+    results = set(hash_func(key, 1 << 64) for key in
+                  (b'caf\xc3\xa9', bytearray(b'caf\xc3\xa9'),
+                   memoryview(b'caf\xc3\xa9')))
+    assert len(results) == 1
+    if hash_func is not builtin_hash:
+        assert hash_func(u'caf\xe9', 1 << 64) in results
+    assert 0 <= hash_func('caf\xe9', 7) < 7
+
+
+@pytest.mark.parametrize('hash_func', NEW_HASH_FUNCTIONS)
+def test_hash_func_spreads_keys(hash_func):
+    """Test anagrams and short numbered keys spread evenly, where
+    simple_hash piles them up."""
+    keys = ['word{}'.format(num) for num in range(10000)]
+    keys += [''.join(letters) for letters in itertools.permutations('abcdef')]
+    counts = [0] * 1024
+    for key in keys:
+        counts[hash_func(key, 1024)] += 1
+    assert max(counts) < 35
+    simple = [0] * 1024
+    for key in keys:
+        simple[simple_hash(key, 1024) % 1024] += 1
+    assert max(simple) > 500
+
+
+def test_sip_hash_reference():
+    """Test sip_hash against the SipHash-2-4 paper's test vector."""
+    seed = 0x0f0e0d0c0b0a09080706050403020100
+    assert sip_hash(bytes(bytearray(range(15))), 1 << 64, seed) == \
+        0xa129ca6149be45e5
+
+
+def test_hash_table_seeds():
+    """Test seeded hash functions follow the table's seed."""
+    tables = [HashTable(1024, name, seed=seed) for name in
+              ('sip_hash', 'builtin_hash') for seed in (1, 1, 2)]
+    for table in tables:
+        table.set('key', 1)
+    for first, second, third in (tables[:3], tables[3:]):
+        assert first._hash('key', 1 << 30) == second._hash('key', 1 << 30)
+        assert first._hash('key', 1 << 30) != third._hash('key', 1 << 30)
+        assert first.get('key') == 1
+    assert HashTable(8, 'sip_hash').seed != HashTable(8, 'sip_hash').seed
+
+
 # @pytest.mark.parametrize('hash_func', HASH_FUNCTIONS)
 # def test_hash_word_list():
 #     """
@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+"""File tests the Robin Hood hash table."""
+from __future__ import unicode_literals
+
+import pytest
+import random
+
+WORDS = ['word{}'.format(num) for num in range(3000)]
+
+
+def _robin_hood_checker(table):
+    """helper method that returns True if every entry is in its probe
+    sequence with no gap before it, and no entry is further from home than
+    the one after it could be without being displaced by it"""
+    from robin_hood import _EMPTY
+    mask = table.size - 1
+    entries = 0
+    for index, key in enumerate(table._keys):
+        if key is _EMPTY:
+            continue
+        entries += 1
+        distance = (index - (table._hashes[index] >> table._shift)) & mask
+        before = (index - 1) & mask
+        if distance and table._keys[before] is _EMPTY:
+            return False
+        if distance and (before - (table._hashes[before] >>
+                                   table._shift)) & mask < distance - 1:
+            return False
+    return entries == len(table)
+
+
+def test_robin_hood_init():
+    """test the slot count rounds up to a power of two"""
+    from robin_hood import RobinHoodHashTable
+    assert RobinHoodHashTable(1000).size == 1024
+    assert RobinHoodHashTable(1).size == 2
+    assert len(RobinHoodHashTable()) == 0
+
+
+def test_robin_hood_bad_arguments():
+    """test a load factor of 1 or more, or an unknown hash function, is
+    refused"""
+    from robin_hood import RobinHoodHashTable
+    with pytest.raises(ValueError):
+        RobinHoodHashTable(load_factor=1)
+    with pytest.raises(TypeError):
+        RobinHoodHashTable(hash_func='md5')
+
+
+@pytest.mark.parametrize('hash_func', ['simple_hash', 'bp_hash', 'fnv1a_hash',
+                                       'sip_hash', 'builtin_hash'])
+def test_robin_hood_set_and_get(hash_func):
+    """test every key can be found as the table grows, for every hash
+    function"""
+    from robin_hood import RobinHoodHashTable
+    table = RobinHoodHashTable(8, hash_func)
+    for word in WORDS:
+        table.set(word, word.upper())
+    assert len(table) == len(WORDS)
+    assert len(table) <= table.size * table.load_factor
+    assert all(table.get(word) == word.upper() for word in WORDS)
+    assert _robin_hood_checker(table)
+
+
+def test_robin_hood_replace_and_missing():
+    """test setting a key twice replaces its value, and missing or non
+    string keys raise KeyError"""
+    from robin_hood import RobinHoodHashTable
+    table = RobinHoodHashTable()
+    table.set('key', 1)
+    table.set('key', 2)
+    assert table.get('key') == 2 and len(table) == 1
+    with pytest.raises(KeyError):
+        table.get('missing')
+    with pytest.raises(KeyError):
+        table.delete('missing')
+    with pytest.raises(KeyError):
+        table.set(1, 2)
+
+
+def test_robin_hood_matches_dict():
+    """test random sets and deletes against a dict, with backward shift
+    deletion keeping the probe sequences whole"""
+    from robin_hood import RobinHoodHashTable
+    table = RobinHoodHashTable(64, 'fnv1a_hash', seed=1)
+    expected = {}
+    for _ in range(5000):
+        word = random.choice(WORDS[:500])
+        if word in expected and random.random() < 0.5:
+            table.delete(word)
+            del expected[word]
+        else:
+            expected[word] = random.random()
+            table.set(word, expected[word])
+    assert _robin_hood_checker(table)
+    assert len(table) == len(expected)
+    assert all(table.get(word) == val for word, val in expected.items())
+
+
+def test_robin_hood_shrink_and_reserve():
+    """test deletes shrink the table down to its reserved size"""
+    from robin_hood import RobinHoodHashTable
+    table = RobinHoodHashTable(16)
+    table.reserve(1000)
+    assert table.size == 2048
+    for word in WORDS:
+        table.set(word, word)
+    for word in WORDS[10:]:
+        table.delete(word)
+    assert table.size == 2048
+    assert all(table.get(word) == word for word in WORDS[:10])
+    assert _robin_hood_checker(table)
+
+
+def test_robin_hood_probe_lengths():
+    """test probes stay short even at a high load factor"""
+    from robin_hood import RobinHoodHashTable
+    table = RobinHoodHashTable(4096, load_factor=0.95)
+    for word in WORDS:
+        table.set(word, word)
+    lengths = table.probe_lengths()
+    assert sum(lengths.values()) == len(WORDS)
+    assert max(lengths) < 20